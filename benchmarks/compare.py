@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Compares two benchmark result files of end_to_end.py or micro.py and flags
+regressions:
+
+    python benchmarks/compare.py baseline.json current.json --tolerance 0.15
+
+Metrics ending in _s, _ms, _us or _mb (times, memory) regress if they grow by
+more than the tolerance, metrics ending in _per_s (throughput) if they shrink
+by more than it. The script exits with 1 if anything regressed.
+"""
+
+import argparse
+import json
+import sys
+
+LOWER_IS_BETTER = ('_s', '_ms', '_us', '_mb')
+HIGHER_IS_BETTER = ('_per_s',)
+# Inputs of a run, not results
+IGNORED = ('rss_before_mb',)
+
+
+def direction(metric):
+    """
+    :returns: 1 if higher is better, -1 if lower is better, 0 for other values
+    :rtype: int
+    """
+    if metric in IGNORED:
+        return 0
+    if metric.endswith(HIGHER_IS_BETTER):
+        return 1
+    if metric.endswith(LOWER_IS_BETTER):
+        return -1
+
+    return 0
+
+
+def compare(baseline, current, tolerance, rss_tolerance):
+    """
+    :param baseline: "results" of the baseline
+    :type baseline: dict
+
+    :param current: "results" of the current run
+    :type current: dict
+
+    :returns: one line per compared metric and whether it regressed
+    :rtype: list of tuple of str and bool
+    """
+    lines = []
+    for name in sorted(set(baseline) & set(current)):
+        for metric, value in sorted(current[name].items()):
+            before = baseline[name].get(metric)
+            sign = direction(metric)
+            if not sign or not isinstance(value, (int, float)) or not before:
+                continue
+            change = (value - before) / before
+            allowed = rss_tolerance if metric.endswith('_mb') else tolerance
+            regressed = -sign * change > allowed
+            lines.append(("{:<40} {:<16} {:>12.4g} -> {:>12.4g} {:>+7.1f}%".format(
+                name, metric, before, value, 100 * change
+            ), regressed))
+
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline', help='JSON results to compare with')
+    parser.add_argument('current', help='JSON results of the current code')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed slowdown, 0.15 = 15%%')
+    parser.add_argument('--rss-tolerance', type=float, default=0.2, help='allowed memory growth')
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    if baseline.get('meta') != current.get('meta'):
+        print("Warning: the runs used different settings:\n  {}\n  {}".format(baseline.get('meta'), current.get('meta')))
+
+    lines = compare(baseline['results'], current['results'], args.tolerance, args.rss_tolerance)
+    for line, regressed in lines:
+        print(("REGRESSION " if regressed else "           ") + line)
+    missing = sorted(set(baseline['results']) - set(current['results']))
+    if missing:
+        print("Not in the current results: " + ", ".join(missing))
+
+    if any(regressed for _, regressed in lines):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Runs the processing algorithms end to end in headless QGIS against the local
+mock server (mock_server.py) and records wall time, requests/s, features/s
+and peak RSS per algorithm and input size. Run it with the Python interpreter
+of the QGIS installation, from the repository root:
+
+    python benchmarks/end_to_end.py --output e2e.json
+    python benchmarks/end_to_end.py --sizes 100,1000 --latency-ms 30 --concurrency 4 --output e2e_c4.json
+    python benchmarks/compare.py e2e.json e2e_new.json
+
+Every algorithm and size runs in a fresh interpreter, so the peak RSS is the
+run's own. The plugin reads a temporary config.yml with the mock server as
+only provider, passed with VALHALLA_QGIS_CONFIG.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import mock_server
+import payloads
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULT_MARKER = 'BENCHMARK_RESULT '
+
+# Input features are spread over Berlin
+BBOX = (13.2, 52.4, 13.6, 52.6)
+
+ALGORITHMS = {
+    'directions_lines': 'Valhalla:directions_from_polylines_auto',
+    'directions_point_layer': 'Valhalla:directions_from_point_layer_auto',
+    'directions_points_layers': 'Valhalla:directions_from_points_2_layers_auto',
+    'isochrones': 'Valhalla:isochrones_auto',
+    'matrix': 'Valhalla:matrix_auto',
+}
+
+
+def peak_rss_mb():
+    """
+    :returns: peak resident set size of this process in MB, None if unknown
+    :rtype: float
+    """
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return psutil.Process().memory_info().peak_wset / 1024 ** 2
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kB everywhere else
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def _points(count, seed):
+    rng = random.Random(seed)
+    xmin, ymin, xmax, ymax = BBOX
+    return [(rng.uniform(xmin, xmax), rng.uniform(ymin, ymax)) for _ in range(count)]
+
+
+def _layer(geometry_type, features):
+    from qgis.core import QgsFeature, QgsGeometry, QgsVectorLayer
+
+    layer = QgsVectorLayer("{}?crs=EPSG:4326&field=id:integer".format(geometry_type), 'input', 'memory')
+    feats = []
+    for i, wkt in enumerate(features):
+        feat = QgsFeature(layer.fields())
+        feat.setGeometry(QgsGeometry.fromWkt(wkt))
+        feat.setAttributes([i])
+        feats.append(feat)
+    layer.dataProvider().addFeatures(feats)
+
+    return layer
+
+
+def _point_layer(count, seed):
+    return _layer('Point', ['POINT({} {})'.format(x, y) for x, y in _points(count, seed)])
+
+
+def build_parameters(name, size, concurrency):
+    """
+    Builds the input layers and parameters of a run. Sizes are input features,
+    for the matrix the number of cells.
+
+    :returns: algorithm parameters
+    :rtype: dict
+    """
+    parameters = dict(INPUT_PROVIDER=0, INPUT_MODE=0, concurrent_requests=concurrency)
+    if name == 'directions_lines':
+        starts, ends = _points(size, 1), _points(size, 2)
+        parameters.update(
+            INPUT_LINE_LAYER=_layer('LineString', [
+                'LINESTRING({} {}, {} {})'.format(*start, *end) for start, end in zip(starts, ends)
+            ]),
+            INPUT_LAYER_FIELD='id',
+            OUTPUT='TEMPORARY_OUTPUT'
+        )
+    elif name == 'directions_point_layer':
+        points = _points(size * 3, 1)
+        parameters.update(
+            INPUT_LINE_LAYER=_layer('MultiPoint', [
+                'MULTIPOINT(({} {}), ({} {}), ({} {}))'.format(*points[i], *points[i + 1], *points[i + 2])
+                for i in range(0, len(points), 3)
+            ]),
+            INPUT_LAYER_FIELD='id',
+            OUTPUT='TEMPORARY_OUTPUT'
+        )
+    elif name == 'directions_points_layers':
+        parameters.update(
+            INPUT_START_LAYER=_point_layer(size, 1),
+            INPUT_START_FIELD='id',
+            INPUT_END_LAYER=_point_layer(size, 2),
+            INPUT_END_FIELD='id',
+            INPUT_MATRIX_MODE=0,
+            OUTPUT='TEMPORARY_OUTPUT'
+        )
+    elif name == 'isochrones':
+        parameters.update(
+            INPUT_POINT_LAYER=_point_layer(size, 1),
+            INPUT_FIELD='id',
+            contours='5,10,15,20',
+            polygons=0,
+            show_locations=True
+        )
+    elif name == 'matrix':
+        side = math.ceil(math.sqrt(size))
+        parameters.update(
+            INPUT_START_LAYER=_point_layer(side, 1),
+            INPUT_START_FIELD='id',
+            INPUT_END_LAYER=_point_layer(side, 2),
+            INPUT_END_FIELD='id',
+            OUTPUT='TEMPORARY_OUTPUT'
+        )
+
+    return parameters
+
+
+def run_child(name, size, concurrency):
+    """Runs one algorithm in this interpreter and prints the result line."""
+    from qgis.core import QgsApplication
+
+    app = QgsApplication([], False)
+    app.initQgis()
+    sys.path.append(os.path.join(QgsApplication.pkgDataPath(), 'python', 'plugins'))
+    from processing.core.Processing import Processing
+    import processing
+    Processing.initialize()
+
+    sys.path.insert(0, REPO_DIR)
+    from valhalla.proc.provider import ValhallaProvider
+    QgsApplication.processingRegistry().addProvider(ValhallaProvider())
+
+    parameters = build_parameters(name, size, concurrency)
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    processing.run(ALGORITHMS[name], parameters)
+    wall = time.perf_counter() - start
+
+    print(RESULT_MARKER + json.dumps(dict(wall_s=wall, peak_rss_mb=peak_rss_mb(), rss_before_mb=rss_before)))
+    sys.stdout.flush()
+    # Skipping exitQgis() is much faster and the process ends anyway
+    os._exit(0)
+
+
+def write_config(directory, base_url, log_level):
+    # JSON is valid YAML
+    path = os.path.join(directory, 'config.yml')
+    with open(path, 'w') as f:
+        json.dump({
+            'logging': {'level': log_level, 'max_length': 2000, 'request_sample': 1},
+            'providers': [{'name': 'benchmark', 'base_url': base_url, 'key': ''}]
+        }, f)
+
+    return path
+
+
+def run(args):
+    server = mock_server.start(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        route_points=args.route_points,
+        isochrone_vertices=args.isochrone_vertices
+    )
+    results = dict()
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, VALHALLA_QGIS_CONFIG=write_config(directory, server.base_url, args.log_level))
+        for name in args.algorithms.split(','):
+            for size in [int(size) for size in args.sizes.split(',')]:
+                server.reset()
+                process = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--child', name, str(size), '--concurrency', str(args.concurrency)],
+                    cwd=REPO_DIR,
+                    env=env,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    universal_newlines=True
+                )
+                lines = [line for line in process.stdout.splitlines() if line.startswith(RESULT_MARKER)]
+                if process.returncode or not lines:
+                    raise RuntimeError("{} with {} features failed:\n{}".format(name, size, process.stderr))
+
+                result = json.loads(lines[-1][len(RESULT_MARKER):])
+                requests = sum(server.counts.values())
+                result.update(
+                    features=size,
+                    requests=requests,
+                    features_per_s=size / result['wall_s'],
+                    requests_per_s=requests / result['wall_s']
+                )
+                results['{}/{}'.format(name, size)] = result
+                print("{:<32} {:>9.2f} s {:>10.1f} features/s {:>8.1f} requests/s {:>8} MB peak RSS".format(
+                    '{} {}'.format(name, size),
+                    result['wall_s'],
+                    result['features_per_s'],
+                    result['requests_per_s'],
+                    '-' if result['peak_rss_mb'] is None else '{:.0f}'.format(result['peak_rss_mb'])
+                ))
+                sys.stdout.flush()
+    server.shutdown()
+
+    return {
+        'meta': {
+            'latency_ms': args.latency_ms,
+            'jitter_ms': args.jitter_ms,
+            'concurrency': args.concurrency,
+            'route_points': args.route_points,
+            'isochrone_vertices': args.isochrone_vertices,
+            'python': platform.python_version(),
+            'platform': platform.platform()
+        },
+        'results': results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--algorithms', default=','.join(ALGORITHMS), help='comma separated, default all')
+    parser.add_argument('--sizes', default='100,1000,10000,100000', help='comma separated input features')
+    parser.add_argument('--latency-ms', type=float, default=0, help='mean latency of the mock server')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='standard deviation of the latency')
+    parser.add_argument('--concurrency', type=int, default=1, help='"Concurrent requests" of the algorithms')
+    parser.add_argument('--route-points', type=int, default=payloads.DEFAULT_ROUTE_POINTS, help='shape points per route leg')
+    parser.add_argument('--isochrone-vertices', type=int, default=payloads.DEFAULT_ISOCHRONE_VERTICES, help='vertices per contour')
+    parser.add_argument('--log-level', default='info', help='logging level of the plugin')
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--child', nargs=2, metavar=('ALGORITHM', 'SIZE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], int(args.child[1]), args.concurrency)
+        return
+
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks of the plugin's hot pure-Python functions, without any
+network: polyline decoding, building the route, matrix, isochrone and
+trace_attributes features from a response and building the costing options.
+
+The responses are generated by payloads.py with realistic sizes: a long
+truck route, a 50x50 matrix, an isochrone with 4 contours. They are the same
+on every run, so the numbers are comparable. Run it with the Python
+interpreter of the QGIS installation, from the repository root:
+
+    python benchmarks/micro.py --output micro.json
+    python benchmarks/micro.py --filter matrix
+    python benchmarks/compare.py micro.json micro_new.json
+
+Without qgis only the benchmarks which don't need it run.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import timeit
+
+import payloads
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# Hamburg to Munich, 3 legs
+TRUCK_ROUTE = [
+    {'lat': 53.5511, 'lon': 9.9937},
+    {'lat': 52.3759, 'lon': 9.7320},
+    {'lat': 50.1109, 'lon': 8.6821},
+    {'lat': 48.1351, 'lon': 11.5820}
+]
+TRUCK_ROUTE_POINTS = 8000
+MATRIX_SIZE = 50
+ISOCHRONE_CONTOURS = [{'time': 10}, {'time': 20}, {'time': 30}, {'time': 40}]
+ISOCHRONE_VERTICES = 1500
+TRACE_POINTS = 500
+
+BENCHMARKS = []
+
+
+def benchmark(name, qgis=True):
+    """
+    Registers a benchmark. The decorated function prepares the payload and
+    returns the function to time.
+
+    :param name: benchmark name in the results
+    :type name: str
+
+    :param qgis: whether the benchmark needs qgis
+    :type qgis: bool
+    """
+    def register(setup):
+        BENCHMARKS.append((name, qgis, setup))
+        return setup
+
+    return register
+
+
+def _grid(count, lat, lon, step=0.01):
+    side = int(count ** 0.5) or 1
+    return [{'lat': round(lat + (i // side) * step, 6), 'lon': round(lon + (i % side) * step, 6)} for i in range(count)]
+
+
+@benchmark('decode_polyline6/truck_route', qgis=False)
+def _decode_polyline6():
+    from valhalla.utils import convert
+
+    shapes = [leg['shape'] for leg in payloads.route_response(TRUCK_ROUTE, TRUCK_ROUTE_POINTS)['trip']['legs']]
+
+    return lambda: [convert.decode_polyline6(shape) for shape in shapes]
+
+
+@benchmark('get_output_feature_directions/truck_route')
+def _directions():
+    from valhalla.common import directions_core
+
+    response = payloads.route_response(TRUCK_ROUTE, TRUCK_ROUTE_POINTS)
+    options = {'truck': {'height': 4.0, 'weight': 40.0}}
+
+    return lambda: directions_core.get_output_feature_directions(response, 'truck', options, 'hamburg', 'munich')
+
+
+@benchmark('get_output_features_matrix/50x50')
+def _matrix():
+    from valhalla.common import matrix_core
+
+    response = payloads.matrix_response(_grid(MATRIX_SIZE, 52.4, 13.2), _grid(MATRIX_SIZE, 52.5, 13.3))
+
+    return lambda: matrix_core.get_output_features_matrix(response, 'auto', {})
+
+
+@benchmark('isochrones_get_features/4_contours')
+def _isochrones():
+    from valhalla.common import isochrones_core
+
+    isochrones = isochrones_core.Isochrones()
+    isochrones.set_parameters('auto', 'Polygon')
+    isochrones.set_response(payloads.isochrone_response(
+        [{'lat': 52.52, 'lon': 13.405}], ISOCHRONE_CONTOURS, polygons=True, vertices=ISOCHRONE_VERTICES
+    ))
+
+    return lambda: list(isochrones.get_features('berlin', {}))
+
+
+@benchmark('trace_attributes_get_output_features/500_points')
+def _trace_attributes():
+    from valhalla.common import trace_attributes_core
+
+    shape = [{'lat': round(52.4 + i * 0.0005, 6), 'lon': round(13.2 + i * 0.0007, 6)} for i in range(TRACE_POINTS)]
+    response = payloads.trace_attributes_response(shape)
+
+    return lambda: trace_attributes_core.get_output_features(response)
+
+
+@benchmark('get_costing_options/truck')
+def _costing_options():
+    from valhalla.common import AUTO_COSTING, TRUCK_COSTING
+    from valhalla.proc.costing_params import CostingTruck
+    from valhalla.proc.request_builder import get_costing_options
+
+    values = {
+        AUTO_COSTING.PENALTY_MANEUVER: 5,
+        AUTO_COSTING.USE_HIGHWAYS: 0.8,
+        AUTO_COSTING.USE_TOLLS: 0.2,
+        TRUCK_COSTING.HEIGHT: 4.0,
+        TRUCK_COSTING.WEIGHT: 40.0,
+        TRUCK_COSTING.HAZMAT: True
+    }
+
+    class Algorithm:
+        """Stands in for the processing algorithm which reads the parameters."""
+
+        @staticmethod
+        def parameterAsInt(parameters, name, context):
+            return int(parameters.get(name, 0))
+
+        @staticmethod
+        def parameterAsDouble(parameters, name, context):
+            return float(parameters.get(name, 0))
+
+        @staticmethod
+        def parameterAsBool(parameters, name, context):
+            return bool(parameters.get(name, False))
+
+    costing_options = CostingTruck()
+    costing_options.set_costing_options(Algorithm(), values, None)
+
+    return lambda: get_costing_options(costing_options, 'truck', 'Fastest')
+
+
+def measure(function, repeat):
+    """
+    Times a function like timeit: the number of calls per repetition is
+    chosen so one repetition takes at least 0.2 secs.
+
+    :returns: median and minimum time per call in microseconds
+    :rtype: tuple of float
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    timings = [seconds / number * 1e6 for seconds in timer.repeat(repeat=repeat, number=number)]
+
+    return statistics.median(timings), min(timings)
+
+
+def run(name_filter, repeat):
+    try:
+        from qgis.core import QgsApplication
+        app = QgsApplication([], False)
+        app.initQgis()
+        has_qgis = True
+    except ImportError:
+        has_qgis = False
+
+    results = dict()
+    for name, needs_qgis, setup in BENCHMARKS:
+        if name_filter and name_filter not in name:
+            continue
+        if needs_qgis and not has_qgis:
+            print("{:<50} skipped, needs qgis".format(name))
+            continue
+        median_us, min_us = measure(setup(), repeat)
+        results[name] = dict(median_us=median_us, min_us=min_us, calls_per_s=1e6 / median_us)
+        print("{:<50} {:>12.1f} us (min {:.1f} us)".format(name, median_us, min_us))
+        sys.stdout.flush()
+
+    return {
+        'meta': {'python': platform.python_version(), 'platform': platform.platform(), 'qgis': has_qgis},
+        'results': results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filter', help='only run benchmarks whose name contains this')
+    parser.add_argument('--repeat', type=int, default=7, help='repetitions per benchmark')
+    parser.add_argument('--output', help='write the results as JSON')
+    args = parser.parse_args()
+
+    results = run(args.filter, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for a Valhalla server, answering /route, /isochrone,
+/sources_to_targets, /locate and /trace_attributes with synthetic responses,
+see payloads.py. Every request waits for a configurable latency first, drawn
+from a seeded distribution so runs are comparable.
+
+Run it standalone and add http://localhost:8002 as a provider:
+
+    python benchmarks/mock_server.py --port 8002 --latency-ms 40 --jitter-ms 10
+
+GET /stats returns the number of requests per endpoint, POST /stats/reset
+resets them.
+"""
+
+import argparse
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import payloads
+
+
+class MockValhallaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms=0, jitter_ms=0, route_points=payloads.DEFAULT_ROUTE_POINTS,
+                 isochrone_vertices=payloads.DEFAULT_ISOCHRONE_VERTICES, seed=0):
+        """
+        :param address: (host, port) to listen on, port 0 picks a free one
+        :type address: tuple
+
+        :param latency_ms: mean latency of every request
+        :type latency_ms: float
+
+        :param jitter_ms: standard deviation of the latency
+        :type jitter_ms: float
+
+        :param route_points: shape points of every route leg
+        :type route_points: int
+
+        :param isochrone_vertices: vertices of every isochrone contour
+        :type isochrone_vertices: int
+
+        :param seed: seed of the latency distribution
+        :type seed: int
+        """
+        super().__init__(address, _Handler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.route_points = route_points
+        self.isochrone_vertices = isochrone_vertices
+
+        self.counts = dict()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return 'http://{}:{}'.format(*self.server_address[:2])
+
+    def next_latency(self):
+        with self._lock:
+            latency = self._random.gauss(self.latency_ms, self.jitter_ms) if self.jitter_ms else self.latency_ms
+
+        return max(latency, 0) / 1000
+
+    def count(self, endpoint):
+        with self._lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self.counts = dict()
+
+    def respond(self, endpoint, request):
+        """
+        :returns: response body for a request, None for unknown endpoints
+        :rtype: dict or list
+        """
+        if endpoint == '/route':
+            return payloads.route_response(request['locations'], self.route_points)
+        elif endpoint == '/isochrone':
+            return payloads.isochrone_response(
+                request['locations'],
+                request['contours'],
+                polygons=request.get('polygons', False),
+                show_locations=request.get('show_locations', False),
+                vertices=self.isochrone_vertices
+            )
+        elif endpoint == '/sources_to_targets':
+            return payloads.matrix_response(request['sources'], request['targets'])
+        elif endpoint == '/locate':
+            return payloads.locate_response(request['locations'])
+        elif endpoint == '/trace_attributes':
+            return payloads.trace_attributes_response(request['shape'])
+
+        return None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if urlparse(self.path).path == '/stats':
+            with self.server._lock:
+                self._send(200, dict(self.server.counts))
+        else:
+            self._send(404, {'error': 'Not found', 'status_code': 404})
+
+    def do_POST(self):
+        endpoint = urlparse(self.path).path
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if endpoint == '/stats/reset':
+            self.server.reset()
+            self._send(200, {})
+            return
+
+        if self.headers.get('Content-Encoding', '').lower() == 'gzip':
+            body = gzip.decompress(body)
+        try:
+            request = json.loads(body) if body else {}
+            response = self.server.respond(endpoint, request)
+        except (ValueError, KeyError, IndexError) as e:
+            self._send(400, {'error': 'Invalid request: {}'.format(e), 'status_code': 400})
+            return
+        if response is None:
+            self._send(404, {'error': 'Unknown endpoint {}'.format(endpoint), 'status_code': 404})
+            return
+
+        time.sleep(self.server.next_latency())
+        self.server.count(endpoint)
+        self._send(200, response)
+
+    def _send(self, status, response):
+        content = json.dumps(response, separators=(',', ':')).encode()
+        headers = {'Content-Type': 'application/json'}
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            content = gzip.compress(content, compresslevel=1)
+            headers['Content-Encoding'] = 'gzip'
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        # One line per request would dominate the benchmark's output
+        pass
+
+
+def start(port=0, **settings):
+    """
+    Starts the server in a background thread.
+
+    :param port: port to listen on, 0 picks a free one
+    :type port: int
+
+    :param settings: see MockValhallaServer
+
+    :rtype: MockValhallaServer
+    """
+    server = MockValhallaServer(('127.0.0.1', port), **settings)
+    threading.Thread(target=server.serve_forever, name='mock-valhalla', daemon=True).start()
+
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8002)
+    parser.add_argument('--latency-ms', type=float, default=0, help='mean latency of every request')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='standard deviation of the latency')
+    parser.add_argument('--route-points', type=int, default=payloads.DEFAULT_ROUTE_POINTS, help='shape points per route leg')
+    parser.add_argument('--isochrone-vertices', type=int, default=payloads.DEFAULT_ISOCHRONE_VERTICES, help='vertices per contour')
+    args = parser.parse_args()
+
+    server = MockValhallaServer(
+        ('127.0.0.1', args.port),
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        route_points=args.route_points,
+        isochrone_vertices=args.isochrone_vertices
+    )
+    print("Mock Valhalla server listening on {}".format(server.base_url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
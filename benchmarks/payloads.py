@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic Valhalla responses for the benchmarks.
+
+Every payload is derived from the request locations and a fixed seed, so the
+same request always gets the same response and runs are comparable. The
+shapes are random walks between the locations, encoded as polyline6 like
+Valhalla's own.
+
+Nothing here imports qgis, the mock server runs with any Python 3.
+"""
+
+import math
+import random
+
+# Roughly one vertex every 20 m on a car route
+DEFAULT_ROUTE_POINTS = 250
+DEFAULT_ISOCHRONE_VERTICES = 400
+
+
+def encode_polyline6(coordinates, precision=6):
+    """
+    Encodes coordinates the way Valhalla encodes shapes, the counterpart of
+    valhalla.utils.convert.decode_polyline6().
+
+    :param coordinates: (lat, lon) tuples
+    :type coordinates: list of tuple
+
+    :rtype: str
+    """
+    factor = 10 ** precision
+    output = []
+    previous_lat = previous_lon = 0
+    for lat, lon in coordinates:
+        lat, lon = int(round(lat * factor)), int(round(lon * factor))
+        for delta in (lat - previous_lat, lon - previous_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                output.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            output.append(chr(value + 63))
+        previous_lat, previous_lon = lat, lon
+
+    return ''.join(output)
+
+
+def _rng(*values):
+    # Same locations, same payload
+    return random.Random(hash(tuple(round(v, 6) for v in values)) & 0xffffffff)
+
+
+def _walk(start, end, points, rng):
+    """Random walk of (lat, lon) from start to end with the given number of points."""
+    (lat0, lon0), (lat1, lon1) = start, end
+    coordinates = []
+    for i in range(points):
+        t = i / max(points - 1, 1)
+        wobble = 0 if i in (0, points - 1) else 0.0005
+        coordinates.append((
+            lat0 + (lat1 - lat0) * t + rng.uniform(-wobble, wobble),
+            lon0 + (lon1 - lon0) * t + rng.uniform(-wobble, wobble)
+        ))
+
+    return coordinates
+
+
+def _distance_km(start, end):
+    (lat0, lon0), (lat1, lon1) = start, end
+    x = math.radians(lon1 - lon0) * math.cos(math.radians((lat0 + lat1) / 2))
+    y = math.radians(lat1 - lat0)
+
+    return 6371 * math.hypot(x, y)
+
+
+def route_response(locations, points_per_leg=DEFAULT_ROUTE_POINTS):
+    """
+    :param locations: request locations with "lat" and "lon"
+    :type locations: list of dict
+
+    :param points_per_leg: shape points of every leg
+    :type points_per_leg: int
+
+    :returns: /route response
+    :rtype: dict
+    """
+    legs = []
+    for start, end in zip(locations, locations[1:]):
+        start, end = (start['lat'], start['lon']), (end['lat'], end['lon'])
+        rng = _rng(*start, *end)
+        length = _distance_km(start, end) * 1.3
+        legs.append({
+            'maneuvers': [],
+            'summary': {'time': length / 50 * 3600, 'length': round(length, 3)},
+            'shape': encode_polyline6(_walk(start, end, points_per_leg, rng))
+        })
+
+    return {
+        'trip': {
+            'locations': locations,
+            'legs': legs,
+            'summary': {
+                'time': sum(leg['summary']['time'] for leg in legs),
+                'length': sum(leg['summary']['length'] for leg in legs)
+            },
+            'status': 0,
+            'units': 'kilometers'
+        }
+    }
+
+
+def isochrone_response(locations, contours, polygons=True, show_locations=True, vertices=DEFAULT_ISOCHRONE_VERTICES):
+    """
+    :param locations: request locations with "lat" and "lon"
+    :type locations: list of dict
+
+    :param contours: request contours, e.g. [{"time": 10}, {"time": 20}]
+    :type contours: list of dict
+
+    :param polygons: polygons instead of lines
+    :type polygons: bool
+
+    :param show_locations: add the snapped and input locations
+    :type show_locations: bool
+
+    :param vertices: vertices of every contour
+    :type vertices: int
+
+    :returns: /isochrone GeoJSON response
+    :rtype: dict
+    """
+    center = locations[0]
+    rng = _rng(center['lat'], center['lon'])
+    features = []
+    for contour in sorted(contours, key=lambda c: list(c.values())[0], reverse=True):
+        metric, value = list(contour.items())[0]
+        radius = value * (0.004 if metric == 'time' else 0.009)
+        ring = []
+        for i in range(vertices):
+            angle = 2 * math.pi * i / vertices
+            r = radius * rng.uniform(0.7, 1.0)
+            ring.append([round(center['lon'] + r * math.cos(angle), 6), round(center['lat'] + r * math.sin(angle), 6)])
+        ring.append(ring[0])
+        features.append({
+            'type': 'Feature',
+            'properties': {'contour': value, 'metric': metric, 'color': '#ff0000'},
+            'geometry': {'type': 'Polygon', 'coordinates': [ring]} if polygons else {'type': 'LineString', 'coordinates': ring}
+        })
+
+    if show_locations:
+        snapped = [[round(location['lon'] + 0.0001, 6), round(location['lat'] + 0.0001, 6)] for location in locations]
+        features.append({
+            'type': 'Feature',
+            'properties': {'type': 'snapped', 'location_index': 0},
+            'geometry': {'type': 'MultiPoint', 'coordinates': snapped}
+        })
+        features.extend({
+            'type': 'Feature',
+            'properties': {'type': 'input', 'location_index': i},
+            'geometry': {'type': 'Point', 'coordinates': [location['lon'], location['lat']]}
+        } for i, location in enumerate(locations))
+
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def matrix_response(sources, targets):
+    """
+    :param sources: request sources with "lat" and "lon"
+    :type sources: list of dict
+
+    :param targets: request targets with "lat" and "lon"
+    :type targets: list of dict
+
+    :returns: /sources_to_targets response
+    :rtype: dict
+    """
+    rows = []
+    for i, source in enumerate(sources):
+        row = []
+        for j, target in enumerate(targets):
+            length = _distance_km((source['lat'], source['lon']), (target['lat'], target['lon'])) * 1.3
+            row.append({
+                'distance': round(length, 3),
+                'time': int(length / 50 * 3600),
+                'from_index': i,
+                'to_index': j
+            })
+        rows.append(row)
+
+    return {'sources_to_targets': rows, 'sources': sources, 'targets': targets, 'units': 'kilometers'}
+
+
+def locate_response(locations, edges=3):
+    """
+    :param locations: request locations with "lat" and "lon"
+    :type locations: list of dict
+
+    :param edges: candidate edges per location
+    :type edges: int
+
+    :returns: /locate response
+    :rtype: list
+    """
+    response = []
+    for location in locations:
+        rng = _rng(location['lat'], location['lon'])
+        response.append({
+            'input_lat': location['lat'],
+            'input_lon': location['lon'],
+            'nodes': [],
+            'edges': [{
+                'way_id': rng.randrange(1, 10 ** 9),
+                'correlated_lat': round(location['lat'] + rng.uniform(-0.0002, 0.0002), 6),
+                'correlated_lon': round(location['lon'] + rng.uniform(-0.0002, 0.0002), 6),
+                'side_of_street': rng.choice(['left', 'right', 'neither']),
+                'percent_along': round(rng.random(), 5)
+            } for _ in range(edges)]
+        })
+
+    return response
+
+
+def trace_attributes_response(shape, points_per_edge=20):
+    """
+    :param shape: request shape with "lat" and "lon"
+    :type shape: list of dict
+
+    :param points_per_edge: shape points of every matched edge
+    :type points_per_edge: int
+
+    :returns: /trace_attributes response
+    :rtype: dict
+    """
+    coordinates = []
+    for start, end in zip(shape, shape[1:]):
+        start, end = (start['lat'], start['lon']), (end['lat'], end['lon'])
+        coordinates.extend(_walk(start, end, points_per_edge, _rng(*start, *end))[:-1])
+    coordinates.append((shape[-1]['lat'], shape[-1]['lon']))
+
+    rng = _rng(len(coordinates))
+    edges = []
+    for begin in range(0, len(coordinates) - 1, points_per_edge):
+        edges.append({
+            'id': rng.randrange(1, 10 ** 9),
+            'way_id': rng.randrange(1, 10 ** 9),
+            'speed': rng.choice([30, 50, 70, 100]),
+            'length': round(rng.uniform(0.05, 1.0), 3),
+            'mean_elevation': rng.randrange(0, 500),
+            'begin_shape_index': begin,
+            'end_shape_index': min(begin + points_per_edge, len(coordinates) - 1)
+        })
+
+    matched_points = [{
+        'lat': point['lat'],
+        'lon': point['lon'],
+        'type': 'matched',
+        'edge_index': min(i, len(edges) - 1),
+        'distance_along_edge': 0.5,
+        'distance_from_trace_point': round(rng.uniform(0, 10), 3)
+    } for i, point in enumerate(shape)]
+
+    return {'shape': encode_polyline6(coordinates), 'edges': edges, 'matched_points': matched_points, 'units': 'kilometers'}
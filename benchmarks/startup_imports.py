@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the import cost of the plugin at QGIS startup.
+
+Every scenario is imported in a fresh interpreter with ``python -X importtime``,
+so nothing is cached between runs. Run it with the Python interpreter of the
+QGIS installation, from the repository root:
+
+    python benchmarks/startup_imports.py --repeat 5 --output startup.json
+    python benchmarks/startup_imports.py --baseline startup.json
+
+With --baseline the script exits with 1 if a scenario got slower than the
+baseline by more than --tolerance.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MARKER = '--- qgis imported ---'
+
+# What QGIS imports at startup, and what is only imported on first use
+SCENARIOS = {
+    'plugin': 'import valhalla.ValhallaPlugin',
+    'processing_provider': 'import valhalla.proc.provider',
+    'menu_and_toolbar': 'import valhalla.gui.ValhallaDialog',
+    'algorithms': 'import valhalla.proc.directions_lines.directions_lines_auto, '
+                  'valhalla.proc.directions_point_layer.directions_points_layer_auto, '
+                  'valhalla.proc.directions_points_layers.directions_points_layers_auto, '
+                  'valhalla.proc.isochrones.isochrones_layer_auto, '
+                  'valhalla.proc.matrix.matrix_auto',
+    'dialog_resources': 'import valhalla.gui.resources_rc',
+}
+
+
+def import_time(statement):
+    """
+    Imports in a fresh interpreter and returns the import time of all modules
+    which the statement pulls in, the plugin's own and third party ones.
+
+    :param statement: import statement to run
+    :type statement: str
+
+    :returns: import time in ms and the names of the imported modules
+    :rtype: tuple of float and list of str
+    """
+    # Import qgis first, its cost is the same with or without the plugin
+    code = 'import sys, qgis.core, qgis.gui\nsys.stderr.write("{}\\n")\n{}'.format(MARKER, statement)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=REPO_DIR,
+        stderr=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        universal_newlines=True
+    )
+    if result.returncode:
+        raise RuntimeError("'{}' failed:\n{}".format(statement, result.stderr))
+
+    lines = result.stderr.splitlines()
+    lines = lines[lines.index(MARKER) + 1:]
+    total_us = 0
+    modules = []
+    for line in lines:
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        if not self_us.strip().isdigit():
+            continue
+        modules.append(name.strip())
+        total_us += int(self_us)
+
+    return total_us / 1000, modules
+
+
+def run(repeat):
+    results = dict()
+    for name, statement in SCENARIOS.items():
+        timings = []
+        modules = []
+        for _ in range(repeat):
+            ms, modules = import_time(statement)
+            timings.append(ms)
+        results[name] = {
+            'median_ms': round(statistics.median(timings), 2),
+            'min_ms': round(min(timings), 2),
+            'modules': len(modules),
+            'heavy_modules': sorted(m for m in modules if m in ('lxml', 'lxml.etree', 'processing', 'valhalla.gui.resources_rc'))
+        }
+        print("{:<22} {:>9.1f} ms (min {:.1f} ms), {} modules {}".format(
+            name,
+            results[name]['median_ms'],
+            results[name]['min_ms'],
+            results[name]['modules'],
+            ', '.join(results[name]['heavy_modules'])
+        ))
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]['median_ms']
+        if before and result['median_ms'] > before * (1 + tolerance):
+            regressions.append("{}: {:.1f} ms -> {:.1f} ms".format(name, before, result['median_ms']))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters per scenario')
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--baseline', help='JSON results to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown, 0.2 = 20%%')
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+"""
+The tests cover the modules which run without QGIS, e.g.:
+
+    python -m pytest tests
+
+Tests of modules importing qgis are skipped where it isn't installed.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+pytest.importorskip('qgis')
+
+from qgis.PyQt.QtNetwork import QNetworkReply  # noqa: E402
+
+from valhalla.common import client  # noqa: E402
+from valhalla.utils import exceptions  # noqa: E402
+
+
+class _Response:
+    def __init__(self, status_code=200, error=QNetworkReply.NoError):
+        self.status_code = status_code
+        self.error_code = error
+
+    def attribute(self, code):
+        return self.status_code
+
+    def error(self):
+        return self.error_code
+
+    def errorString(self):
+        return 'error'
+
+    def content(self):
+        return b'{"trip": {"legs": []}}'
+
+    def rawHeader(self, name):
+        return b'application/json' if name == b'Content-Type' else b''
+
+
+OK = _Response()
+RATE_LIMITED = _Response(429, QNetworkReply.UnknownContentError)
+TIMED_OUT = _Response(None, QNetworkReply.TimeoutError)
+SERVER_ERROR = _Response(503, QNetworkReply.InternalServerError)
+
+
+@pytest.fixture
+def send(monkeypatch):
+    """Answers the requests with the given responses in turn."""
+    responses = []
+
+    def post(self, url, body, timeout, attempt=None):
+        return responses.pop(0), self.base_url
+
+    monkeypatch.setattr(client.transport, 'get_transport', lambda: None)
+    monkeypatch.setattr(client.result_store, 'get_store', lambda: None)
+    monkeypatch.setattr(client.Client, '_post', post)
+    monkeypatch.setattr(client.time, 'sleep', lambda seconds: None)
+
+    return responses
+
+
+def _client(**provider):
+    return client.Client(dict({'key': '', 'base_url': 'http://localhost:8002', 'name': 'local'}, **provider))
+
+
+def test_rate_limit_retries_dont_use_up_the_timeout_retries(send):
+    send.extend([RATE_LIMITED, RATE_LIMITED, TIMED_OUT, OK])
+    assert _client(retry_on_timeout=1).request('/route', post_json={'id': 1}) == {'trip': {'legs': []}}
+    assert not send
+
+
+def test_timeout_retries_are_limited(send):
+    send.extend([TIMED_OUT, RATE_LIMITED, TIMED_OUT, OK])
+    with pytest.raises(exceptions.Timeout):
+        _client(retry_on_timeout=1).request('/route', post_json={'id': 1})
+    assert send == [OK]
+
+
+def test_other_members_are_tried_after_rate_limits(send):
+    group = {
+        'name': 'group',
+        'members': [
+            {'name': 'a', 'base_url': 'http://a', 'key': ''},
+            {'name': 'b', 'base_url': 'http://b', 'key': ''},
+        ],
+    }
+    send.extend([RATE_LIMITED, SERVER_ERROR, OK])
+    assert _client(**group).request('/route', post_json={'id': 1}) == {'trip': {'legs': []}}
+
+    send.extend([SERVER_ERROR, RATE_LIMITED, SERVER_ERROR, OK])
+    with pytest.raises(exceptions.GenericServerError):
+        _client(**group).request('/route', post_json={'id': 2})
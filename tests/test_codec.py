@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import pytest
+
+from valhalla.common import codec
+
+AVOID = [{'lon': 8.68, 'lat': 49.41}, {'lon': 8.69, 'lat': 49.42}]
+COSTING = {'auto': {'use_highways': 0.5, 'shortest': False}}
+
+
+def test_dumps_is_compact_json():
+    body = {'locations': [{'lon': 1.5, 'lat': 2}], 'id': 'quoted "id"', 'units': None}
+    assert codec.dumps(body) == json.dumps(body, separators=(',', ':')).encode()
+
+
+def test_frozen_values_are_spliced_in():
+    body = {'locations': [], 'avoid_locations': codec.freeze(AVOID), 'costing_options': codec.freeze(COSTING)}
+    assert json.loads(codec.dumps(body)) == {'locations': [], 'avoid_locations': AVOID, 'costing_options': COSTING}
+
+
+def test_frozen_values_behave_like_the_original():
+    frozen = codec.freeze(COSTING)
+    assert frozen == COSTING
+    assert frozen['auto']['shortest'] is False
+    assert codec.freeze(AVOID)[1]['lat'] == 49.42
+
+
+def test_frozen_value_is_encoded_once():
+    frozen = codec.freeze(COSTING)
+    # A changed encoding shows that the body is spliced from it
+    frozen.encoded = b'{"spliced":true}'
+    assert codec.dumps(frozen) == b'{"spliced":true}'
+    assert json.loads(codec.dumps({'costing_options': frozen})) == {'costing_options': {'spliced': True}}
+
+
+def test_placeholder_like_strings_are_kept():
+    body = {'id': codec._PLACEHOLDER.format(0), 'avoid_locations': codec.freeze(AVOID)}
+    assert json.loads(codec.dumps(body)) == {'id': codec._PLACEHOLDER.format(0), 'avoid_locations': AVOID}
+
+
+def test_dumps_canonical_sorts_keys():
+    first = codec.dumps_canonical({'b': [{'y': 1, 'x': 'ü'}], 'a': codec.freeze(COSTING)})
+    second = codec.dumps_canonical({'a': {'auto': {'shortest': False, 'use_highways': 0.5}}, 'b': [{'x': 'ü', 'y': 1}]})
+    assert first == second == json.dumps(json.loads(first), sort_keys=True, separators=(',', ':')).encode()
+
+
+def test_big_integers_fall_back_to_the_standard_library():
+    assert json.loads(codec.dumps({'id': 2 ** 70})) == {'id': 2 ** 70}
+
+
+@pytest.mark.parametrize('data', [b'{"a":[1,2.5,null,true]}', b'[]', '{"s":"\\u00fc"}'.encode()])
+def test_loads(data):
+    assert codec.loads(data) == json.loads(data)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import zlib
+
+import pytest
+
+from valhalla.common import compression
+
+BODY = b'{"trip":{"legs":[{"shape":"' + b'a' * 2000 + b'"}]}}'
+
+
+def test_compress_round_trip():
+    compressed = compression.compress(BODY)
+    assert len(compressed) < len(BODY)
+    assert compression.decompress(compressed, 'gzip') == BODY
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'x-gzip', ' GZIP '])
+def test_gzip_encodings(encoding):
+    assert compression.decompress(gzip.compress(BODY), encoding) == BODY
+
+
+def test_deflate_with_zlib_wrapper():
+    assert compression.decompress(zlib.compress(BODY), 'deflate') == BODY
+
+
+def test_raw_deflate():
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    raw = compressor.compress(BODY) + compressor.flush()
+    assert compression.decompress(raw, 'deflate') == BODY
+
+
+@pytest.mark.parametrize('encoding', ['', 'identity', 'br'])
+def test_other_encodings_are_passed_through(encoding):
+    assert compression.decompress(BODY, encoding) == BODY
+
+
+def test_truncated_gzip_raises():
+    with pytest.raises(EOFError):
+        compression.decompress(compression.compress(BODY)[:-10], 'gzip')
+
+
+def test_byte_counters():
+    counters = compression.ByteCounters()
+    assert '0% saved' in counters.summary()
+
+    counters.add_sent(2048, 512)
+    counters.add_received(4096, 1024)
+    counters.add_received(4096, 1024)
+    assert (counters.sent, counters.sent_wire) == (2048, 512)
+    assert (counters.received, counters.received_wire) == (8192, 2048)
+    assert counters.summary() == (
+        "Sent 2.0 kB (0.5 kB on the wire, 75% saved), received 8.0 kB (2.0 kB on the wire, 75% saved)"
+    )
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+from types import SimpleNamespace
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('qgis')
+
+from valhalla.common import hedging  # noqa: E402
+
+
+class _Response:
+    def attribute(self, code):
+        return 200
+
+    def error(self):
+        return 0
+
+
+class _Server:
+    """Answers after a delay per member, like Client._post."""
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.attempts = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def send(self, url, body, timeout, attempt):
+        base_url = 'b' if 'a' in attempt.exclude else 'a'
+        attempt.base_url = base_url
+        with self._lock:
+            self.attempts.append(attempt)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            end = time.time() + self.delays[base_url]
+            while time.time() < end and not attempt.feedback.isCanceled():
+                time.sleep(0.001)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+        return _Response(), base_url
+
+
+def _hedger(name, latency):
+    pool = SimpleNamespace(name=name, nodes=['a', 'b'])
+    window = hedging._get_window(name, '/route')
+    for _ in range(20):
+        window.add(latency)
+
+    return hedging.Hedger(pool, {'percentile': 95, 'min_delay': 0.01})
+
+
+def test_saturated_pool_doesnt_trigger_hedges():
+    hedger = _hedger('saturated', 0.05)
+    server = _Server({'a': 0.02, 'b': 0.02})
+    count = hedging.MAX_HEDGES * 4
+    threads = [
+        threading.Thread(target=hedger.post, args=(server.send, '/route', b'{}', 10))
+        for _ in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Requests faster than the hedge delay are never hedged, however many are in flight
+    assert len(server.attempts) == count
+    assert server.max_active > hedging.MAX_HEDGES
+
+
+def test_slow_request_is_hedged():
+    hedger = _hedger('slow', 0.01)
+    server = _Server({'a': 5, 'b': 0.01})
+    start = time.time()
+    _, base_url = hedger.post(server.send, '/route', b'{}', 10)
+
+    assert base_url == 'b'
+    assert time.time() - start < 1
+    primary, hedge = server.attempts
+    assert primary.feedback.isCanceled() and not hedge.feedback.isCanceled()
+
+
+def test_no_hedges_while_all_slots_are_busy():
+    hedger = _hedger('busy', 0.01)
+    server = _Server({'a': 0.1, 'b': 0.01})
+    for _ in range(hedging.MAX_HEDGES):
+        hedging._hedge_slots.acquire()
+    try:
+        _, base_url = hedger.post(server.send, '/route', b'{}', 10)
+    finally:
+        for _ in range(hedging.MAX_HEDGES):
+            hedging._hedge_slots.release()
+
+    assert base_url == 'a'
+    assert len(server.attempts) == 1
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import pytest
+
+from valhalla.common import jsonstream
+
+DOCUMENT = {
+    'id': 'matrix',
+    'sources': [[{'lon': 8.5, 'lat': 49.5}]],
+    'sources_to_targets': [
+        [{'from_index': 0, 'to_index': 0, 'distance': 1.5, 'time': 90}],
+        [{'from_index': 1, 'to_index': 0, 'distance': None, 'time': None}],
+    ],
+    'units': 'kilometers',
+}
+
+
+def _parse(document, path, chunk_size):
+    encoded = document if isinstance(document, bytes) else json.dumps(document).encode()
+    parser = jsonstream.ArrayItemParser(path)
+    items = []
+    for start in range(0, len(encoded), chunk_size):
+        items.extend(parser.feed(encoded[start:start + chunk_size]))
+
+    return items
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 7, 64, 100000])
+def test_items_across_chunk_boundaries(chunk_size):
+    path = ('sources_to_targets',)
+    assert _parse(DOCUMENT, path, chunk_size) == list(jsonstream.iter_path(DOCUMENT, path))
+
+
+def test_items_are_returned_as_soon_as_they_are_complete():
+    encoded = json.dumps(DOCUMENT).encode()
+    first_row_end = encoded.index(b'}]', encoded.index(b'sources_to_targets')) + 2
+    parser = jsonstream.ArrayItemParser(('sources_to_targets',))
+
+    assert parser.feed(encoded[:first_row_end - 1]) == []
+    assert parser.feed(encoded[first_row_end - 1:first_row_end]) == [DOCUMENT['sources_to_targets'][0]]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3])
+def test_structural_characters_in_strings(chunk_size):
+    document = {
+        'trap': {'sources_to_targets': [{'a': 1}]},
+        'features': [
+            {'name': 'quote \\" and ] } [ { , :', 'path': 'C:\\\\'},
+            {'name': '"features": [{}]', 'unicode': 'Köln \u00fc'},
+        ],
+    }
+    encoded = json.dumps(document, ensure_ascii=False).encode()
+    assert _parse(encoded, ('features',), chunk_size) == document['features']
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3])
+def test_backslashes_at_chunk_boundaries(chunk_size):
+    names = ['\\', '\\"', '\\\\', 'a\\\\"b', '"']
+    document = {'features': [{'name': name} for name in names]}
+    assert _parse(document, ('features',), chunk_size) == document['features']
+
+
+def test_long_items_in_small_chunks():
+    document = {'trip': {'legs': [{'shape': 'a\\' * 50000}, {'shape': 'b' * 100000}]}}
+    encoded = json.dumps(document).encode()
+    parser = jsonstream.ArrayItemParser(('trip', 'legs'))
+    items = []
+    for start in range(0, len(encoded), 1000):
+        items.extend(parser.feed(encoded[start:start + 1000]))
+        # Parsed parts are dropped, only the current item is buffered
+        assert len(parser._buffer) <= 2 * 100000 + 2000
+
+    assert items == document['trip']['legs']
+
+
+def test_nested_path():
+    document = {'a': {'b': [1, {'c': [[1], [2]]}], 'c': [[3]]}, 'c': [[4]]}
+    assert _parse(document, ('a', 'c'), 1) == [[3]]
+    assert _parse(document, ('c',), 5) == [[4]]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 4, 1000])
+def test_top_level_fields(chunk_size):
+    document = {
+        'error_code': 171,
+        'nested': {'error': 'not this one'},
+        'error': 'No suitable edges near location, "0"',
+        'status_code': 400,
+        'status': 'Bad Request',
+    }
+    encoded = json.dumps(document).encode()
+    parser = jsonstream.ArrayItemParser(('sources_to_targets',), fields=('error', 'status_code'))
+    for start in range(0, len(encoded), chunk_size):
+        assert parser.feed(encoded[start:start + chunk_size]) == []
+
+    assert parser.fields == {'error': document['error'], 'status_code': 400}
+
+
+def test_fields_of_the_last_key():
+    parser = jsonstream.ArrayItemParser(('rows',), fields=('units',))
+    assert parser.feed(b'{"rows": [[1]], "units": {"a": [1, 2]} }') == [[1]]
+    assert parser.fields == {'units': {'a': [1, 2]}}
+
+
+def test_missing_path_yields_nothing():
+    assert _parse(DOCUMENT, ('features',), 4) == []
+
+
+def test_iter_path():
+    assert list(jsonstream.iter_path({'a': {'b': [1, 2]}}, ('a', 'b'))) == [1, 2]
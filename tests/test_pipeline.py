@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+import pytest
+
+from valhalla.proc.pipeline import Pipeline, Stage
+
+
+def _double(value):
+    return value * 2
+
+
+def _fail_on_three(value):
+    if value == 3:
+        raise ValueError(value)
+    return value
+
+
+@pytest.mark.parametrize('threaded', [False, True])
+def test_all_items_go_through_all_stages(threaded):
+    pipeline = Pipeline([Stage('double', _double, 3), Stage('inc', lambda v: v + 1, 2)], threaded=threaded)
+    results = list(pipeline.run(range(50)))
+
+    assert sorted(result.index for result in results) == list(range(50))
+    assert all(result.error is None and result.value == result.index * 2 + 1 for result in results)
+
+
+def test_ordered_results_are_in_input_order():
+    def slow_first(value):
+        # Early items finish last
+        time.sleep(0.001 * (20 - value))
+        return value
+
+    pipeline = Pipeline([Stage('slow', slow_first, 8)], ordered=True)
+    assert [result.value for result in pipeline.run(range(20))] == list(range(20))
+
+
+@pytest.mark.parametrize('threaded', [False, True])
+def test_error_skips_the_remaining_stages(threaded):
+    later = []
+    pipeline = Pipeline([Stage('fail', _fail_on_three), Stage('record', later.append)], threaded=threaded)
+    results = {result.index: result for result in pipeline.run(range(5))}
+
+    assert isinstance(results[3].error, ValueError)
+    # The failed result carries the item as it went into the failing stage
+    assert results[3].value == 3
+    assert sorted(later) == [0, 1, 2, 4]
+
+
+def test_input_is_read_while_results_are_consumed():
+    read = []
+
+    def items():
+        for i in range(1000):
+            read.append(i)
+            yield i
+
+    pipeline = Pipeline([Stage('double', _double, 2)], queue_size=2)
+    results = pipeline.run(items())
+    for _ in range(10):
+        next(results)
+    time.sleep(0.05)
+
+    # The feeder stops when max_in_flight items are between input and output
+    assert len(read) <= 10 + pipeline.max_in_flight + 1
+    results.close()
+
+
+def test_error_reading_the_input_ends_the_run():
+    def items():
+        yield 1
+        raise RuntimeError('broken input')
+
+    with pytest.raises(RuntimeError):
+        list(Pipeline([Stage('double', _double)]).run(items()))
+
+
+def test_cancel_stops_reading_input():
+    canceled = threading.Event()
+
+    def items():
+        for i in range(1000):
+            if i == 5:
+                canceled.set()
+            yield i
+
+    results = list(Pipeline([Stage('double', _double)], queue_size=1).run(items(), canceled.is_set))
+    assert len(results) < 1000
+
+
+def test_stopping_early_joins_the_threads():
+    before = threading.active_count()
+    results = Pipeline([Stage('double', _double, 4)]).run(range(1000))
+    next(results)
+    results.close()
+
+    assert threading.active_count() == before
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+pytest.importorskip('qgis')
+
+from qgis.core import QgsPointXY  # noqa: E402
+
+from valhalla.proc import planning  # noqa: E402
+
+
+def test_location_key_rounds_to_the_request_precision():
+    first = planning.location_key([QgsPointXY(8.1234564, 49.1), QgsPointXY(8.5, 49.5)])
+    second = planning.location_key([QgsPointXY(8.1234561, 49.1000001), QgsPointXY(8.5, 49.5)])
+    assert first == second == ((8.123456, 49.1), (8.5, 49.5))
+    # The order of the locations matters
+    assert planning.location_key([QgsPointXY(8.5, 49.5), QgsPointXY(8.1234564, 49.1)]) != first
+
+
+def test_key_points_round_trip():
+    key = ((8.123456, 49.1), (8.5, 49.5))
+    assert planning.location_key(planning.key_points(key)) == key
+
+
+def test_group_requests_keeps_the_order_of_first_items():
+    groups = planning.group_requests(['b1', 'a1', 'b2', 'c1', 'a2'], lambda item: item[0])
+    assert groups == [('b', ['b1', 'b2']), ('a', ['a1', 'a2']), ('c', ['c1'])]
+
+
+def test_group_features():
+    rows = [(((1, 2),), ('x',)), (((3, 4),), ('y',)), (((1, 2),), ('z',))]
+    assert planning.group_features(rows) == [(((1, 2),), [('x',), ('z',)]), (((3, 4),), [('y',)])]
+
+
+def test_unique_points():
+    points = [QgsPointXY(1, 2), QgsPointXY(3, 4), QgsPointXY(1.0000001, 2), QgsPointXY(1, 2)]
+    unique, members = planning.unique_points(points)
+    assert [(point.x(), point.y()) for point in unique] == [(1, 2), (3, 4)]
+    assert members == [[0, 2, 3], [1]]
+
+
+def test_describe():
+    assert planning.describe(10, 7) == "10 input features, 7 distinct requests (3 duplicates skipped)"
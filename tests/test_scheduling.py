@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+import random
+
+from valhalla.proc import scheduling
+
+
+def _grid(size):
+    # Locations on a regular grid, one per curve cell
+    step = 360 / (1 << scheduling._CURVE_BITS)
+    return [(-180 + (x + 0.5) * step, -90 + (y + 0.5) * step / 2) for x in range(size) for y in range(size)]
+
+
+def test_curve_indices_are_unique_on_a_grid():
+    locations = _grid(8)
+    assert len(set(map(scheduling.hilbert_index, locations))) == len(locations)
+    assert len(set(map(scheduling.zorder_index, locations))) == len(locations)
+
+
+def test_hilbert_neighbours_are_adjacent_cells():
+    # Consecutive positions of a Hilbert curve are always neighbouring cells
+    locations = sorted(_grid(16), key=scheduling.hilbert_index)
+    cells = [scheduling._grid_cell(location) for location in locations]
+    for (x1, y1), (x2, y2) in zip(cells, cells[1:]):
+        assert abs(x1 - x2) + abs(y1 - y2) == 1
+
+
+def test_zorder_interleaves_bits():
+    assert scheduling.zorder_index((-180, -90)) == 0
+    cell = scheduling._grid_cell((10, 20))
+    index = scheduling.zorder_index((10, 20))
+    assert sum(((index >> (2 * bit)) & 1) << bit for bit in range(16)) == cell[0]
+    assert sum(((index >> (2 * bit + 1)) & 1) << bit for bit in range(16)) == cell[1]
+
+
+def test_locations_out_of_range_are_clamped():
+    assert scheduling.hilbert_index((200, 100)) == scheduling.hilbert_index((180, 90))
+    assert scheduling.zorder_index((-200, -100)) == scheduling.zorder_index((-180, -90))
+
+
+def test_estimate_cost():
+    assert scheduling.estimate_cost(((8.0, 50.0),)) == 0
+    # One degree of latitude is about 111 km
+    assert abs(scheduling.estimate_cost(((8.0, 50.0), (8.0, 51.0))) - 111.2) < 0.5
+
+
+def test_feature_id_order_keeps_input_order():
+    requests = ['a', 'b', 'c']
+    assert scheduling.order_requests(requests, scheduling.FEATURE_ID, None) == [(0, 'a'), (1, 'b'), (2, 'c')]
+
+
+def test_curve_order_is_a_permutation():
+    rng = random.Random(1)
+    requests = [((rng.uniform(-10, 10), rng.uniform(40, 60)),) for _ in range(200)]
+    for strategy in (scheduling.HILBERT, scheduling.ZORDER):
+        ordered = scheduling.order_requests(requests, strategy, lambda request: request)
+        assert sorted(index for index, _ in ordered) == list(range(len(requests)))
+        assert all(requests[index] is request for index, request in ordered)
+
+
+def test_group_by_cost_orders_by_distance_class():
+    short = ((8.0, 50.0), (8.0, 50.01))
+    long = ((8.0, 50.0), (8.0, 55.0))
+    ordered = scheduling.order_requests([long, short, long], scheduling.FEATURE_ID, lambda request: request, True)
+    # Ties keep the input order
+    assert [index for index, _ in ordered] == [1, 0, 2]
+
+
+def test_reorder_buffer_restores_input_order():
+    written = []
+    buffer = scheduling.ReorderBuffer(written.append)
+    for index in (2, 0, 3, 1):
+        buffer.add(index, index)
+    assert written == [0, 1, 2, 3]
+    assert buffer.reordered == 0
+
+
+def test_reorder_buffer_skips_failed_requests():
+    written = []
+    buffer = scheduling.ReorderBuffer(written.append)
+    buffer.add(1, 'b')
+    buffer.skip(0)
+    buffer.add(2, 'c')
+    assert written == ['b', 'c']
+
+
+def test_reorder_buffer_without_order_writes_right_away():
+    written = []
+    buffer = scheduling.ReorderBuffer(written.append, keep_order=False)
+    buffer.add(3, 'd')
+    buffer.skip(1)
+    assert written == ['d']
+
+
+def test_reorder_buffer_flush_writes_held_back_outputs():
+    written = []
+    buffer = scheduling.ReorderBuffer(written.append)
+    buffer.add(3, 'd')
+    buffer.add(1, 'b')
+    buffer.skip(2)
+    assert written == []
+    buffer.flush()
+    assert written == ['b', 'd']
+
+
+def test_reorder_buffer_is_bounded():
+    written = []
+    buffer = scheduling.ReorderBuffer(written.append, max_pending=3)
+    # Output 0 arrives last, e.g. its request was sent last along a curve
+    for index in range(1, 10):
+        buffer.add(index, index)
+        assert len(buffer._pending) <= 3
+    buffer.add(0, 0)
+    buffer.flush()
+
+    assert sorted(written) == list(range(10))
+    assert written[-1] == 0
+    # Within the window the order is still kept
+    assert written[:-1] == sorted(written[:-1])
+    assert buffer.reordered > 0
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+from valhalla.common import codec, singleflight
+
+WAITERS = 8
+
+
+def _wait_for_waiters(key, count, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        call = singleflight._calls.get(key)
+        if call is not None and call.waiters == count:
+            return
+        time.sleep(0.001)
+    raise AssertionError("waiters didn't join the call")
+
+
+def _run_concurrently(key, fn, count):
+    """Starts count callers of do() once the leader's fn is running."""
+    results = [None] * count
+    errors = [None] * count
+
+    def call(index):
+        try:
+            results[index] = singleflight.do(key, fn)
+        except Exception as e:
+            errors[index] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+    return threads, results, errors
+
+
+def test_request_key_ignores_id():
+    first = singleflight.request_key('p', '/route', {'id': 1, 'locations': [{'lat': 1, 'lon': 2}]})
+    second = singleflight.request_key('p', '/route', {'id': 2, 'locations': [{'lat': 1, 'lon': 2}]})
+    other = singleflight.request_key('p', '/route', {'id': 1, 'locations': [{'lat': 1, 'lon': 3}]})
+
+    assert first == second
+    assert first != other
+
+
+def test_request_key_ignores_the_order_of_parameters():
+    # E.g. the dialog and the processing algorithms build the same request
+    first = singleflight.request_key('p', '/route', {
+        'locations': [{'lat': 1, 'lon': 2}],
+        'costing': 'auto',
+        'costing_options': {'auto': {'use_tolls': 0.5, 'shortest': True}},
+    })
+    second = singleflight.request_key('p', '/route', {
+        'costing_options': codec.freeze({'auto': {'shortest': True, 'use_tolls': 0.5}}),
+        'costing': 'auto',
+        'locations': [{'lon': 2, 'lat': 1}],
+    })
+
+    assert first == second
+
+
+def test_concurrent_callers_share_one_call_and_get_own_copies():
+    key = ('p', '/route', 'shared')
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {'trip': {'legs': [{'shape': 'abc'}]}}
+
+    leader_result = []
+    leader = threading.Thread(target=lambda: leader_result.append(singleflight.do(key, fn)))
+    leader.start()
+    assert started.wait(5)
+
+    threads, results, errors = _run_concurrently(key, fn, WAITERS)
+    for thread in threads:
+        thread.start()
+    _wait_for_waiters(key, WAITERS)
+    release.set()
+    leader.join(5)
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert errors == [None] * WAITERS
+    everyone = leader_result + results
+    assert all(result == {'trip': {'legs': [{'shape': 'abc'}]}} for result in everyone)
+    assert len({id(result) for result in everyone}) == WAITERS + 1
+    assert key not in singleflight._calls
+
+
+def test_leader_changing_its_result_doesnt_affect_waiters():
+    key = ('p', '/sources_to_targets', 'mutate')
+    started = threading.Event()
+    release = threading.Event()
+
+    def fn():
+        started.set()
+        release.wait(5)
+        return {'sources_to_targets': [[{'time': 1}]]}
+
+    def leader():
+        result = singleflight.do(key, fn)
+        # Like Client._merge_responses, right after the result is returned
+        for _ in range(1000):
+            result['sources_to_targets'].append([{'time': 2}])
+
+    leader_thread = threading.Thread(target=leader)
+    leader_thread.start()
+    assert started.wait(5)
+
+    threads, results, errors = _run_concurrently(key, fn, WAITERS)
+    for thread in threads:
+        thread.start()
+    _wait_for_waiters(key, WAITERS)
+    release.set()
+    leader_thread.join(5)
+    for thread in threads:
+        thread.join(5)
+
+    assert errors == [None] * WAITERS
+    assert all(result == {'sources_to_targets': [[{'time': 1}]]} for result in results)
+
+
+def test_error_is_raised_to_all_callers():
+    key = ('p', '/isochrone', 'error')
+    started = threading.Event()
+    release = threading.Event()
+
+    def fn():
+        started.set()
+        release.wait(5)
+        raise ValueError('server error')
+
+    leader_error = []
+
+    def leader():
+        try:
+            singleflight.do(key, fn)
+        except ValueError as e:
+            leader_error.append(e)
+
+    leader_thread = threading.Thread(target=leader)
+    leader_thread.start()
+    assert started.wait(5)
+
+    threads, results, errors = _run_concurrently(key, fn, 3)
+    for thread in threads:
+        thread.start()
+    _wait_for_waiters(key, 3)
+    release.set()
+    leader_thread.join(5)
+    for thread in threads:
+        thread.join(5)
+
+    assert len(leader_error) == 1
+    assert all(error is leader_error[0] for error in errors)
+
+
+def test_sequential_calls_are_not_coalesced():
+    calls = []
+
+    def fn():
+        calls.append(1)
+        return {'n': len(calls)}
+
+    assert singleflight.do(('p', '/locate', 'seq'), fn) == {'n': 1}
+    assert singleflight.do(('p', '/locate', 'seq'), fn) == {'n': 2}
+
+
+def test_result_without_waiters_is_not_copied(monkeypatch):
+    copies = []
+    real = singleflight.copy.deepcopy
+    monkeypatch.setattr(singleflight.copy, 'deepcopy', lambda value: copies.append(1) or real(value))
+
+    singleflight.do(('p', '/route', 'nocopy'), lambda: {'a': 1})
+
+    assert copies == []
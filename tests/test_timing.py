@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+from valhalla.common import timing
+from valhalla.proc.pipeline import Pipeline, Stage
+
+
+def _work(seconds=0.01):
+    with timing.stage(timing.NETWORK):
+        time.sleep(seconds)
+
+
+def test_stages_are_only_timed_while_active():
+    _work()
+    timers = timing.activate(True)
+    try:
+        _work()
+    finally:
+        timing.deactivate(timers)
+    _work()
+
+    assert timers.totals[timing.NETWORK][1] == 1
+    assert not timing.enabled()
+
+
+def test_nested_stages_count_their_own_time():
+    timers = timing.activate(True)
+    try:
+        with timing.stage(timing.BUILD_FEATURES):
+            time.sleep(0.01)
+            with timing.stage(timing.DECODE):
+                time.sleep(0.02)
+    finally:
+        timing.deactivate(timers)
+
+    assert timers.totals[timing.DECODE][0] >= 0.02
+    assert timers.totals[timing.BUILD_FEATURES][0] < 0.02
+
+
+def test_concurrent_runs_have_their_own_timers():
+    timers = [None, None]
+    started = threading.Barrier(2)
+
+    def run(index, calls):
+        timers[index] = timing.activate(True)
+        started.wait()
+        try:
+            for _ in range(calls):
+                _work(0.001)
+        finally:
+            timing.deactivate(timers[index])
+
+    threads = [threading.Thread(target=run, args=(i, calls)) for i, calls in enumerate((3, 5))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert timers[0].totals[timing.NETWORK][1] == 3
+    assert timers[1].totals[timing.NETWORK][1] == 5
+
+
+def test_untimed_run_in_another_thread_isnt_timed():
+    timers = timing.activate(True)
+    try:
+        thread = threading.Thread(target=lambda: (timing.activate(False), _work()))
+        thread.start()
+        thread.join()
+    finally:
+        timing.deactivate(timers)
+
+    assert timing.NETWORK not in timers.totals
+
+
+def test_pipeline_workers_use_the_run_timers():
+    timers = timing.activate(True)
+    try:
+        pipeline = Pipeline([Stage('work', lambda item: _work(0.001), 4)])
+        results = list(pipeline.run(range(20)))
+    finally:
+        timing.deactivate(timers)
+
+    assert all(result.error is None for result in results)
+    assert timers.totals[timing.NETWORK][1] == 20
+
+
+def test_deactivate_twice_keeps_the_wall_time():
+    timers = timing.activate(True)
+    timing.deactivate(timers)
+    wall = timers.wall
+    time.sleep(0.01)
+    timing.deactivate(timers)
+
+    assert timers.wall == wall
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+import struct
+
+import pytest
+
+from valhalla.common import proto
+from valhalla.common.proto import valhalla_pb, wire
+
+
+# A minimal encoder, just enough to build test messages
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _tag(number, wire_type):
+    return _varint(number << 3 | wire_type)
+
+
+def _field_varint(number, value):
+    return _tag(number, wire.VARINT) + _varint(value)
+
+
+def _field_bytes(number, value):
+    return _tag(number, wire.LENGTH_DELIMITED) + _varint(len(value)) + value
+
+
+def _field_float(number, value):
+    return _tag(number, wire.FIXED32) + struct.pack('<f', value)
+
+
+def _field_double(number, value):
+    return _tag(number, wire.FIXED64) + struct.pack('<d', value)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def test_read_varint():
+    for value in (0, 1, 127, 128, 300, 2 ** 32, 2 ** 63):
+        assert wire.read_varint(_varint(value) + b'\x01', 0) == (value, len(_varint(value)))
+
+
+def test_truncated_varint():
+    with pytest.raises(wire.DecodeError):
+        wire.read_varint(b'\x80\x80', 0)
+
+
+class _Scalars(wire.Message):
+    FIELDS = {
+        1: ('uint', 'uint32', False),
+        2: ('sint', 'sint32', False),
+        3: ('int', 'int32', False),
+        4: ('flag', 'bool', False),
+        5: ('text', 'string', False),
+        6: ('length', 'float', False),
+        7: ('time', 'double', False),
+        8: ('packed', 'sint32', True),
+        9: ('floats', 'float', True),
+    }
+
+
+def test_defaults():
+    message = _Scalars.FromString(b'')
+    assert (message.uint, message.sint, message.text, message.length, message.packed) == (0, 0, '', 0.0, [])
+
+
+def test_scalar_round_trip():
+    buffer = b''.join([
+        _field_varint(1, 300),
+        _field_varint(2, _zigzag(-5)),
+        # Negative int32 values are sign extended to 64 bits
+        _field_varint(3, -2 & 0xffffffffffffffff),
+        _field_varint(4, 1),
+        _field_bytes(5, 'Köln'.encode()),
+        _field_float(6, 1.5),
+        _field_double(7, 0.1),
+        _field_bytes(8, b''.join(_varint(_zigzag(v)) for v in (1, -1, 1000000))),
+        _field_bytes(9, struct.pack('<2f', 0.5, 2.0)),
+    ])
+    message = _Scalars.FromString(buffer)
+
+    assert (message.uint, message.sint, message.int, message.flag) == (300, -5, -2, True)
+    assert message.text == 'Köln'
+    assert (message.length, message.time) == (1.5, 0.1)
+    assert message.packed == [1, -1, 1000000]
+    assert message.floats == [0.5, 2.0]
+
+
+def test_unknown_fields_are_skipped():
+    buffer = b''.join([
+        _field_varint(100, 7),
+        _field_bytes(101, b'ignored'),
+        _field_float(102, 1.0),
+        _field_double(103, 1.0),
+        _field_varint(1, 42),
+    ])
+    assert _Scalars.FromString(buffer).uint == 42
+
+
+@pytest.mark.parametrize('buffer', [
+    _field_bytes(5, b'text')[:-1],
+    _field_float(6, 1.5)[:-1],
+    _field_double(7, 1.5)[:-1],
+    _tag(1, wire.VARINT),
+    _tag(1, 3),
+    # Only repeated scalars can be packed
+    _field_bytes(1, _varint(1)),
+])
+def test_invalid_messages(buffer):
+    with pytest.raises(wire.DecodeError):
+        _Scalars.FromString(buffer)
+
+
+def _route(*legs):
+    encoded_legs = b''.join(
+        _field_bytes(1, _field_bytes(5, _field_float(1, length) + _field_double(2, time)) + _field_bytes(7, shape.encode()))
+        for length, time, shape in legs
+    )
+    return _field_bytes(3, _field_bytes(1, encoded_legs))
+
+
+def test_decode_route():
+    content = _route((1.5, 90.0, 'abc'), (2.25, 30.5, 'def'))
+    assert proto.decode('/route', content, {}) == {'trip': {'legs': [
+        {'shape': 'abc', 'summary': {'length': 1.5, 'time': 90.0}},
+        {'shape': 'def', 'summary': {'length': 2.25, 'time': 30.5}},
+    ]}}
+
+
+def test_decode_route_without_routes():
+    with pytest.raises(proto.DecodeError):
+        proto.decode('/route', _field_bytes(3, b''), {})
+
+
+def test_decode_matrix():
+    post_json = {'sources': [{'lon': 0, 'lat': 0}], 'targets': [{'lon': 1, 'lat': 1}, {'lon': 2, 'lat': 2}]}
+    matrix = b''.join([
+        _field_bytes(2, _varint(1500) + _varint(2 ** 32 - 1)),
+        _field_bytes(3, struct.pack('<2f', 120.0, -1.0)),
+    ])
+    result = proto.decode('/sources_to_targets', _field_bytes(5, matrix), post_json)
+
+    assert result['sources'] == post_json['sources']
+    assert result['sources_to_targets'] == [[
+        {'from_index': 0, 'to_index': 0, 'distance': 1.5, 'time': 120.0},
+        # Unreachable targets
+        {'from_index': 0, 'to_index': 1, 'distance': None, 'time': None},
+    ]]
+
+
+def _contour(coords):
+    geometry = _field_bytes(1, b''.join(_varint(_zigzag(int(round(c * 1e6)))) for c in coords))
+    return _field_bytes(3, _field_bytes(1, geometry))
+
+
+def test_decode_isochrone():
+    polygon = _field_varint(1, valhalla_pb.IsochroneInterval.TIME) + _field_float(2, 10.0) + _contour(
+        [8.5, 49.5, 8.6, 49.5, 8.6, 49.6, 8.5, 49.5])
+    line = _field_varint(1, valhalla_pb.IsochroneInterval.DISTANCE) + _field_float(2, 2.0) + _contour(
+        [8.5, 49.5, -8.6, -49.6])
+    result = proto.decode('/isochrone', _field_bytes(6, _field_bytes(1, polygon) + _field_bytes(1, line)), {})
+
+    first, second = result['features']
+    assert first['geometry'] == {
+        'type': 'Polygon',
+        'coordinates': [[[8.5, 49.5], [8.6, 49.5], [8.6, 49.6], [8.5, 49.5]]],
+    }
+    assert first['properties'] == {'contour': 10.0, 'metric': 'time'}
+    assert second['geometry'] == {'type': 'LineString', 'coordinates': [[8.5, 49.5], [-8.6, -49.6]]}
+    assert second['properties'] == {'contour': 2.0, 'metric': 'distance'}
+
+
+def test_decode_unknown_endpoint():
+    with pytest.raises(proto.DecodeError):
+        proto.decode('/locate', b'', {})
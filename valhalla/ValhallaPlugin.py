@@ -25,9 +25,6 @@
 """
 from qgis.core import QgsApplication
 
-from .gui import ValhallaDialog
-from .proc.provider import ValhallaProvider
-
 
 class Valhalla():
     """QGIS Plugin Implementation."""
@@ -41,19 +38,30 @@ class Valhalla():
             application at run time.
         :type iface: QgsInterface
         """
-        self.dialog = ValhallaDialog.ValhallaDialogMain(iface)
+        self.iface = iface
+        self.dialog = None
         self.provider = None
 
     def initProcessing(self):
+        # Imported here, so loading the plugin module itself stays cheap
+        from .proc.provider import ValhallaProvider
+
         self.provider = ValhallaProvider()
         QgsApplication.processingRegistry().addProvider(self.provider)
 
     def initGui(self):
         """Create the menu entries and toolbar icons inside the QGIS GUI."""
+        from .gui import ValhallaDialog
+
         self.initProcessing()
+        self.dialog = ValhallaDialog.ValhallaDialogMain(self.iface)
         self.dialog.initGui()
         
     def unload(self):
         """remove menu entry and toolbar icons"""
         QgsApplication.processingRegistry().removeProvider(self.provider)
         self.dialog.unload()
+
+        from .common import process_pool, transport
+        process_pool.shutdown()
+        transport.shutdown()
@@ -47,7 +47,10 @@ DEFAULT_COLOR = '#a8b1f5'
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 RESOURCE_PREFIX = ":plugins/Valhalla/img/"
-CONFIG_PATH = os.path.join(BASE_DIR, 'config.yml')
+# Icons are loaded from files where possible, resources_rc is only loaded with the main dialog
+IMG_DIR = os.path.join(BASE_DIR, 'gui', 'img')
+# VALHALLA_QGIS_CONFIG points to another config.yml, e.g. for benchmarks against a local server
+CONFIG_PATH = os.environ.get('VALHALLA_QGIS_CONFIG') or os.path.join(BASE_DIR, 'config.yml')
 
 # Read metadata.txt
 METADATA = configparser.ConfigParser()
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+                                 Valhalla - QGIS plugin
+ QGIS client to query Valhalla APIs
+                              -------------------
+        begin                : 2019-10-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by Nils Nolde
+        email                : nils@gis-ops.com
+ ***************************************************************************/
+
+ This plugin provides access to some of the APIs from Valhalla
+ (https://github.com/valhalla/valhalla), developed and
+ maintained by https://gis-ops.com, Berlin, Germany.
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import threading
+
+from .circuit_breaker import CircuitBreaker
+
+LEAST_OUTSTANDING = 'least_outstanding'
+WEIGHTED_ROUND_ROBIN = 'weighted_round_robin'
+
+# Pools live for the whole QGIS session, so the health state of the nodes
+# is shared by all clients of the same provider group
+_pools = dict()
+_pools_lock = threading.Lock()
+
+
+class Node:
+    """A single Valhalla instance of a provider group."""
+
+    def __init__(self, provider, eject_after, eject_seconds):
+        """
+        :param provider: member provider of the group
+        :type provider: dict
+
+        :param eject_after: consecutive failures after which the node is ejected
+        :type eject_after: int
+
+        :param eject_seconds: how long an ejected node is skipped
+        :type eject_seconds: float
+        """
+        self.name = provider['name']
+        self.base_url = provider['base_url']
+        self.key = provider['key']
+        self.weight = max(float(provider.get('weight', 1)), 0.01)
+        self.breaker = CircuitBreaker(self.base_url, eject_after, eject_seconds)
+
+        self.outstanding = 0
+        self.current_weight = 0
+
+    def is_healthy(self):
+        return self.breaker.is_available()
+
+
+class ProviderPool:
+    """Spreads requests across the members of a provider group and ejects failing members for a while."""
+
+    def __init__(self, group):
+        """
+        :param group: resolved provider group, see configmanager.get_providers()
+        :type group: dict
+        """
+        self.name = group['name']
+        self.strategy = group.get('strategy') or LEAST_OUTSTANDING
+        eject_after = int(group.get('eject_after') or 3)
+        eject_seconds = float(group.get('eject_seconds') or 30)
+        self.nodes = [Node(member, eject_after, eject_seconds) for member in group['members']]
+
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def acquire(self, exclude=()):
+        """
+        Picks the node for the next request and counts it as outstanding.
+
+        :param exclude: base URLs which should not be picked if possible.
+        :type exclude: collection of str
+
+        :returns: node to send the request to, None if all nodes are ejected or
+            only take their trial request
+        :rtype: Node
+        """
+        with self._lock:
+            candidates = [n for n in self.nodes if n.is_healthy() and n.base_url not in exclude] \
+                or [n for n in self.nodes if n.is_healthy()]
+            if not candidates:
+                return None
+
+            if self.strategy == WEIGHTED_ROUND_ROBIN:
+                node = self._pick_weighted_round_robin(candidates)
+            else:
+                node = self._pick_least_outstanding(candidates)
+            # Claims the trial request of a node coming back
+            node.breaker.allow_request()
+            node.outstanding += 1
+
+        return node
+
+    def release(self, node, failed=None):
+        """
+        Marks the request on a node as finished and updates the node's health.
+
+        :param node: node returned by acquire()
+        :type node: Node
+
+        :param failed: whether the node failed to answer, i.e. connection errors, timeouts or HTTP 5xx.
+            None leaves the node's health untouched, e.g. for cancelled requests.
+        :type failed: bool
+        """
+        with self._lock:
+            node.outstanding = max(node.outstanding - 1, 0)
+        node.breaker.record(failed)
+
+    def _pick_least_outstanding(self, candidates):
+        # Start at a rotating offset, so ties are spread evenly
+        self._next = (self._next + 1) % len(candidates)
+        rotated = candidates[self._next:] + candidates[:self._next]
+
+        return min(rotated, key=lambda n: n.outstanding / n.weight)
+
+    @staticmethod
+    def _pick_weighted_round_robin(candidates):
+        # Smooth weighted round robin, see nginx' upstream module
+        total = sum(n.weight for n in candidates)
+        for n in candidates:
+            n.current_weight += n.weight
+        node = max(candidates, key=lambda n: n.current_weight)
+        node.current_weight -= total
+
+        return node
+
+
+def get_pool(group):
+    """
+    Returns the session-wide pool for a provider group. The pool is rebuilt if
+    the group's members changed.
+
+    :param group: resolved provider group, see configmanager.get_providers()
+    :type group: dict
+
+    :rtype: ProviderPool
+    """
+    signature = (
+        tuple((m['base_url'], m.get('weight', 1)) for m in group['members']),
+        group.get('strategy'),
+        group.get('eject_after'),
+        group.get('eject_seconds')
+    )
+    with _pools_lock:
+        pool, pool_signature = _pools.get(group['name'], (None, None))
+        if pool is None or pool_signature != signature:
+            pool = ProviderPool(group)
+            _pools[group['name']] = (pool, signature)
+
+    return pool
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+                                 Valhalla - QGIS plugin
+ QGIS client to query Valhalla APIs
+                              -------------------
+        begin                : 2019-10-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by Nils Nolde
+        email                : nils@gis-ops.com
+ ***************************************************************************/
+
+ This plugin provides access to some of the APIs from Valhalla
+ (https://github.com/valhalla/valhalla), developed and
+ maintained by https://gis-ops.com, Berlin, Germany.
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import threading
+import time
+
+from qgis.PyQt.QtNetwork import QNetworkRequest, QNetworkReply
+
+from ..utils import logger
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+# Breakers of single providers live for the whole QGIS session
+_breakers = dict()
+_breakers_lock = threading.Lock()
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a server after repeated failures. After
+    reset_seconds the breaker is half-open and lets a single trial request
+    through, all others are still rejected: its success closes the breaker,
+    its failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_seconds=30):
+        """
+        :param name: name for logging, usually the base URL
+        :type name: str
+
+        :param failure_threshold: consecutive failures which open the breaker
+        :type failure_threshold: int
+
+        :param reset_seconds: time until an open breaker becomes half-open
+        :type reset_seconds: float
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+
+        self.failures = 0
+        self.opened_at = None
+        # Start of the trial request of a half-open breaker
+        self._probing = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return HALF_OPEN
+        return OPEN
+
+    def is_available(self):
+        """Whether a request would be allowed, without claiming the trial request."""
+        with self._lock:
+            return self._is_available()
+
+    def allow_request(self):
+        """
+        Whether a request may be sent. In the half-open state only the first
+        caller gets the trial request, which must be followed by record().
+        """
+        with self._lock:
+            if not self._is_available():
+                return False
+            if self.state == HALF_OPEN:
+                self._probing = time.monotonic()
+            return True
+
+    def _is_available(self):
+        state = self.state
+        if state == HALF_OPEN:
+            # A trial request which never reported back doesn't block forever
+            return self._probing is None or time.monotonic() - self._probing >= self.reset_seconds
+        return state == CLOSED
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = None
+
+    def record_failure(self):
+        with self._lock:
+            self._probing = None
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self.failures = 0
+                logger.log("Circuit breaker for {} opened for {} secs", 1, self.name, self.reset_seconds)
+
+    def record(self, failed):
+        """
+        :param failed: whether the request failed, None if its outcome doesn't
+            tell anything about the server, e.g. it was cancelled
+        :type failed: bool
+        """
+        if failed is None:
+            with self._lock:
+                self._probing = None
+        elif failed:
+            self.record_failure()
+        else:
+            self.record_success()
+
+
+def get_breaker(base_url, settings=None):
+    """
+    Returns the session-wide circuit breaker for a base URL.
+
+    :param base_url: provider's base URL
+    :type base_url: str
+
+    :param settings: provider's "circuit_breaker" settings with "failures" and
+        "reset_seconds"
+    :type settings: dict
+
+    :rtype: CircuitBreaker
+    """
+    settings = settings or {}
+    failure_threshold = int(settings.get('failures') or 5)
+    reset_seconds = float(settings.get('reset_seconds') or 30)
+    with _breakers_lock:
+        breaker = _breakers.get(base_url)
+        if breaker is None:
+            breaker = _breakers[base_url] = CircuitBreaker(base_url, failure_threshold, reset_seconds)
+        breaker.failure_threshold = failure_threshold
+        breaker.reset_seconds = reset_seconds
+
+    return breaker
+
+
+def is_server_failure(response):
+    """
+    Whether a response signals a server which is down or unhealthy, i.e. it
+    couldn't connect, timed out or returned a HTTP 5xx.
+
+    :param response: network response, None if the request couldn't be sent
+    :type response: QgsNetworkReplyContent
+
+    :rtype: bool
+    """
+    if response is None:
+        return True
+    status_code = response.attribute(QNetworkRequest.HttpStatusCodeAttribute)
+    if status_code:
+        return status_code >= 500
+
+    return response.error() != QNetworkReply.NoError
@@ -24,29 +24,55 @@
  ***************************************************************************/
 """
 
+from collections import Counter
 from datetime import datetime, timedelta
 import requests
 import time
 from urllib.parse import urlencode
 import random
-import json
+import threading
 
-from qgis.PyQt.QtCore import QObject, pyqtSignal, QUrl, QJsonDocument
+from qgis.PyQt.QtCore import QObject, QEventLoop, QThread, pyqtSignal, QUrl
 from qgis.PyQt.QtNetwork import QNetworkRequest, QNetworkReply
 from qgis.core import QgsNetworkAccessManager, QgsNetworkReplyContent
 
 from .. import __version__
 from ..utils import exceptions, logger
+from . import balancer, codec, compression, hedging, jsonstream, metrics, proto, result_store, singleflight, timing, transport
+from .circuit_breaker import get_breaker, is_server_failure
 
 _USER_AGENT = "ValhallaQGISClient@v{}".format(__version__)
 
+# Whether a base URL answered format=pbf requests with protobuf (True) or not (False)
+_pbf_support = dict()
+
+# Kinds of retries, each with its own budget: HTTP 429s are retried until the
+# retry timeout, timeouts "retry_on_timeout" times and server errors once on
+# every other member of a provider group
+RATE_LIMITED = 'rate_limited'
+TIMED_OUT = 'timed_out'
+OTHER_MEMBER = 'other_member'
+
+# Per-endpoint request timeouts in seconds. Providers can override single
+# entries with a "timeouts" mapping in config.yml.
+DEFAULT_TIMEOUTS = {
+    'default': 60,
+    '/locate': 10,
+    '/route': 60,
+    '/centroid': 60,
+    '/trace_attributes': 60,
+    '/sources_to_targets': 120,
+    '/isochrone': 180,
+}
+
 
 class Client(QObject):
     """Performs requests to the ORS API services."""
 
     def __init__(self,
                  provider=None,
-                 retry_timeout=60):
+                 retry_timeout=60,
+                 budget=None):
         """
         :param provider: A openrouteservice provider from config.yml
         :type provider: dict
@@ -54,33 +80,125 @@ class Client(QObject):
         :param retry_timeout: Timeout across multiple retriable requests, in
             seconds.
         :type retry_timeout: int
+
+        :param budget: Time budget for all requests of this client instance, in
+            seconds. Defaults to the provider's "job_budget", if any.
+        :type budget: int
         """
         QObject.__init__(self)
 
         self.key = provider['key']
         self.base_url = provider['base_url']
+        self.provider_name = provider['name']
+        # Provider groups spread the requests over their members
+        self.pool = balancer.get_pool(provider) if provider.get('members') else None
+        self.breaker = None if self.pool else get_breaker(self.base_url, provider.get('circuit_breaker'))
+        # Records the responses or serves them from a recording, see config.yml's "transport"
+        self.transport = transport.get_transport()
+        replays = self.transport is not None and self.transport.replays
+        self.hedger = hedging.Hedger(self.pool, provider['hedging']) if self.pool and provider.get('hedging') and not replays else None
+
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        for endpoint, seconds in (provider.get('timeouts') or {}).items():
+            endpoint = endpoint if endpoint == 'default' else '/' + endpoint.lstrip('/')
+            self.timeouts[endpoint] = float(seconds)
+        self.retry_on_timeout = int(provider.get('retry_on_timeout') or 0)
+        self.compress_responses = bool(provider.get('compression'))
+        self.compress_requests = bool(provider.get('compress_requests'))
+        self.bytes = compression.ByteCounters()
+        self.metrics = metrics.Registry(parent=metrics.session)
+        self.use_pbf = provider.get('format') == 'pbf'
+        # Streamed responses bypass _post(), so they can't be recorded or replayed
+        self.stream_responses = bool(provider.get('stream_responses')) and self.transport is None
+        # Responses of the current project, checked before the network
+        self.store = result_store.get_store()
 
         self.nam = QgsNetworkAccessManager.instance()
-        self.nam.setTimeout(60000)
+        # Upper bound for all requests, the per-endpoint timeouts are set on the requests
+        self.nam.setTimeout(int(max(self.timeouts.values()) * 1000))
 
         self.retry_timeout = timedelta(seconds=retry_timeout)
+        budget = budget or provider.get('job_budget')
+        self.deadline = datetime.now() + timedelta(seconds=budget) if budget else None
         self.headers = {
                 "User-Agent": _USER_AGENT,
                 'Content-type': 'application/json',
             }
 
         # Save some references to retrieve in client instances
-        self.url = None
         self.warnings = None
-        self.response_time = 0
-        self.status_code = None
+        # URL and timing of the last request, per thread as several threads share a client
+        self._last_request = threading.local()
+
+    @property
+    def url(self):
+        """URL of the calling thread's last request."""
+        return getattr(self._last_request, 'url', None)
+
+    @property
+    def response_time(self):
+        """Duration of the calling thread's last request, in seconds."""
+        return getattr(self._last_request, 'response_time', 0)
 
     overQueryLimit = pyqtSignal()
     def request(self, 
                 url,
                 first_request_time=None,
                 retry_counter=0,
-                post_json=None):
+                post_json=None,
+                retries=None):
+        """Performs HTTP GET/POST with credentials, returning the body as
+        JSON. If an identical request to the same provider is in flight
+        already, e.g. from another thread, its response is used instead.
+        Responses in the project's result store aren't requested again.
+
+        :param url: URL extension for request. Should begin with a slash.
+        :type url: string
+
+        :param first_request_time: The time of the first request (None if no
+            retries have occurred).
+        :type first_request_time: datetime.datetime
+
+        :param post_json: Parameters for POST endpoints
+        :type post_json: dict
+
+        :param retries: retries so far per kind, see RATE_LIMITED, TIMED_OUT and OTHER_MEMBER
+        :type retries: collections.Counter
+
+        :raises valhalla.utils.exceptions.ApiError: when the API returns an error.
+
+        :returns: openrouteservice response body
+        :rtype: dict
+        """
+        if first_request_time or retry_counter or post_json is None:
+            return self._request(url, first_request_time, retry_counter, post_json, retries)
+
+        if self.store is not None:
+            response = self.store.get(self.provider_name, url, post_json)
+            if response is not None:
+                self.metrics.record_cache_hit(self.provider_name, url)
+                return response
+
+        def fetch():
+            response = self._request(url, post_json=post_json)
+            if self.store is not None:
+                self.store.put(self.provider_name, url, post_json, response)
+            return response
+
+        key = singleflight.request_key(self.pool.name if self.pool else self.base_url, url, post_json)
+
+        try:
+            return singleflight.do(key, fetch)
+        except Exception as e:
+            self.metrics.record_error(self.provider_name, url, e)
+            raise
+
+    def _request(self,
+                 url,
+                 first_request_time=None,
+                 retry_counter=0,
+                 post_json=None,
+                 retries=None):
         """Performs HTTP GET/POST with credentials, returning the body as
         JSON.
 
@@ -94,60 +212,117 @@ class Client(QObject):
         :param post_json: Parameters for POST endpoints
         :type post_json: dict
 
+        :param retries: retries so far per kind, see RATE_LIMITED, TIMED_OUT and OTHER_MEMBER
+        :type retries: collections.Counter
+
         :raises valhalla.utils.exceptions.ApiError: when the API returns an error.
 
         :returns: openrouteservice response body
         :rtype: dict
         """
 
+        retries = retries or Counter()
         if not first_request_time:
             first_request_time = datetime.now()
 
+        timeout = self.get_timeout(url)
+        # Retries after a timeout need at least as long as the timeouts themselves
+        retry_timeout = max(self.retry_timeout, timedelta(seconds=timeout * (self.retry_on_timeout + 1)))
         elapsed = datetime.now() - first_request_time
-        if elapsed > self.retry_timeout:
+        if elapsed > retry_timeout:
             raise exceptions.Timeout()
 
-        if retry_counter > 0:
+        if self.deadline:
+            remaining = (self.deadline - datetime.now()).total_seconds()
+            if remaining <= 0:
+                raise exceptions.Timeout("Time budget of the job is exhausted.")
+            timeout = min(timeout, remaining)
+
+        if retries[RATE_LIMITED] > 0:
             # 0.5 * (1.5 ^ i) is an increased sleep time of 1.5x per iteration,
-            # starting at 0.5s when retry_counter=1. The first retry will occur
+            # starting at 0.5s after the first HTTP 429. The first retry will occur
             # at 1, so subtract that first.
-            delay_seconds = 1.5**(retry_counter - 1)
+            delay_seconds = 1.5**(retries[RATE_LIMITED] - 1)
 
             # Jitter this value by 50% and pause.
             time.sleep(delay_seconds * (random.random() + 0.5))
 
-        # Define the request
-        params = {'access_token': self.key}
-        authed_url = self._generate_auth_url(url,
-                                             params,
-                                             )
-        url_object = QUrl(self.base_url + authed_url)
-        self.url = url_object.url()
-        body = QJsonDocument.fromJson(json.dumps(post_json).encode())
-        request = QNetworkRequest(url_object)
-        request.setHeader(QNetworkRequest.ContentTypeHeader, 'application/json')
+        pbf = self.use_pbf and url in proto.ENDPOINTS and _pbf_support.get(self.base_url) is not False
+        request_json = dict(post_json, format='pbf') if pbf else post_json
+        body = codec.dumps(request_json)
+        logger.log("url: {}\nParameters: {}", 0, self.base_url + url, body, per_request=True)
 
-        logger.log(
-            "url: {}\nParameters: {}".format(
-                self.url,
-                # final_requests_kwargs
-                json.dumps(post_json, indent=2)
-            ),
-            0
-        )
+        raw_size = len(body)
+        if self.compress_requests:
+            body = compression.compress(body)
+        self.bytes.add_sent(raw_size, len(body))
+        self.metrics.record_bytes(self.provider_name, url, sent=len(body))
 
         start = time.time()
-        response: QgsNetworkReplyContent = self.nam.blockingPost(request, body.toJson())
-        self.response_time = time.time() - start
+        with timing.stage(timing.NETWORK):
+            if self.hedger:
+                response, base_url = self.hedger.post(self._post, url, body, timeout)
+            else:
+                response, base_url = self._post(url, body, timeout)
+        response_time = time.time() - start
+        self._last_request.response_time = response_time
+        self.metrics.record_request(self.provider_name, url, response_time)
 
         try:
-            self.handle_response(response, post_json['id'])
+            self.handle_response(response, post_json['id'], base_url)
+        except exceptions.ApiError:
+            if not pbf or self.base_url in _pbf_support:
+                raise
+            # The server might not know format=pbf, find out with a JSON request
+            _pbf_support[self.base_url] = False
+            try:
+                return self.request(url, first_request_time, retry_counter, post_json, retries)
+            except exceptions.ApiError:
+                del _pbf_support[self.base_url]
+                raise
+        except exceptions.GenericServerError:
+            # Another member of the group might be able to answer
+            if not self.pool or retries[OTHER_MEMBER] >= len(self.pool.nodes) - 1:
+                raise
+            logger.log("{} failed, retrying with another member of {}", 1, base_url, self.pool.name)
+            self.metrics.record_retry(self.provider_name, url)
+            return self.request(url, first_request_time, retry_counter + 1, post_json, retries + Counter({OTHER_MEMBER: 1}))
         except exceptions.OverQueryLimit:
             # Let the instances know smth happened
             self.overQueryLimit.emit()
-            return self.request(url, first_request_time, retry_counter + 1, post_json)
-
-        response_content = json.loads(bytes(response.content()))
+            self.metrics.record_retry(self.provider_name, url, rate_limited=True)
+            return self.request(url, first_request_time, retry_counter + 1, post_json, retries + Counter({RATE_LIMITED: 1}))
+        except exceptions.Timeout:
+            if retries[TIMED_OUT] >= self.retry_on_timeout:
+                raise
+            logger.log("Request to {} timed out after {:.1f} secs, retrying", 1, url, response_time)
+            self.metrics.record_retry(self.provider_name, url)
+            return self._retry_timed_out(url, first_request_time, retry_counter, post_json, retries)
+
+        with timing.stage(timing.PARSE):
+            content = bytes(response.content())
+            wire_size = len(content)
+            if self.compress_responses:
+                # Qt only decompresses transparently if it negotiated the encoding itself
+                content = compression.decompress(content, bytes(response.rawHeader(b'Content-Encoding')).decode())
+            self.bytes.add_received(len(content), wire_size)
+            self.metrics.record_bytes(self.provider_name, url, received=wire_size)
+
+            content_type = bytes(response.rawHeader(b'Content-Type')).decode()
+            if pbf and 'protobuf' in content_type:
+                _pbf_support[self.base_url] = True
+                try:
+                    return proto.decode(url, content, post_json)
+                except proto.DecodeError as e:
+                    raise exceptions.GenericServerError(
+                        str(response.attribute(QNetworkRequest.HttpStatusCodeAttribute)),
+                        "Invalid protobuf response: {}".format(e)
+                    )
+            elif pbf:
+                # Older servers ignore the format parameter and answer with JSON
+                _pbf_support[self.base_url] = False
+
+            response_content = codec.loads(content)
 
         # Mapbox treats 400 errors with a 200 status code
         if 'error' in response_content:
@@ -158,7 +333,219 @@ class Client(QObject):
 
         return response_content
 
-    def handle_response(self, response, feat_id):
+    def request_items(self, url, path, post_json=None):
+        """
+        Performs a request and returns an iterator over the items of one array
+        in the response, e.g. the rows of a matrix. With the provider's
+        "stream_responses" setting the items are parsed one at a time while the
+        response arrives, so the full response is never held in memory.
+
+        :param url: URL extension for request. Should begin with a slash.
+        :type url: str
+
+        :param path: object keys leading to the array in the response body
+        :type path: tuple of str
+
+        :param post_json: Parameters for POST endpoints
+        :type post_json: dict
+
+        :raises valhalla.utils.exceptions.ApiError: when the API returns an error.
+
+        :returns: iterator over the array items
+        :rtype: iterator
+        """
+        # The network access manager can only stream in the thread it belongs
+        # to, and the result store needs the whole response
+        if not self.stream_responses or QThread.currentThread() != self.nam.thread() or self.store is not None:
+            return jsonstream.iter_path(self.request(url, post_json=post_json), path)
+
+        if self.deadline and datetime.now() > self.deadline:
+            raise exceptions.Timeout("Time budget of the job is exhausted.")
+
+        node, base_url, key = self._acquire_server()
+
+        body = codec.dumps(post_json)
+        self.bytes.add_sent(len(body), len(body))
+        self.metrics.record_bytes(self.provider_name, url, sent=len(body))
+        url_object = QUrl(base_url + self._generate_auth_url(url, {'access_token': key}))
+        self._last_request.url = url_object.url()
+        logger.log("url: {}\nParameters: {}", 0, url_object.url(), body, per_request=True)
+
+        request = QNetworkRequest(url_object)
+        request.setHeader(QNetworkRequest.ContentTypeHeader, 'application/json')
+        if hasattr(request, 'setTransferTimeout'):
+            request.setTransferTimeout(int(self.get_timeout(url) * 1000))
+
+        start = time.time()
+        reply = self.nam.post(request, body)
+        loop = QEventLoop()
+        reply.readyRead.connect(loop.quit)
+        reply.finished.connect(loop.quit)
+
+        def wait_for_data():
+            if not reply.bytesAvailable() and not reply.isFinished():
+                with timing.stage(timing.NETWORK):
+                    loop.exec_()
+
+        released = []
+
+        def release():
+            # Counts the request towards the node's or provider's health once
+            if released:
+                return
+            released.append(True)
+            failed = is_server_failure(reply)
+            if node:
+                self.pool.release(node, failed)
+            else:
+                self.breaker.record(failed)
+            response_time = time.time() - start
+            self._last_request.response_time = response_time
+            self.metrics.record_request(self.provider_name, url, response_time)
+
+        # Wait for the first data, so errors are raised before any item is returned
+        wait_for_data()
+        if reply.error():
+            release()
+            try:
+                self.handle_response(reply, post_json['id'], base_url)
+            except Exception as e:
+                self.metrics.record_error(self.provider_name, url, e)
+                raise
+            finally:
+                reply.deleteLater()
+
+        def items():
+            parser = jsonstream.ArrayItemParser(path, fields=('error', 'status_code'))
+            try:
+                while True:
+                    chunk = bytes(reply.readAll())
+                    self.bytes.add_received(len(chunk), len(chunk))
+                    self.metrics.record_bytes(self.provider_name, url, received=len(chunk))
+                    with timing.stage(timing.PARSE):
+                        parsed = parser.feed(chunk)
+                    yield from parsed
+                    if reply.isFinished() and not reply.bytesAvailable():
+                        break
+                    wait_for_data()
+                release()
+                self.handle_response(reply, post_json['id'], base_url)
+                # Like in _request(), errors can come with a 200 status code
+                if 'error' in parser.fields:
+                    raise exceptions.ApiError(
+                        str(parser.fields.get('status_code')),
+                        parser.fields['error']
+                    )
+            except Exception as e:
+                self.metrics.record_error(self.provider_name, url, e)
+                raise
+            finally:
+                release()
+                reply.deleteLater()
+
+        return items()
+
+    def _post(self, url, body, timeout, attempt=None):
+        """
+        Sends a single POST request to the provider or a member of the provider group.
+        With a "transport" in config.yml the response is recorded, or served
+        from the recording without any request.
+
+        :param url: URL extension for request. Should begin with a slash.
+        :type url: str
+
+        :param body: serialized request body
+        :type body: bytes
+
+        :param timeout: request timeout in seconds
+        :type timeout: float
+
+        :param attempt: hedging attempt, to exclude members and cancel the request
+        :type attempt: hedging.Attempt
+
+        :raises valhalla.utils.exceptions.GenericServerError: when the circuit breakers of the provider or
+            of all group members are open
+
+        :returns: response and the base URL it was sent to
+        :rtype: tuple of QgsNetworkReplyContent and str
+        """
+        if self.transport:
+            plain_body = compression.decompress(body, 'gzip') if self.compress_requests else body
+            if self.transport.replays:
+                return self.transport.replay(url, plain_body), self.base_url
+
+        node, base_url, key = self._acquire_server(attempt.exclude if attempt else ())
+        feedback = None
+        if attempt:
+            attempt.base_url = base_url
+            feedback = attempt.feedback
+
+        params = {'access_token': key}
+        authed_url = self._generate_auth_url(url,
+                                             params,
+                                             )
+        url_object = QUrl(base_url + authed_url)
+        self._last_request.url = url_object.url()
+        request = QNetworkRequest(url_object)
+        request.setHeader(QNetworkRequest.ContentTypeHeader, 'application/json')
+        if self.compress_responses:
+            request.setRawHeader(b'Accept-Encoding', compression.ACCEPT_ENCODING)
+        if self.compress_requests:
+            request.setRawHeader(b'Content-Encoding', b'gzip')
+        # Only available from Qt 5.15, else the network manager's timeout applies
+        if hasattr(request, 'setTransferTimeout'):
+            request.setTransferTimeout(int(timeout * 1000))
+
+        response = None
+        start = time.time()
+        try:
+            response: QgsNetworkReplyContent = self.nam.blockingPost(request, body, '', False, feedback)
+        finally:
+            # Cancelled hedging requests don't tell anything about the server's health
+            failed = None if feedback and feedback.isCanceled() else is_server_failure(response)
+            if node:
+                self.pool.release(node, failed)
+            else:
+                self.breaker.record(failed)
+
+        if self.transport and failed is not None:
+            self.transport.record(url, plain_body, response, time.time() - start, base_url, self.compress_responses)
+
+        return response, base_url
+
+    def _acquire_server(self, exclude=()):
+        """
+        Picks the server for a request, the provider itself or a member of the
+        provider group. Half-open circuit breakers let a single trial request
+        through.
+
+        :param exclude: base URLs of group members which should not be picked if possible
+        :type exclude: collection of str
+
+        :raises valhalla.utils.exceptions.GenericServerError: when the circuit breakers of the provider or
+            of all group members are open
+
+        :returns: the group member or None, the base URL and the key to send the request with
+        :rtype: tuple of balancer.Node, str and str
+        """
+        if self.pool:
+            node = self.pool.acquire(exclude)
+            if node is None:
+                raise exceptions.GenericServerError(
+                    '503',
+                    f"All members of {self.pool.name} failed repeatedly, no requests are sent to them for now."
+                )
+            return node, node.base_url, node.key
+
+        if not self.breaker.allow_request():
+            raise exceptions.GenericServerError(
+                '503',
+                f"{self.base_url} failed repeatedly, no requests are sent for {self.breaker.reset_seconds} secs."
+            )
+
+        return None, self.base_url, self.key
+
+    def handle_response(self, response, feat_id, base_url=None):
         """
         Casts JSON response to dict
 
@@ -171,48 +558,76 @@ class Client(QObject):
         :rtype: dict
         """
 
-        self.status_code = response.attribute(QNetworkRequest.HttpStatusCodeAttribute)
+        status_code = response.attribute(QNetworkRequest.HttpStatusCodeAttribute)
         if response.error():
             # First try non-HTTP error codes
             error_code = response.error()
             error_msg = response.errorString()
             if error_code in (QNetworkReply.ConnectionRefusedError, QNetworkReply.HostNotFoundError):
-                raise exceptions.GenericServerError(1, f"Host {self.base_url} not valid.")
-            elif error_code == QNetworkReply.TimeoutError:
+                raise exceptions.GenericServerError(1, f"Host {base_url or self.base_url} not valid.")
+            elif error_code in (QNetworkReply.TimeoutError, QNetworkReply.OperationCanceledError):
                 raise exceptions.Timeout("Request timed out.")
 
-            if self.status_code == 401:
+            if status_code == 401:
                 raise exceptions.InvalidKey(
-                    str(self.status_code),
+                    str(status_code),
                     error_msg
                 )
-            elif self.status_code == 429:
-                logger.log("{}: {}".format(
-                    exceptions.OverQueryLimit.__name__,
-                    "Query limit exceeded"
-                ))
+            elif status_code == 429:
+                logger.log("{}: {}", 1, exceptions.OverQueryLimit.__name__, "Query limit exceeded", per_request=True)
                 raise exceptions.OverQueryLimit(
                     str(429),
                     error_msg
                 )
             # Internal error message for Bad Request
-            elif self.status_code and 400 <= self.status_code < 500:
-                logger.log("Feature ID {} caused a {}: {}".format(
+            elif status_code and 400 <= status_code < 500:
+                logger.log(
+                    "Feature ID {} caused a {}: {}",
+                    2,
                     feat_id,
                     exceptions.ApiError.__name__,
-                    error_msg,
-                    2
-                ))
+                    error_msg
+                )
                 raise exceptions.ApiError(
-                    str(self.status_code),
+                    str(status_code),
                     error_msg
                 )
             else:
                 raise exceptions.GenericServerError(
-                    str(self.status_code),
+                    str(status_code),
                     error_msg
                 )
 
+    def get_timeout(self, url):
+        """
+        Returns the timeout for an endpoint.
+
+        :param url: URL extension for request, e.g. /route
+        :type url: str
+
+        :returns: timeout in seconds
+        :rtype: float
+        """
+        return self.timeouts.get(url, self.timeouts['default'])
+
+    def _retry_timed_out(self, url, first_request_time, retry_counter, post_json, retries):
+        """
+        Retries a timed out request. Matrix and multi-contour isochrone requests
+        are split into smaller requests whose responses are merged again.
+
+        :returns: (merged) response body
+        :rtype: dict
+        """
+        retries = retries + Counter({TIMED_OUT: 1})
+        parts = _split_request(url, post_json)
+        if not parts:
+            return self.request(url, first_request_time, retry_counter + 1, post_json, retries)
+
+        logger.log("Splitting {} request into {} requests", 1, url, len(parts))
+        responses = [self.request(url, first_request_time, retry_counter + 1, part, retries) for part in parts]
+
+        return _merge_responses(url, parts, responses)
+
     def _generate_auth_url(self, path, params):
         """Returns the path and query string portion of the request URL, first
         adding any necessary parameters.
@@ -236,3 +651,63 @@ class Client(QObject):
         #     params.append(("api_key", self.key))
 
         return path + "?" + requests.utils.unquote_unreserved(urlencode(params))
+
+
+def _split_request(url, post_json):
+    """
+    Splits a request body in two or more smaller ones, if the endpoint allows.
+
+    :param url: URL extension for request
+    :type url: str
+
+    :param post_json: request body
+    :type post_json: dict
+
+    :returns: the partial request bodies, None if the request can't be split
+    :rtype: list of dict
+    """
+    if url == '/sources_to_targets':
+        for key in ('sources', 'targets'):
+            locations = post_json.get(key) or []
+            if len(locations) > 1:
+                half = len(locations) // 2
+                return [dict(post_json, **{key: locations[:half]}), dict(post_json, **{key: locations[half:]})]
+    elif url == '/isochrone':
+        contours = post_json.get('contours') or []
+        if len(contours) > 1:
+            return [dict(post_json, contours=[contour]) for contour in contours]
+
+    return None
+
+
+def _merge_responses(url, parts, responses):
+    """
+    Merges the responses of requests split by _split_request.
+
+    :returns: the response as if the original request had been made
+    :rtype: dict
+    """
+    merged = responses[0]
+    if url == '/sources_to_targets':
+        split_key = 'sources' if parts[0]['sources'] != parts[1]['sources'] else 'targets'
+        index_key = 'from_index' if split_key == 'sources' else 'to_index'
+        offset = len(parts[0][split_key])
+        second = responses[1]
+        for row in second['sources_to_targets']:
+            for cell in row:
+                if index_key in cell:
+                    cell[index_key] += offset
+        if split_key == 'sources':
+            merged['sources_to_targets'].extend(second['sources_to_targets'])
+        else:
+            for row, second_row in zip(merged['sources_to_targets'], second['sources_to_targets']):
+                row.extend(second_row)
+        merged[split_key].extend(second[split_key])
+    elif url == '/isochrone':
+        # The input and snapped locations are part of every response, only keep the first ones
+        for response in responses[1:]:
+            merged['features'].extend(
+                f for f in response['features'] if f['geometry']['type'] in ('LineString', 'Polygon')
+            )
+
+    return merged
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+                                 Valhalla - QGIS plugin
+ QGIS client to query Valhalla APIs
+                              -------------------
+        begin                : 2019-10-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by Nils Nolde
+        email                : nils@gis-ops.com
+ ***************************************************************************/
+
+ This plugin provides access to some of the APIs from Valhalla
+ (https://github.com/valhalla/valhalla), developed and
+ maintained by https://gis-ops.com, Berlin, Germany.
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import json
+
+# Use the fastest JSON library available, QGIS only ships the standard library
+try:
+    import orjson as _backend
+    BACKEND = 'orjson'
+except ImportError:
+    try:
+        import ujson as _backend
+        BACKEND = 'ujson'
+    except ImportError:
+        _backend = None
+        BACKEND = 'json'
+
+_PLACEHOLDER_PREFIX = '__valhalla_fragment_'
+_PLACEHOLDER = _PLACEHOLDER_PREFIX + '{}__'
+
+
+class _Frozen:
+    """Mixin for values which are serialized once and spliced into every request body."""
+
+    encoded = b''
+
+
+class FrozenList(_Frozen, list):
+    pass
+
+
+class FrozenDict(_Frozen, dict):
+    pass
+
+
+def freeze(value):
+    """
+    Serializes a request fragment once, e.g. avoid_locations or costing_options,
+    so it's spliced into every request body instead of being encoded again.
+    The returned value behaves like the original and must not be changed
+    afterwards.
+
+    :param value: JSON serializable list or dict
+    :type value: list or dict
+
+    :returns: frozen copy of value
+    :rtype: FrozenList or FrozenDict
+    """
+    frozen = FrozenDict(value) if isinstance(value, dict) else FrozenList(value)
+    frozen.encoded = _dumps(value)
+
+    return frozen
+
+
+def dumps(obj):
+    """
+    Serializes a request body to compact JSON. Frozen values on the top level
+    of a dict are spliced in from their pre-serialized form.
+
+    :param obj: request body
+    :type obj: dict
+
+    :rtype: bytes
+    """
+    if isinstance(obj, _Frozen):
+        return obj.encoded
+    if not isinstance(obj, dict):
+        return _dumps(obj)
+
+    fragments = dict()
+    shallow = dict()
+    for key, value in obj.items():
+        if isinstance(value, _Frozen):
+            placeholder = _PLACEHOLDER.format(len(fragments))
+            fragments[placeholder] = value.encoded
+            shallow[key] = placeholder
+        else:
+            shallow[key] = value
+
+    encoded = _dumps(shallow)
+    if encoded.count(b'"' + _PLACEHOLDER_PREFIX.encode()) != len(fragments):
+        # A plain value looks like a placeholder, encode everything instead
+        return _dumps(obj)
+    for placeholder, fragment in fragments.items():
+        encoded = encoded.replace(b'"' + placeholder.encode() + b'"', fragment, 1)
+
+    return encoded
+
+
+def dumps_canonical(obj):
+    """
+    Serializes a value to compact JSON with sorted keys, e.g. to hash a
+    request independent of the order its parameters were set in. Always uses
+    the standard library, so the result doesn't depend on the JSON library.
+
+    :param obj: JSON serializable value
+    :type obj: dict or list
+
+    :rtype: bytes
+    """
+    return json.dumps(obj, sort_keys=True, separators=(',', ':')).encode()
+
+
+def loads(data):
+    """
+    Parses a JSON response body.
+
+    :param data: response body
+    :type data: bytes
+
+    :rtype: dict
+    """
+    if _backend is not None:
+        return _backend.loads(data)
+
+    return json.loads(data)
+
+
+def _dumps(obj):
+    if _backend is not None:
+        try:
+            encoded = _backend.dumps(obj)
+            return encoded if isinstance(encoded, bytes) else encoded.encode()
+        except (TypeError, ValueError, OverflowError):
+            # The standard library is more lenient, e.g. with big integers
+            pass
+
+    return json.dumps(obj, separators=(',', ':')).encode()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+                                 Valhalla - QGIS plugin
+ QGIS client to query Valhalla APIs
+                              -------------------
+        begin                : 2019-10-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by Nils Nolde
+        email                : nils@gis-ops.com
+ ***************************************************************************/
+
+ This plugin provides access to some of the APIs from Valhalla
+ (https://github.com/valhalla/valhalla), developed and
+ maintained by https://gis-ops.com, Berlin, Germany.
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import gzip
+import threading
+import zlib
+
+ACCEPT_ENCODING = b'gzip, deflate'
+
+
+def compress(body):
+    """
+    Gzips a request body.
+
+    :param body: serialized request body
+    :type body: bytes
+
+    :rtype: bytes
+    """
+    return gzip.compress(body, compresslevel=6)
+
+
+def decompress(content, encoding):
+    """
+    Decodes a response body according to its Content-Encoding header.
+
+    :param content: raw response body
+    :type content: bytes
+
+    :param encoding: value of the Content-Encoding header, empty if none
+    :type encoding: str
+
+    :returns: decompressed response body
+    :rtype: bytes
+    """
+    encoding = encoding.strip().lower()
+    if encoding in ('gzip', 'x-gzip'):
+        return gzip.decompress(content)
+    elif encoding == 'deflate':
+        # Servers disagree whether deflate means zlib-wrapped or raw deflate
+        try:
+            return zlib.decompress(content)
+        except zlib.error:
+            return zlib.decompress(content, -zlib.MAX_WBITS)
+
+    return content
+
+
+class ByteCounters:
+    """Counts request and response bytes before and after compression."""
+
+    def __init__(self):
+        self.sent = 0
+        self.sent_wire = 0
+        self.received = 0
+        self.received_wire = 0
+        self._lock = threading.Lock()
+
+    def add_sent(self, raw, wire):
+        with self._lock:
+            self.sent += raw
+            self.sent_wire += wire
+
+    def add_received(self, raw, wire):
+        with self._lock:
+            self.received += raw
+            self.received_wire += wire
+
+    def summary(self):
+        """
+        :returns: human readable summary of the transferred bytes
+        :rtype: str
+        """
+        def saved(raw, wire):
+            return 100 * (1 - wire / raw) if raw else 0
+
+        return "Sent {:.1f} kB ({:.1f} kB on the wire, {:.0f}% saved), received {:.1f} kB ({:.1f} kB on the wire, {:.0f}% saved)".format(
+            self.sent / 1024, self.sent_wire / 1024, saved(self.sent, self.sent_wire),
+            self.received / 1024, self.received_wire / 1024, saved(self.received, self.received_wire)
+        )
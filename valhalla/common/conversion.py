@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+                                 Valhalla - QGIS plugin
+ QGIS client to query Valhalla APIs
+                              -------------------
+        begin                : 2019-10-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by Nils Nolde
+        email                : nils@gis-ops.com
+ ***************************************************************************/
+
+ This plugin provides access to some of the APIs from Valhalla
+ (https://github.com/valhalla/valhalla), developed and
+ maintained by https://gis-ops.com, Berlin, Germany.
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+# Pure-Python part of building output features, which runs in worker processes.
+# Nothing here may import qgis or PyQt: the workers are plain Python interpreters.
+# Geometries are returned as little-endian WKB, which the main process turns into
+# QgsGeometry with fromWkb(), see process_pool.to_feature().
+
+import struct
+
+from ..utils.convert import decode_polyline6
+
+WKB_POINT = 1
+WKB_LINESTRING = 2
+WKB_POLYGON = 3
+WKB_MULTIPOINT = 4
+
+_HEADER = struct.Struct('<BI')
+_COUNT = struct.Struct('<I')
+
+
+def _coordinates(points):
+    return struct.pack('<{}d'.format(2 * len(points)), *(value for point in points for value in point[:2]))
+
+
+def point_wkb(point):
+    """
+    :param point: x, y coordinates
+    :type point: sequence of float
+
+    :rtype: bytes
+    """
+    return _HEADER.pack(1, WKB_POINT) + _coordinates([point])
+
+
+def linestring_wkb(points):
+    """
+    :param points: x, y coordinates
+    :type points: list of sequence of float
+
+    :rtype: bytes
+    """
+    return _HEADER.pack(1, WKB_LINESTRING) + _COUNT.pack(len(points)) + _coordinates(points)
+
+
+def polygon_wkb(rings):
+    """
+    :param rings: rings of x, y coordinates, exterior ring first
+    :type rings: list of list of sequence of float
+
+    :rtype: bytes
+    """
+    parts = [_HEADER.pack(1, WKB_POLYGON), _COUNT.pack(len(rings))]
+    for ring in rings:
+        parts.append(_COUNT.pack(len(ring)))
+        parts.append(_coordinates(ring))
+
+    return b''.join(parts)
+
+
+def multipoint_wkb(points):
+    """
+    :param points: x, y coordinates
+    :type points: list of sequence of float
+
+    :rtype: bytes
+    """
+    return _HEADER.pack(1, WKB_MULTIPOINT) + _COUNT.pack(len(points)) + b''.join(point_wkb(point) for point in points)
+
+
+def convert_route(legs):
+    """
+    Same as directions_core.get_output_feature_directions_from_legs().
+
+    :param legs: legs of the route's trip
+    :type legs: list of dict
+
+    :returns: route line and its (distance, duration) attributes
+    :rtype: tuple of bytes and tuple
+    """
+    coordinates, distance, duration = [], 0, 0
+    for leg in legs:
+        coordinates.extend((lon, lat) for lat, lon in decode_polyline6(leg['shape']))
+        duration += round(leg['summary']['time'] / 3600, 3)
+        distance += round(leg['summary']['length'], 3)
+
+    return linestring_wkb(coordinates), (distance, duration)
+
+
+def convert_isochrones(features, geometry):
+    """
+    Same as isochrones_core.Isochrones.build_streamed_features().
+
+    :param features: GeoJSON features of the response
+    :type features: list of dict
+
+    :param geometry: output geometry type, 'Polygon' or 'LineString'
+    :type geometry: str
+
+    :returns: isochrones sorted by descending contour with their (contour,)
+        attribute, snapped locations and input locations with their (type,) attribute
+    :rtype: tuple of list of tuple of bytes and tuple
+    """
+    isochrones, multipoints, points = [], [], []
+    for feature in features:
+        geometry_type = feature['geometry']['type']
+        coordinates = feature['geometry']['coordinates']
+        if geometry_type in ('LineString', 'Polygon'):
+            if geometry == 'Polygon':
+                wkb = polygon_wkb(coordinates[:1])
+            elif geometry == 'LineString':
+                wkb = linestring_wkb(coordinates)
+            else:
+                wkb = None
+            isochrones.append((wkb, (float(feature['properties']['contour']),)))
+        elif geometry_type == 'MultiPoint':
+            multipoints.append((multipoint_wkb(coordinates), (feature['properties']['type'],)))
+        elif geometry_type == 'Point':
+            points.append((point_wkb(coordinates), (feature['properties']['type'],)))
+
+    isochrones.sort(key=lambda isochrone: isochrone[1][0], reverse=True)
+
+    return isochrones, multipoints, points
+
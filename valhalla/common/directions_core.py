@@ -34,6 +34,7 @@ from qgis.core import (QgsPointXY,
                        QgsFields,
                        QgsField)
 
+from . import conversion, process_pool, timing
 from ..utils import convert
 
 
@@ -51,18 +52,19 @@ def get_request_point_features(route_dict, row_by_row):
     :rtype: tuple of QgsPointXY and others
     """
 
-    locations_list = list(product(route_dict['start']['geometries'],
-                                  route_dict['end']['geometries']))
-    values_list = list(product(route_dict['start']['values'],
-                               route_dict['end']['values']))
+    # Pairs are built one at a time while they are consumed
+    locations_list = product(route_dict['start']['geometries'],
+                             route_dict['end']['geometries'])
+    values_list = product(route_dict['start']['values'],
+                          route_dict['end']['values'])
 
     # If row-by-row in two-layer mode, then only zip the locations
     if row_by_row == 'Row-by-Row':
-        locations_list = list(zip(route_dict['start']['geometries'],
-                                  route_dict['end']['geometries']))
+        locations_list = zip(route_dict['start']['geometries'],
+                             route_dict['end']['geometries'])
 
-        values_list = list(zip(route_dict['start']['values'],
-                               route_dict['end']['values']))
+        values_list = zip(route_dict['start']['values'],
+                          route_dict['end']['values'])
 
     for properties in zip(locations_list, values_list):
         # Skip if first and last location are the same
@@ -132,18 +134,48 @@ def get_output_feature_directions(response, profile, options=None, from_value=No
     :returns: Ouput feature with attributes and geometry set.
     :rtype: QgsFeature
     """
-    response_mini = response['trip']
+    return get_output_feature_directions_from_legs(response['trip']['legs'], profile, options, from_value, to_value)
+
+
+def get_output_feature_directions_from_legs(legs, profile, options=None, from_value=None, to_value=None, executor=None):
+    """
+    Build output feature from the route legs, which are consumed one at a time,
+    e.g. while a streamed response arrives.
+
+    :param legs: legs of the route's trip
+    :type legs: iterable of dict
+
+    :param profile: Transportation mode being used
+    :type profile: str
+
+    :param options: Costing option being used.
+    :type options: dict
+
+    :param from_value: value of 'FROM_ID' field
+    :type from_value: any
+
+    :param to_value: value of 'TO_ID' field
+    :type to_value: any
+
+    :param executor: process pool to decode the legs in, see process_pool.get_executor()
+    :type executor: ProcessPoolExecutor
+
+    :returns: Ouput feature with attributes and geometry set.
+    :rtype: QgsFeature
+    """
+    if executor is not None:
+        wkb, (distance, duration) = process_pool.run(executor, conversion.convert_route, list(legs))
+        return process_pool.to_feature(wkb, [distance, duration, profile, json.dumps(options), from_value, to_value])
+
     feat = QgsFeature()
-    coordinates, distance, duration = [], 0, 0
-    for leg in response_mini['legs']:
-            coordinates.extend([
-                list(reversed(coord))
-                for coord in convert.decode_polyline6(leg['shape'])
-            ])
-            duration += round(leg['summary']['time'] / 3600, 3)
-            distance += round(leg['summary']['length'], 3)
-
-    qgis_coords = [QgsPointXY(x, y) for x, y in coordinates]
+    qgis_coords, distance, duration = [], 0, 0
+    for leg in legs:
+        with timing.stage(timing.DECODE):
+            shape = convert.decode_polyline6(leg['shape'])
+        qgis_coords.extend([QgsPointXY(lon, lat) for lat, lon in shape])
+        duration += round(leg['summary']['time'] / 3600, 3)
+        distance += round(leg['summary']['length'], 3)
+
     feat.setGeometry(QgsGeometry.fromPolylineXY(qgis_coords))
     feat.setAttributes([distance,
                         duration,
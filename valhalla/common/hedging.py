@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+                                 Valhalla - QGIS plugin
+ QGIS client to query Valhalla APIs
+                              -------------------
+        begin                : 2019-10-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by Nils Nolde
+        email                : nils@gis-ops.com
+ ***************************************************************************/
+
+ This plugin provides access to some of the APIs from Valhalla
+ (https://github.com/valhalla/valhalla), developed and
+ maintained by https://gis-ops.com, Berlin, Germany.
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from qgis.core import QgsFeedback
+
+from .circuit_breaker import is_server_failure
+from ..utils import logger
+
+# Hedges in flight at the same time, all of them share one pool
+MAX_HEDGES = 8
+
+_executor = None
+_executor_lock = threading.Lock()
+_hedge_slots = threading.BoundedSemaphore(MAX_HEDGES)
+
+# Latencies per provider group and endpoint, shared by all clients
+_windows = dict()
+_windows_lock = threading.Lock()
+
+
+class LatencyWindow:
+    """Keeps the latencies of the most recent successful requests."""
+
+    def __init__(self, size=200):
+        self._values = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._values)
+
+    def add(self, seconds):
+        with self._lock:
+            self._values.append(seconds)
+
+    def percentile(self, p):
+        """
+        :param p: percentile between 0 and 100
+        :type p: float
+
+        :returns: the latency at percentile p in seconds, None without values
+        :rtype: float
+        """
+        with self._lock:
+            values = sorted(self._values)
+        if not values:
+            return None
+
+        return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+class Attempt:
+    """A single try to send a request, which can be cancelled."""
+
+    def __init__(self, exclude=()):
+        self.exclude = exclude
+        self.feedback = QgsFeedback()
+        self.base_url = None
+        self.done = False
+
+
+class Hedger:
+    """
+    Re-issues slow requests to another member of a provider group and takes
+    whichever response arrives first. A request is considered slow once it
+    takes longer than the configured percentile of the recent latencies.
+    """
+
+    def __init__(self, pool, settings):
+        """
+        :param pool: pool of the provider group
+        :type pool: ProviderPool
+
+        :param settings: provider's "hedging" settings
+        :type settings: dict
+        """
+        self.pool = pool
+        self.percentile = float(settings.get('percentile') or 95)
+        self.min_delay = float(settings.get('min_delay') or 0.05)
+        self.min_samples = int(settings.get('min_samples') or 20)
+
+    def post(self, send, url, body, timeout):
+        """
+        Sends a request, hedged if enough latencies are known for the endpoint.
+        The request itself is sent from the calling thread, only the hedge
+        runs in the shared pool. Hedges are skipped while the pool is busy.
+
+        :param send: function sending a request, with the signature of Client._post
+        :type send: function
+
+        :returns: response and the base URL it came from
+        :rtype: tuple of QgsNetworkReplyContent and str
+        """
+        window = _get_window(self.pool.name, url)
+        delay = window.percentile(self.percentile) if len(window) >= self.min_samples else None
+        if delay is None or len(self.pool.nodes) < 2:
+            return self._timed(window, send, url, body, timeout, Attempt())
+
+        primary = Attempt()
+        hedges = []
+        lock = threading.Lock()
+
+        def start_hedge():
+            with lock:
+                if primary.done:
+                    return
+                if not _hedge_slots.acquire(blocking=False):
+                    logger.log("Not hedging {} request, {} hedges in flight", 0, url, MAX_HEDGES, per_request=True)
+                    return
+                logger.log("Hedging {} request after {:.3f} secs", 0, url, delay, per_request=True)
+                hedge = Attempt(exclude=(primary.base_url,))
+                hedges.append((hedge, _get_executor().submit(self._hedge, window, send, url, body, timeout, hedge, primary)))
+
+        # The delay starts with the request, not when it was queued
+        timer = threading.Timer(max(delay, self.min_delay), start_hedge)
+        timer.daemon = True
+        timer.start()
+        result, error = None, None
+        try:
+            result = self._timed(window, send, url, body, timeout, primary)
+        except Exception as e:
+            error = e
+        finally:
+            timer.cancel()
+            with lock:
+                primary.done = True
+
+        if not hedges:
+            if error is not None:
+                raise error
+            return result
+
+        hedge, future = hedges[0]
+        if error is None and not primary.feedback.isCanceled() and not is_server_failure(result[0]):
+            hedge.feedback.cancel()
+            return result
+        try:
+            return future.result()
+        except Exception:
+            if error is not None:
+                raise error
+            return result
+
+    def _hedge(self, window, send, url, body, timeout, hedge, primary):
+        try:
+            response, base_url = self._timed(window, send, url, body, timeout, hedge)
+        finally:
+            _hedge_slots.release()
+        if not hedge.feedback.isCanceled() and not is_server_failure(response):
+            # The first good response wins
+            primary.feedback.cancel()
+
+        return response, base_url
+
+    @staticmethod
+    def _timed(window, send, url, body, timeout, attempt):
+        start = time.time()
+        response, base_url = send(url, body, timeout, attempt)
+        if not attempt.feedback.isCanceled() and not is_server_failure(response):
+            window.add(time.time() - start)
+
+        return response, base_url
+
+
+def _get_window(group_name, url):
+    with _windows_lock:
+        return _windows.setdefault((group_name, url), LatencyWindow())
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_HEDGES, thread_name_prefix='valhalla-hedging')
+
+    return _executor
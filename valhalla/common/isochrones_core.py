@@ -40,6 +40,8 @@ from qgis.core import (QgsPointXY,
                        QgsRendererCategory,
                        QgsCategorizedSymbolRenderer)
 
+from . import conversion, process_pool
+
 class Isochrones():
     """convenience class to build isochrones"""
 
@@ -132,25 +134,7 @@ class Isochrones():
         # is added first. This will plot the isochrones on top of each other.
         l = lambda x: x['properties']['contour']
         for isochrone in sorted(features, key=l, reverse=True):
-            feat = QgsFeature()
-            coordinates = isochrone['geometry']['coordinates']
-            iso_value = isochrone['properties']['contour']
-            #metric = isochrone['properties']['metric']
-            if self.geometry == 'Polygon':
-                qgis_coords = [[QgsPointXY(coord[0], coord[1]) for coord in coordinates[0]]]
-                feat.setGeometry(QgsGeometry.fromPolygonXY(qgis_coords))
-            if self.geometry == 'LineString':
-                qgis_coords = [QgsPointXY(coord[0], coord[1]) for coord in coordinates]
-                feat.setGeometry(QgsGeometry.fromPolylineXY(qgis_coords))
-            feat.setAttributes([
-                id_field_value,
-                float(iso_value),
-                self.profile,
-                json.dumps(options),
-                'time'
-            ])
-
-            yield feat
+            yield self._build_isochrone_feature(isochrone, id_field_value, json.dumps(options))
 
     def get_multipoint_features(self, id_field_value):
         """
@@ -164,15 +148,7 @@ class Isochrones():
         """
         multipoints = [feature for feature in self.response['features'] if feature['geometry']['type'] == 'MultiPoint']
         for multipoint in multipoints:
-            feat = QgsFeature()
-            coords = [QgsPointXY(*coords) for coords in multipoint['geometry']['coordinates']]
-            feat.setGeometry(QgsGeometry.fromMultiPointXY(coords))
-            feat.setAttributes([
-                id_field_value,
-                multipoint['properties']['type']
-            ])
-
-            yield feat
+            yield self._build_multipoint_feature(multipoint, id_field_value)
 
     def get_point_features(self, id_field_value):
         """
@@ -186,15 +162,99 @@ class Isochrones():
         """
         points = [feature for feature in self.response['features'] if feature['geometry']['type'] == 'Point']
         for point in points:
-            feat = QgsFeature()
-            coords = QgsPointXY(*point['geometry']['coordinates'])
-            feat.setGeometry(QgsGeometry.fromPointXY(coords))
-            feat.setAttributes([
-                id_field_value,
-                point['properties']['type']
-            ])
-
-            yield feat
+            yield self._build_point_feature(point, id_field_value)
+
+    def build_streamed_features(self, features, id_field_value, options={}, executor=None):
+        """
+        Builds the output features from the GeoJSON features of a response one
+        at a time, e.g. while a streamed response arrives. No set_response() needed.
+
+        :param features: GeoJSON features of the response
+        :type features: iterable of dict
+
+        :param id_field_value: Value of ID field.
+        :type id_field_value: any
+
+        :param options: costing options
+        :type options: dict
+
+        :param executor: process pool to convert the features in, see process_pool.get_executor()
+        :type executor: ProcessPoolExecutor
+
+        :returns: isochrone features sorted by descending contour, snapped locations and input locations
+        :rtype: tuple of list of QgsFeature
+        """
+        options = json.dumps(options)
+        if executor is not None:
+            isochrones, multipoints, points = process_pool.run(
+                executor, conversion.convert_isochrones, list(features), self.geometry
+            )
+            return (
+                [process_pool.to_feature(wkb, [id_field_value, contour, self.profile, options, 'time'])
+                 for wkb, (contour,) in isochrones],
+                [process_pool.to_feature(wkb, [id_field_value, point_type]) for wkb, (point_type,) in multipoints],
+                [process_pool.to_feature(wkb, [id_field_value, point_type]) for wkb, (point_type,) in points]
+            )
+
+        isochrones, multipoints, points = [], [], []
+        for feature in features:
+            geometry_type = feature['geometry']['type']
+            if geometry_type in ('LineString', 'Polygon'):
+                isochrones.append(self._build_isochrone_feature(feature, id_field_value, options))
+            elif geometry_type == 'MultiPoint':
+                multipoints.append(self._build_multipoint_feature(feature, id_field_value))
+            elif geometry_type == 'Point':
+                points.append(self._build_point_feature(feature, id_field_value))
+
+        # Same order as get_features(), longest isochrone first
+        isochrones.sort(key=lambda feat: feat[1], reverse=True)
+
+        return isochrones, multipoints, points
+
+    def _build_isochrone_feature(self, isochrone, id_field_value, options):
+        feat = QgsFeature()
+        coordinates = isochrone['geometry']['coordinates']
+        iso_value = isochrone['properties']['contour']
+        #metric = isochrone['properties']['metric']
+        if self.geometry == 'Polygon':
+            qgis_coords = [[QgsPointXY(coord[0], coord[1]) for coord in coordinates[0]]]
+            feat.setGeometry(QgsGeometry.fromPolygonXY(qgis_coords))
+        if self.geometry == 'LineString':
+            qgis_coords = [QgsPointXY(coord[0], coord[1]) for coord in coordinates]
+            feat.setGeometry(QgsGeometry.fromPolylineXY(qgis_coords))
+        feat.setAttributes([
+            id_field_value,
+            float(iso_value),
+            self.profile,
+            options,
+            'time'
+        ])
+
+        return feat
+
+    @staticmethod
+    def _build_multipoint_feature(multipoint, id_field_value):
+        feat = QgsFeature()
+        coords = [QgsPointXY(*coords) for coords in multipoint['geometry']['coordinates']]
+        feat.setGeometry(QgsGeometry.fromMultiPointXY(coords))
+        feat.setAttributes([
+            id_field_value,
+            multipoint['properties']['type']
+        ])
+
+        return feat
+
+    @staticmethod
+    def _build_point_feature(point, id_field_value):
+        feat = QgsFeature()
+        coords = QgsPointXY(*point['geometry']['coordinates'])
+        feat.setGeometry(QgsGeometry.fromPointXY(coords))
+        feat.setAttributes([
+            id_field_value,
+            point['properties']['type']
+        ])
+
+        return feat
 
     def stylePoly(self, layer, metric: str):
         """
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+                                 Valhalla - QGIS plugin
+ QGIS client to query Valhalla APIs
+                              -------------------
+        begin                : 2019-10-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by Nils Nolde
+        email                : nils@gis-ops.com
+ ***************************************************************************/
+
+ This plugin provides access to some of the APIs from Valhalla
+ (https://github.com/valhalla/valhalla), developed and
+ maintained by https://gis-ops.com, Berlin, Germany.
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import re
+
+from . import codec
+
+_STRUCTURAL = re.compile(rb'["{}\[\]:,]')
+# Contents of a string up to its closing quote, or up to a backslash which
+# escapes the first character of the next chunk
+_STRING_BODY = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*', re.DOTALL)
+
+OBJECT = 0
+ARRAY = 1
+
+
+class ArrayItemParser:
+    """
+    Incremental JSON parser which yields the items of one array in a JSON
+    document while the document arrives in chunks, e.g. the rows of a matrix
+    at path ('sources_to_targets',). Only the current item is kept in memory,
+    the rest of the document is skipped. The items have to be objects or arrays.
+    """
+
+    def __init__(self, path, fields=()):
+        """
+        :param path: object keys leading to the array
+        :type path: tuple of str
+
+        :param fields: top level keys whose values are kept in self.fields,
+            e.g. the "error" of an error response
+        :type fields: tuple of str
+        """
+        self.path = list(path)
+        self.fields = dict()
+        self._field_names = set(fields)
+        self._field_start = None
+        self._buffer = bytearray()
+        # Position up to which the buffer is parsed
+        self._pos = 0
+        self._item_start = None
+        # Start of the string the last chunk ended in
+        self._string_start = None
+        # Frames of [type, last key, expecting a key]
+        self._stack = []
+
+    def feed(self, chunk):
+        """
+        Parses the next chunk of the document. Every byte is scanned once, so
+        large items split over many chunks are parsed in linear time.
+
+        :param chunk: next part of the document
+        :type chunk: bytes
+
+        :returns: the items completed by this chunk
+        :rtype: list
+        """
+        buffer = self._buffer
+        buffer += chunk
+        pos = self._pos
+        stack = self._stack
+        string_start = self._string_start
+        items = []
+
+        while True:
+            if string_start is not None:
+                end = _STRING_BODY.match(buffer, pos).end()
+                if end == len(buffer) or buffer[end] != 0x22:
+                    # Wait for the rest of the string
+                    pos = end
+                    break
+                end += 1
+                if stack and stack[-1][0] == OBJECT and stack[-1][2]:
+                    stack[-1][1] = codec.loads(bytes(buffer[string_start:end]))
+                string_start = None
+                pos = end
+                continue
+
+            match = _STRUCTURAL.search(buffer, pos)
+            if match is None:
+                pos = len(buffer)
+                break
+            i = match.start()
+            char = buffer[i]
+
+            if char == 0x22:  # "
+                string_start = i
+            elif char in (0x7b, 0x5b):  # { [
+                if self._item_start is None and self._at_array():
+                    self._item_start = i
+                stack.append([OBJECT, None, True] if char == 0x7b else [ARRAY, None, False])
+            elif char in (0x7d, 0x5d):  # } ]
+                if self._field_start is not None and len(stack) == 1:
+                    self._end_field(buffer, i)
+                stack.pop()
+                if self._item_start is not None and self._at_array():
+                    items.append(codec.loads(bytes(buffer[self._item_start:i + 1])))
+                    self._item_start = None
+            elif char == 0x2c:  # ,
+                if self._field_start is not None and len(stack) == 1:
+                    self._end_field(buffer, i)
+                if stack and stack[-1][0] == OBJECT:
+                    stack[-1][2] = True
+            elif char == 0x3a:  # :
+                stack[-1][2] = False
+                if len(stack) == 1 and stack[0][1] in self._field_names:
+                    self._field_start = i + 1
+            pos = i + 1
+
+        # Drop what was parsed already, except for the current item and string.
+        # Only once that's most of the buffer, so the copying stays linear
+        keep = min(start for start in (pos, self._item_start, self._field_start, string_start) if start is not None)
+        if keep > len(buffer) // 2:
+            del buffer[:keep]
+            pos -= keep
+            if self._item_start is not None:
+                self._item_start -= keep
+            if self._field_start is not None:
+                self._field_start -= keep
+            if string_start is not None:
+                string_start -= keep
+        self._pos = pos
+        self._string_start = string_start
+
+        return items
+
+    def _end_field(self, buffer, end):
+        self.fields[self._stack[0][1]] = codec.loads(bytes(buffer[self._field_start:end]))
+        self._field_start = None
+
+    def _at_array(self):
+        stack = self._stack
+        if len(stack) != len(self.path) + 1 or stack[-1][0] != ARRAY:
+            return False
+
+        return all(frame[0] == OBJECT and frame[1] == key for frame, key in zip(stack, self.path))
+
+
+def iter_path(document, path):
+    """
+    Iterates the items of an array in an already parsed document, the
+    counterpart to ArrayItemParser for buffered responses.
+
+    :param document: parsed JSON document
+    :type document: dict
+
+    :param path: object keys leading to the array
+    :type path: tuple of str
+    """
+    for key in path:
+        document = document[key]
+
+    return iter(document)
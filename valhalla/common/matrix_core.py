@@ -86,10 +86,49 @@ def get_output_features_matrix(response, profile, options={}, source_attrs=[], d
     :rtype: list of QgsFeature
     """
 
-    feats = []
-    sources = response['sources']
-    targets = response['targets']
-    for o, origin in enumerate(response['sources_to_targets']):
+    return list(iter_output_features_matrix(
+        response['sources_to_targets'],
+        response['sources'],
+        response['targets'],
+        profile,
+        options,
+        source_attrs,
+        destination_attrs
+    ))
+
+
+def iter_output_features_matrix(rows, sources, targets, profile, options={}, source_attrs=[], destination_attrs=[]):
+    """
+    Generator to build the output features row by row, so a streamed response
+    is turned into features while it arrives.
+
+    :param rows: rows of the sources_to_targets matrix, one per source
+    :type rows: iterable of list of dict
+
+    :param sources: source locations with "lon" and "lat"
+    :type sources: list of dict
+
+    :param targets: target locations with "lon" and "lat"
+    :type targets: list of dict
+
+    :param profile: Transportation mode being used
+    :type profile: str
+
+    :param options: Costing options being used.
+    :type options: dict
+
+    :param source_attrs: Attribute values of the source features.
+    :type source_attrs: list of any
+
+    :param destination_attrs: Attribute values of the destination features.
+    :type destination_attrs: list of any
+
+    :returns: Ouput feature with attributes set.
+    :rtype: QgsFeature
+    """
+
+    options = json.dumps(options)
+    for o, origin in enumerate(rows):
         try:
             from_id = source_attrs[o]
         except IndexError:
@@ -114,9 +153,8 @@ def get_output_features_matrix(response, profile, options={}, source_attrs=[], d
                 distance,
                 time,
                 profile,
-                json.dumps(options),
+                options,
                 ]
             )
-            feats.append(feat)
 
-    return feats
+            yield feat
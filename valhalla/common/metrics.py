@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+                                 Valhalla - QGIS plugin
+ QGIS client to query Valhalla APIs
+                              -------------------
+        begin                : 2019-10-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by Nils Nolde
+        email                : nils@gis-ops.com
+ ***************************************************************************/
+
+ This plugin provides access to some of the APIs from Valhalla
+ (https://github.com/valhalla/valhalla), developed and
+ maintained by https://gis-ops.com, Berlin, Germany.
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+
+from collections import Counter, deque
+import csv
+import json
+import threading
+import time
+
+# Latencies kept per provider and endpoint for the percentiles
+MAX_SAMPLES = 10000
+
+FIELDS = [
+    'provider', 'endpoint', 'requests', 'p50', 'p95', 'p99', 'retries', 'rate_limited',
+    'cache_hits', 'bytes_sent', 'bytes_received', 'errors'
+]
+
+
+class EndpointMetrics:
+    """Counters of the requests to one endpoint of one provider."""
+
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.cache_hits = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.errors = Counter()
+        self.latencies = deque(maxlen=MAX_SAMPLES)
+
+    def percentile(self, p):
+        """
+        :param p: percentile between 0 and 100
+        :type p: float
+
+        :returns: latency at percentile p in seconds, None without requests
+        :rtype: float
+        """
+        values = sorted(self.latencies)
+        if not values:
+            return None
+
+        return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+class Registry:
+    """
+    Metrics per provider and endpoint. A client's registry forwards
+    everything to the session-wide registry, so both a single run and the
+    whole QGIS session can be looked at.
+    """
+
+    def __init__(self, parent=None):
+        """
+        :param parent: registry which gets every record as well
+        :type parent: Registry
+        """
+        self.parent = parent
+        self._metrics = dict()
+        self._lock = threading.Lock()
+
+    def _record(self, provider, endpoint, update):
+        with self._lock:
+            update(self._metrics.setdefault((provider, endpoint), EndpointMetrics()))
+        if self.parent is not None:
+            self.parent._record(provider, endpoint, update)
+
+    def record_request(self, provider, endpoint, seconds):
+        """Records a request sent to the provider and its latency."""
+        def update(m):
+            m.requests += 1
+            m.latencies.append(seconds)
+        self._record(provider, endpoint, update)
+
+    def record_bytes(self, provider, endpoint, sent=0, received=0):
+        """Records bytes on the wire."""
+        def update(m):
+            m.bytes_sent += sent
+            m.bytes_received += received
+        self._record(provider, endpoint, update)
+
+    def record_retry(self, provider, endpoint, rate_limited=False):
+        """Records a retried request, rate_limited for HTTP 429."""
+        def update(m):
+            m.retries += 1
+            m.rate_limited += int(rate_limited)
+        self._record(provider, endpoint, update)
+
+    def record_cache_hit(self, provider, endpoint):
+        """Records a response which didn't need a request."""
+        def update(m):
+            m.cache_hits += 1
+        self._record(provider, endpoint, update)
+
+    def record_error(self, provider, endpoint, error):
+        """Records a request which failed for good."""
+        def update(m):
+            m.errors[error.__class__.__name__] += 1
+        self._record(provider, endpoint, update)
+
+    def snapshot(self):
+        """
+        :returns: one row per provider and endpoint with the keys in FIELDS,
+            latencies in seconds
+        :rtype: list of dict
+        """
+        with self._lock:
+            items = sorted(self._metrics.items())
+            return [
+                dict(
+                    provider=provider,
+                    endpoint=endpoint,
+                    requests=m.requests,
+                    p50=m.percentile(50),
+                    p95=m.percentile(95),
+                    p99=m.percentile(99),
+                    retries=m.retries,
+                    rate_limited=m.rate_limited,
+                    cache_hits=m.cache_hits,
+                    bytes_sent=m.bytes_sent,
+                    bytes_received=m.bytes_received,
+                    errors=dict(m.errors)
+                )
+                for (provider, endpoint), m in items
+            ]
+
+    def summary(self):
+        """
+        :returns: one human readable line per provider and endpoint
+        :rtype: list of str
+        """
+        def seconds(value):
+            return '-' if value is None else '{:.2f} s'.format(value)
+
+        lines = []
+        for row in self.snapshot():
+            line = "{} {}: {} requests, p50 {}, p95 {}, p99 {}, {} retries ({} HTTP 429), {} cache hits, {:.1f} kB sent, {:.1f} kB received".format(
+                row['provider'], row['endpoint'], row['requests'],
+                seconds(row['p50']), seconds(row['p95']), seconds(row['p99']),
+                row['retries'], row['rate_limited'], row['cache_hits'],
+                row['bytes_sent'] / 1024, row['bytes_received'] / 1024
+            )
+            if row['errors']:
+                line += ", errors: " + ", ".join("{} {}".format(name, count) for name, count in sorted(row['errors'].items()))
+            lines.append(line)
+
+        return lines
+
+    def dump(self, path):
+        """
+        Writes the snapshot to a file, CSV if the path ends with .csv, else JSON.
+
+        :param path: output file path
+        :type path: str
+        """
+        rows = self.snapshot()
+        if path.lower().endswith('.csv'):
+            with open(path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=FIELDS)
+                writer.writeheader()
+                for row in rows:
+                    writer.writerow(dict(row, errors=';'.join('{}:{}'.format(*e) for e in sorted(row['errors'].items()))))
+        else:
+            with open(path, 'w') as f:
+                json.dump(rows, f, indent=2)
+
+
+class Reporter:
+    """Pushes the metrics of a run to the processing log now and then and at the end."""
+
+    def __init__(self, registry, feedback, path=None, every=60):
+        """
+        :param registry: the run's registry, usually the client's
+        :type registry: Registry
+
+        :param feedback: algorithm's feedback
+        :type feedback: QgsProcessingFeedback
+
+        :param path: file to dump the metrics to at the end, see Registry.dump()
+        :type path: str
+
+        :param every: seconds between summaries
+        :type every: float
+        """
+        self.registry = registry
+        self.feedback = feedback
+        self.path = path
+        self.every = every
+        self._reported = time.monotonic()
+
+    def report(self):
+        """Pushes a summary if the last one is long enough ago."""
+        now = time.monotonic()
+        if now - self._reported < self.every:
+            return
+        self._reported = now
+        for line in self.registry.summary():
+            self.feedback.pushInfo(line)
+
+    def finish(self):
+        """Pushes the final summary and writes the dump, if any."""
+        for line in self.registry.summary():
+            self.feedback.pushInfo(line)
+        if self.path:
+            self.registry.dump(self.path)
+            self.feedback.pushInfo("Metrics written to {}".format(self.path))
+
+
+# Metrics of the whole QGIS session
+session = Registry()
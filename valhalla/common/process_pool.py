@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+                                 Valhalla - QGIS plugin
+ QGIS client to query Valhalla APIs
+                              -------------------
+        begin                : 2019-10-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by Nils Nolde
+        email                : nils@gis-ops.com
+ ***************************************************************************/
+
+ This plugin provides access to some of the APIs from Valhalla
+ (https://github.com/valhalla/valhalla), developed and
+ maintained by https://gis-ops.com, Berlin, Germany.
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import os
+import sys
+import threading
+
+from qgis.core import QgsFeature, QgsGeometry
+
+from ..utils import logger
+
+# The pool lives for the whole QGIS session, starting interpreters is expensive
+_executor = None
+_executor_processes = 0
+_executor_lock = threading.Lock()
+
+
+def python_executable():
+    """
+    Finds the Python interpreter to start the workers with. Inside QGIS
+    sys.executable is usually the QGIS binary, the interpreter sits in sys.exec_prefix.
+
+    :returns: path of the Python interpreter
+    :rtype: str
+    """
+    if os.path.basename(sys.executable).lower().startswith('python'):
+        return sys.executable
+
+    if sys.platform == 'win32':
+        # pythonw doesn't open a console window per worker
+        candidates = [os.path.join(sys.exec_prefix, name) for name in ('pythonw.exe', 'python.exe')]
+    else:
+        candidates = [
+            os.path.join(sys.exec_prefix, 'bin', 'python{}.{}'.format(*sys.version_info[:2])),
+            os.path.join(sys.exec_prefix, 'bin', 'python3')
+        ]
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return candidate
+
+    raise RuntimeError("No Python interpreter found in {} to start worker processes".format(sys.exec_prefix))
+
+
+def get_executor(processes):
+    """
+    Returns the session-wide process pool, which is rebuilt if the number of
+    processes changed or a worker died.
+
+    :param processes: number of worker processes
+    :type processes: int
+
+    :rtype: ProcessPoolExecutor
+    """
+    global _executor, _executor_processes
+    with _executor_lock:
+        if _executor is not None and (_executor_processes != processes or getattr(_executor, '_broken', False)):
+            _executor.shutdown(wait=False)
+            _executor = None
+        if _executor is None:
+            # Forking the QGIS process isn't safe, spawn fresh interpreters instead
+            context = multiprocessing.get_context('spawn')
+            context.set_executable(python_executable())
+            _executor = ProcessPoolExecutor(max_workers=processes, mp_context=context)
+            _executor_processes = processes
+            logger.log("Started pool of {} worker processes", 0, processes)
+
+    return _executor
+
+
+def run(executor, fn, *args):
+    """
+    Runs a function of the conversion module in a worker process and waits for it.
+
+    :param executor: process pool, see get_executor()
+    :type executor: ProcessPoolExecutor
+
+    :param fn: function from the conversion module, the arguments must be picklable
+    :type fn: function
+
+    :returns: the function's result
+    """
+    try:
+        return executor.submit(fn, *args).result()
+    except BrokenProcessPool:
+        # The next get_executor() replaces the pool, this call runs locally
+        logger.log("Worker process died, converting in QGIS instead", 1)
+        return fn(*args)
+
+
+def shutdown():
+    """Stops the worker processes, e.g. when the plugin is unloaded."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+
+
+def to_feature(wkb, attributes):
+    """
+    Builds a feature from a worker's result.
+
+    :param wkb: feature geometry, None for none
+    :type wkb: bytes
+
+    :param attributes: feature attributes
+    :type attributes: list
+
+    :rtype: QgsFeature
+    """
+    feat = QgsFeature()
+    if wkb is not None:
+        geometry = QgsGeometry()
+        geometry.fromWkb(wkb)
+        feat.setGeometry(geometry)
+    feat.setAttributes(list(attributes))
+
+    return feat
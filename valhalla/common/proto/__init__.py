@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+                                 Valhalla - QGIS plugin
+ QGIS client to query Valhalla APIs
+                              -------------------
+        begin                : 2019-10-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by Nils Nolde
+        email                : nils@gis-ops.com
+ ***************************************************************************/
+
+ This plugin provides access to some of the APIs from Valhalla
+ (https://github.com/valhalla/valhalla), developed and
+ maintained by https://gis-ops.com, Berlin, Germany.
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from .valhalla_pb import Api, IsochroneInterval
+from .wire import DecodeError
+
+# Endpoints which can answer with format=pbf
+ENDPOINTS = ('/route', '/sources_to_targets', '/isochrone')
+
+# Unreachable matrix cells
+_MAX_VALUE = 2 ** 31
+
+
+def decode(url, content, post_json):
+    """
+    Decodes a protobuf response to the same structure as its JSON counterpart,
+    so it can be fed to the same converters.
+
+    :param url: endpoint of the request
+    :type url: str
+
+    :param content: serialized valhalla.Api message
+    :type content: bytes
+
+    :param post_json: the request body, some values are only part of the request
+    :type post_json: dict
+
+    :raises DecodeError: when the content isn't a valid message
+
+    :rtype: dict
+    """
+    api = Api.FromString(content)
+    if url == '/route':
+        return _directions_to_dict(api.directions)
+    elif url == '/sources_to_targets':
+        return _matrix_to_dict(api.matrix, post_json)
+    elif url == '/isochrone':
+        return _isochrone_to_dict(api.isochrone)
+
+    raise DecodeError("No protobuf decoder for {}".format(url))
+
+
+def _directions_to_dict(directions):
+    if directions is None or not directions.routes:
+        raise DecodeError("Response has no route")
+
+    legs = [
+        {
+            'shape': leg.shape,
+            'summary': {
+                'length': leg.summary.length if leg.summary else 0,
+                'time': leg.summary.time if leg.summary else 0,
+            }
+        }
+        for leg in directions.routes[0].legs
+    ]
+
+    return {'trip': {'legs': legs}}
+
+
+def _matrix_to_dict(matrix, post_json):
+    if matrix is None:
+        raise DecodeError("Response has no matrix")
+
+    sources = post_json['sources']
+    targets = post_json['targets']
+    rows = []
+    for s in range(len(sources)):
+        row = []
+        for t in range(len(targets)):
+            idx = s * len(targets) + t
+            distance = matrix.distances[idx] if idx < len(matrix.distances) else None
+            time = matrix.times[idx] if idx < len(matrix.times) else None
+            if distance is not None and distance >= _MAX_VALUE:
+                distance = None
+            if time is not None and not 0 <= time < _MAX_VALUE:
+                time = None
+            row.append({
+                'from_index': s,
+                'to_index': t,
+                # JSON reports kilometers, protobuf meters
+                'distance': distance / 1000 if distance is not None else None,
+                'time': time,
+            })
+        rows.append(row)
+
+    return {'sources_to_targets': rows, 'sources': sources, 'targets': targets}
+
+
+def _isochrone_to_dict(isochrone):
+    if isochrone is None:
+        raise DecodeError("Response has no isochrone")
+
+    features = []
+    for interval in isochrone.intervals:
+        metric = 'distance' if interval.metric == IsochroneInterval.DISTANCE else 'time'
+        for contour in interval.contours:
+            rings = [
+                [[geometry.coords[i] / 1e6, geometry.coords[i + 1] / 1e6] for i in range(0, len(geometry.coords) - 1, 2)]
+                for geometry in contour.geometries
+            ]
+            if not rings:
+                continue
+            # Closed rings are polygons, else Valhalla returned lines
+            is_polygon = rings[0][0] == rings[0][-1]
+            features.append({
+                'type': 'Feature',
+                'geometry': {
+                    'type': 'Polygon' if is_polygon else 'LineString',
+                    'coordinates': rings if is_polygon else rings[0],
+                },
+                'properties': {
+                    'contour': interval.threshold,
+                    'metric': metric,
+                }
+            })
+
+    return {'type': 'FeatureCollection', 'features': features}
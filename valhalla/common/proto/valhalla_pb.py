@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+                                 Valhalla - QGIS plugin
+ QGIS client to query Valhalla APIs
+                              -------------------
+        begin                : 2019-10-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by Nils Nolde
+        email                : nils@gis-ops.com
+ ***************************************************************************/
+
+ This plugin provides access to some of the APIs from Valhalla
+ (https://github.com/valhalla/valhalla), developed and
+ maintained by https://gis-ops.com, Berlin, Germany.
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+# Message classes for the parts of Valhalla's protobuf API responses the plugin
+# consumes, mirroring valhalla/proto/{api,directions,matrix,isochrone}.proto.
+# Fields which aren't listed are skipped while parsing.
+
+from .wire import Message
+
+
+class Summary(Message):
+    FIELDS = {
+        1: ('length', 'float', False),
+        2: ('time', 'double', False),
+    }
+
+
+class DirectionsLeg(Message):
+    FIELDS = {
+        1: ('trip_id', 'uint64', False),
+        2: ('leg_id', 'uint32', False),
+        3: ('leg_count', 'uint32', False),
+        5: ('summary', Summary, False),
+        7: ('shape', 'string', False),
+    }
+
+
+class DirectionsRoute(Message):
+    FIELDS = {
+        1: ('legs', DirectionsLeg, True),
+    }
+
+
+class Directions(Message):
+    FIELDS = {
+        1: ('routes', DirectionsRoute, True),
+    }
+
+
+class Matrix(Message):
+    FIELDS = {
+        2: ('distances', 'uint32', True),
+        3: ('times', 'float', True),
+        4: ('from_indices', 'uint32', True),
+        5: ('to_indices', 'uint32', True),
+        7: ('algorithm', 'enum', False),
+    }
+
+
+class IsochroneGeometry(Message):
+    FIELDS = {
+        # lon/lat pairs in fixed precision 1e6
+        1: ('coords', 'sint32', True),
+    }
+
+
+class IsochroneContour(Message):
+    FIELDS = {
+        1: ('geometries', IsochroneGeometry, True),
+    }
+
+
+class IsochroneInterval(Message):
+    # Metric enum
+    TIME = 0
+    DISTANCE = 1
+
+    FIELDS = {
+        1: ('metric', 'enum', False),
+        2: ('threshold', 'float', False),
+        3: ('contours', IsochroneContour, True),
+    }
+
+
+class Isochrone(Message):
+    FIELDS = {
+        1: ('intervals', IsochroneInterval, True),
+    }
+
+
+class Api(Message):
+    FIELDS = {
+        3: ('directions', Directions, False),
+        5: ('matrix', Matrix, False),
+        6: ('isochrone', Isochrone, False),
+    }
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+                                 Valhalla - QGIS plugin
+ QGIS client to query Valhalla APIs
+                              -------------------
+        begin                : 2019-10-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by Nils Nolde
+        email                : nils@gis-ops.com
+ ***************************************************************************/
+
+ This plugin provides access to some of the APIs from Valhalla
+ (https://github.com/valhalla/valhalla), developed and
+ maintained by https://gis-ops.com, Berlin, Germany.
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import struct
+
+# Protobuf wire types
+VARINT = 0
+FIXED64 = 1
+LENGTH_DELIMITED = 2
+FIXED32 = 5
+
+_VARINT_TYPES = ('uint32', 'uint64', 'int32', 'int64', 'sint32', 'sint64', 'bool', 'enum')
+
+
+class DecodeError(Exception):
+    """The buffer isn't a valid protobuf message."""
+    pass
+
+
+def read_varint(buffer, pos):
+    """
+    Reads a base 128 varint.
+
+    :param buffer: message buffer
+    :type buffer: bytes
+
+    :param pos: position of the first byte of the varint
+    :type pos: int
+
+    :returns: the value and the position after the varint
+    :rtype: tuple of int
+    """
+    result, shift = 0, 0
+    while True:
+        try:
+            byte = buffer[pos]
+        except IndexError:
+            raise DecodeError("Truncated varint")
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _zigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def _signed(value, bits):
+    return value - (1 << bits) if value >= 1 << (bits - 1) else value
+
+
+def _convert_varint(value, field_type):
+    if field_type in ('sint32', 'sint64'):
+        return _zigzag(value)
+    elif field_type == 'int32':
+        return _signed(value & 0xffffffff, 32)
+    elif field_type == 'int64':
+        return _signed(value, 64)
+    elif field_type == 'bool':
+        return bool(value)
+
+    return value
+
+
+class Message:
+    """
+    Base class of the message classes. Subclasses list their fields in FIELDS
+    as {number: (name, type, repeated)}, where type is a scalar type name or
+    another Message subclass, like in the .proto file.
+    """
+
+    FIELDS = dict()
+
+    def __init__(self):
+        for name, field_type, repeated in self.FIELDS.values():
+            if repeated:
+                default = []
+            elif isinstance(field_type, type):
+                default = None
+            elif field_type == 'string':
+                default = ''
+            elif field_type == 'bytes':
+                default = b''
+            elif field_type in ('float', 'double'):
+                default = 0.0
+            else:
+                default = 0
+            setattr(self, name, default)
+
+    @classmethod
+    def FromString(cls, buffer):
+        """
+        Parses a serialized message. Unknown fields are skipped.
+
+        :param buffer: serialized message
+        :type buffer: bytes
+
+        :rtype: Message
+        """
+        message = cls()
+        message._parse(memoryview(buffer), 0, len(buffer))
+
+        return message
+
+    def _parse(self, buffer, pos, end):
+        fields = self.FIELDS
+        while pos < end:
+            tag, pos = read_varint(buffer, pos)
+            number, wire_type = tag >> 3, tag & 0x7
+            field = fields.get(number)
+
+            if wire_type == VARINT:
+                value, pos = read_varint(buffer, pos)
+                if field:
+                    self._set(field, _convert_varint(value, field[1]))
+            elif wire_type == FIXED64:
+                if pos + 8 > end:
+                    raise DecodeError("Truncated field {}".format(number))
+                if field:
+                    fmt = '<d' if field[1] == 'double' else '<Q'
+                    self._set(field, struct.unpack_from(fmt, buffer, pos)[0])
+                pos += 8
+            elif wire_type == FIXED32:
+                if pos + 4 > end:
+                    raise DecodeError("Truncated field {}".format(number))
+                if field:
+                    fmt = '<f' if field[1] == 'float' else '<I'
+                    self._set(field, struct.unpack_from(fmt, buffer, pos)[0])
+                pos += 4
+            elif wire_type == LENGTH_DELIMITED:
+                length, pos = read_varint(buffer, pos)
+                if pos + length > end:
+                    raise DecodeError("Truncated field {}".format(number))
+                if field:
+                    self._set_length_delimited(field, buffer, pos, pos + length)
+                pos += length
+            else:
+                raise DecodeError("Unsupported wire type {}".format(wire_type))
+
+    def _set_length_delimited(self, field, buffer, pos, end):
+        name, field_type, repeated = field
+        if isinstance(field_type, type):
+            sub_message = field_type()
+            sub_message._parse(buffer, pos, end)
+            self._set(field, sub_message)
+        elif field_type == 'string':
+            self._set(field, bytes(buffer[pos:end]).decode('utf-8'))
+        elif field_type == 'bytes':
+            self._set(field, bytes(buffer[pos:end]))
+        elif not repeated:
+            raise DecodeError("Field {} isn't packed".format(name))
+        elif field_type in _VARINT_TYPES:
+            # Packed repeated varints
+            values = getattr(self, name)
+            while pos < end:
+                value, pos = read_varint(buffer, pos)
+                values.append(_convert_varint(value, field_type))
+        elif field_type in ('float', 'fixed32'):
+            fmt = '<f' if field_type == 'float' else '<I'
+            getattr(self, name).extend(v[0] for v in struct.iter_unpack(fmt, buffer[pos:end]))
+        elif field_type in ('double', 'fixed64'):
+            fmt = '<d' if field_type == 'double' else '<Q'
+            getattr(self, name).extend(v[0] for v in struct.iter_unpack(fmt, buffer[pos:end]))
+        else:
+            raise DecodeError("Unsupported field type {}".format(field_type))
+
+    def _set(self, field, value):
+        name, _, repeated = field
+        if repeated:
+            getattr(self, name).append(value)
+        else:
+            setattr(self, name, value)
@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+                                 Valhalla - QGIS plugin
+ QGIS client to query Valhalla APIs
+                              -------------------
+        begin                : 2019-10-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by Nils Nolde
+        email                : nils@gis-ops.com
+ ***************************************************************************/
+
+ This plugin provides access to some of the APIs from Valhalla
+ (https://github.com/valhalla/valhalla), developed and
+ maintained by https://gis-ops.com, Berlin, Germany.
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+# Project-scoped store of Valhalla responses. The store is a GeoPackage next
+# to the project file, so it can be loaded as a layer: each response is one
+# feature with the route, the largest isochrone or the request locations as
+# geometry, indexed by a hash of provider, endpoint and request parameters.
+
+from datetime import datetime, timedelta, timezone
+import hashlib
+import os
+import sqlite3
+import struct
+import threading
+
+from qgis.core import QgsProject
+
+from . import codec, compression
+from ..utils import configmanager, convert, logger
+
+TABLE = 'results'
+
+_stores = dict()
+_stores_lock = threading.Lock()
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS gpkg_spatial_ref_sys (
+        srs_name TEXT NOT NULL,
+        srs_id INTEGER PRIMARY KEY,
+        organization TEXT NOT NULL,
+        organization_coordsys_id INTEGER NOT NULL,
+        definition TEXT NOT NULL,
+        description TEXT
+    );
+    CREATE TABLE IF NOT EXISTS gpkg_contents (
+        table_name TEXT NOT NULL PRIMARY KEY,
+        data_type TEXT NOT NULL,
+        identifier TEXT UNIQUE,
+        description TEXT DEFAULT '',
+        last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+        min_x DOUBLE,
+        min_y DOUBLE,
+        max_x DOUBLE,
+        max_y DOUBLE,
+        srs_id INTEGER REFERENCES gpkg_spatial_ref_sys(srs_id)
+    );
+    CREATE TABLE IF NOT EXISTS gpkg_geometry_columns (
+        table_name TEXT NOT NULL REFERENCES gpkg_contents(table_name),
+        column_name TEXT NOT NULL,
+        geometry_type_name TEXT NOT NULL,
+        srs_id INTEGER NOT NULL REFERENCES gpkg_spatial_ref_sys(srs_id),
+        z TINYINT NOT NULL,
+        m TINYINT NOT NULL,
+        PRIMARY KEY (table_name, column_name)
+    );
+    CREATE TABLE IF NOT EXISTS gpkg_extensions (
+        table_name TEXT,
+        column_name TEXT,
+        extension_name TEXT NOT NULL,
+        definition TEXT NOT NULL,
+        scope TEXT NOT NULL,
+        UNIQUE (table_name, column_name, extension_name)
+    );
+    CREATE TABLE IF NOT EXISTS results (
+        fid INTEGER PRIMARY KEY AUTOINCREMENT,
+        geom GEOMETRY,
+        key TEXT NOT NULL UNIQUE,
+        provider TEXT NOT NULL,
+        endpoint TEXT NOT NULL,
+        created DATETIME NOT NULL,
+        response BLOB NOT NULL
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS rtree_results_geom USING rtree(id, minx, maxx, miny, maxy);
+"""
+
+_WGS84 = (
+    'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,AUTHORITY["EPSG","7030"]],'
+    'AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],'
+    'UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],AUTHORITY["EPSG","4326"]]'
+)
+
+
+def request_hash(provider, url, post_json):
+    """
+    Hashes a request like singleflight.request_key(), the "id" parameter is
+    left out because Valhalla only echoes it.
+
+    :param provider: name of the provider
+    :type provider: str
+
+    :param url: URL extension for request
+    :type url: str
+
+    :param post_json: Parameters for POST endpoints
+    :type post_json: dict
+
+    :rtype: str
+    """
+    body = codec.dumps_canonical({key: value for key, value in post_json.items() if key != 'id'})
+
+    return hashlib.sha1(b'\n'.join((provider.encode(), url.encode(), body))).hexdigest()
+
+
+def _response_coordinates(url, post_json, response):
+    """
+    :returns: WKB geometry type and coordinates of the geometry representing a
+        response: the route, the largest isochrone or the request locations
+    :rtype: tuple of int and list
+    """
+    if url in ('/route', '/optimized_route') and response.get('trip'):
+        coordinates = []
+        for leg in response['trip'].get('legs', []):
+            coordinates.extend((lon, lat) for lat, lon in convert.decode_polyline6(leg['shape']))
+        return 2, coordinates
+
+    if url == '/isochrone':
+        isochrones = [f for f in response.get('features', []) if f['geometry']['type'] in ('Polygon', 'LineString')]
+        if isochrones:
+            largest = max(isochrones, key=lambda f: f['properties']['contour'])
+            if largest['geometry']['type'] == 'Polygon':
+                return 3, [tuple(c[:2]) for c in largest['geometry']['coordinates'][0]]
+            return 2, [tuple(c[:2]) for c in largest['geometry']['coordinates']]
+
+    locations = []
+    for name in ('locations', 'sources', 'targets', 'shape'):
+        locations.extend((location['lon'], location['lat']) for location in post_json.get(name) or [])
+
+    return 4, locations
+
+
+def _gpkg_geometry(geometry_type, coordinates):
+    """
+    Encodes a GeoPackage geometry blob, i.e. a header with the envelope
+    followed by little-endian WKB.
+
+    :returns: the blob and the envelope (min x, max x, min y, max y), None
+        for empty geometries
+    :rtype: tuple of bytes and tuple
+    """
+    if not coordinates:
+        # Empty flag set, no envelope
+        return b'GP\x00\x11' + struct.pack('<i', 4326) + struct.pack('<BII', 1, 7, 0), None
+
+    xs = [c[0] for c in coordinates]
+    ys = [c[1] for c in coordinates]
+    envelope = (min(xs), max(xs), min(ys), max(ys))
+    values = struct.pack('<{}d'.format(2 * len(coordinates)), *(v for c in coordinates for v in c[:2]))
+    if geometry_type == 2:
+        wkb = struct.pack('<BII', 1, 2, len(coordinates)) + values
+    elif geometry_type == 3:
+        wkb = struct.pack('<BIII', 1, 3, 1, len(coordinates)) + values
+    else:
+        wkb = struct.pack('<BII', 1, 4, len(coordinates)) + b''.join(
+            struct.pack('<BIdd', 1, 1, c[0], c[1]) for c in coordinates
+        )
+    # Flags: little endian, xy envelope
+    header = b'GP\x00\x03' + struct.pack('<i4d', 4326, *envelope)
+
+    return header + wkb, envelope
+
+
+class ResultStore:
+    """Responses of one project, shared by the processing algorithms and the dialog."""
+
+    def __init__(self, path, max_age_days=None):
+        """
+        :param path: path of the GeoPackage, created if it doesn't exist
+        :type path: str
+
+        :param max_age_days: age after which stored responses aren't used anymore, None for no limit
+        :type max_age_days: float
+        """
+        self.path = path
+        self.max_age = timedelta(days=float(max_age_days)) if max_age_days else None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self.connection:
+            self.connection.execute('PRAGMA application_id = 1196444487')  # 'GPKG'
+            self.connection.execute('PRAGMA user_version = 10200')
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.executescript(_SCHEMA)
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)',
+                [
+                    ('Undefined cartesian SRS', -1, 'NONE', -1, 'undefined', None),
+                    ('Undefined geographic SRS', 0, 'NONE', 0, 'undefined', None),
+                    ('WGS 84 geodetic', 4326, 'EPSG', 4326, _WGS84, None)
+                ]
+            )
+            self.connection.execute(
+                "INSERT OR IGNORE INTO gpkg_contents (table_name, data_type, identifier, description, srs_id) "
+                "VALUES (?, 'features', ?, 'Valhalla responses', 4326)", (TABLE, 'Valhalla results')
+            )
+            self.connection.execute(
+                "INSERT OR IGNORE INTO gpkg_geometry_columns VALUES (?, 'geom', 'GEOMETRY', 4326, 0, 0)", (TABLE,)
+            )
+            # The index is maintained here, GeoPackage triggers need SpatiaLite functions
+            self.connection.execute(
+                "INSERT OR IGNORE INTO gpkg_extensions VALUES (?, 'geom', 'gpkg_rtree_index', "
+                "'http://www.geopackage.org/spec120/#extension_rtree', 'write-only')", (TABLE,)
+            )
+
+    def _is_expired(self, created):
+        return self.max_age is not None and datetime.fromisoformat(created) < datetime.now(timezone.utc) - self.max_age
+
+    def contains(self, provider, url, post_json):
+        """
+        :returns: whether a usable response of a request is stored, without loading it
+        :rtype: bool
+        """
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT created FROM results WHERE key = ?', (request_hash(provider, url, post_json),)
+            ).fetchone()
+
+        return row is not None and not self._is_expired(row[0])
+
+    def get(self, provider, url, post_json):
+        """
+        :returns: the stored response of a request, None if there is none
+        :rtype: dict
+        """
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT created, response FROM results WHERE key = ?', (request_hash(provider, url, post_json),)
+            ).fetchone()
+        if row is None or self._is_expired(row[0]):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        logger.log("Using stored response for {}", 0, url, per_request=True)
+
+        return codec.loads(compression.decompress(row[1], 'gzip'))
+
+    def put(self, provider, url, post_json, response):
+        """Stores the response of a request, replacing an older one."""
+        geometry, envelope = _gpkg_geometry(*_response_coordinates(url, post_json, response))
+        values = (
+            geometry,
+            request_hash(provider, url, post_json),
+            provider,
+            url,
+            datetime.now(timezone.utc).isoformat(),
+            compression.compress(codec.dumps(response))
+        )
+        with self._lock, self.connection:
+            # REPLACE deletes the old row, its index entry goes as well
+            self.connection.execute(
+                'DELETE FROM rtree_results_geom WHERE id IN (SELECT fid FROM results WHERE key = ?)', (values[1],)
+            )
+            cursor = self.connection.execute(
+                'INSERT OR REPLACE INTO results (geom, key, provider, endpoint, created, response) '
+                'VALUES (?, ?, ?, ?, ?, ?)', values
+            )
+            if envelope is not None:
+                self.connection.execute('INSERT INTO rtree_results_geom VALUES (?, ?, ?, ?, ?)', (cursor.lastrowid,) + envelope)
+
+    def query(self, extent, endpoint=None):
+        """
+        Finds the stored responses whose geometry's bounding box intersects
+        an extent, e.g. all routes crossing the map canvas.
+
+        :param extent: extent in WGS84
+        :type extent: QgsRectangle
+
+        :param endpoint: only responses of this endpoint, e.g. '/route'
+        :type endpoint: str
+
+        :returns: dicts with "provider", "endpoint", "created" and "response"
+        :rtype: list of dict
+        """
+        sql = (
+            'SELECT r.provider, r.endpoint, r.created, r.response FROM results r '
+            'JOIN rtree_results_geom i ON i.id = r.fid '
+            'WHERE i.maxx >= ? AND i.minx <= ? AND i.maxy >= ? AND i.miny <= ?'
+        )
+        args = [extent.xMinimum(), extent.xMaximum(), extent.yMinimum(), extent.yMaximum()]
+        if endpoint:
+            sql += ' AND r.endpoint = ?'
+            args.append(endpoint)
+        with self._lock:
+            rows = self.connection.execute(sql, args).fetchall()
+
+        return [
+            dict(provider=provider, endpoint=url, created=created, response=codec.loads(compression.decompress(response, 'gzip')))
+            for provider, url, created, response in rows
+        ]
+
+
+def get_store():
+    """
+    Returns the result store of the current project, if enabled with the
+    "result_store" setting in config.yml. The store's default path is next to
+    the project file, unsaved projects have no store.
+
+    :returns: the store, None if there is none
+    :rtype: ResultStore
+    """
+    settings = configmanager.read_config().get('result_store') or {}
+    if not settings.get('enabled'):
+        return None
+
+    path = settings.get('path')
+    if not path:
+        project = QgsProject.instance()
+        if not project.fileName():
+            return None
+        path = os.path.join(project.absolutePath(), project.baseName() + '_valhalla.gpkg')
+
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            try:
+                store = _stores[path] = ResultStore(path, settings.get('max_age_days'))
+            except sqlite3.Error as e:
+                logger.log("Result store {} can't be opened: {}", 1, path, e)
+                return None
+
+    return store
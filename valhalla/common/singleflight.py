@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+                                 Valhalla - QGIS plugin
+ QGIS client to query Valhalla APIs
+                              -------------------
+        begin                : 2019-10-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by Nils Nolde
+        email                : nils@gis-ops.com
+ ***************************************************************************/
+
+ This plugin provides access to some of the APIs from Valhalla
+ (https://github.com/valhalla/valhalla), developed and
+ maintained by https://gis-ops.com, Berlin, Germany.
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import copy
+import hashlib
+import threading
+
+from . import codec
+
+# Requests in flight, shared by all clients of the QGIS session, e.g. the
+# dialog and processing algorithms running side by side
+_calls = dict()
+_calls_lock = threading.Lock()
+
+
+class _Call:
+    """A request in flight and its outcome."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiters = 0
+        # One copy of the result per waiter, made before they're woken up
+        self.results = []
+        self.error = None
+
+
+def request_key(provider, url, post_json):
+    """
+    Builds the key of a request. The "id" parameter is only echoed by
+    Valhalla, so requests which differ only in their ID share a key, and the
+    parameters are sorted, e.g. the dialog and the processing algorithms set
+    them in a different order.
+
+    :param provider: name of the provider or provider group
+    :type provider: str
+
+    :param url: URL extension for request
+    :type url: str
+
+    :param post_json: Parameters for POST endpoints
+    :type post_json: dict
+
+    :rtype: tuple
+    """
+    body = codec.dumps_canonical({key: value for key, value in post_json.items() if key != 'id'})
+
+    return provider, url, hashlib.sha1(body).hexdigest()
+
+
+def do(key, fn):
+    """
+    Calls fn, unless a call with the same key is in flight already. Then it
+    waits for that call and returns its result or raises its exception.
+
+    :param key: request key, see request_key()
+    :type key: tuple
+
+    :param fn: function sending the request and returning the parsed response
+    :type fn: function
+
+    :returns: the parsed response; every caller gets its own copy, so callers
+        may alter it
+    :rtype: dict
+    """
+    with _calls_lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+        else:
+            call.waiters += 1
+
+    if leader:
+        result = None
+        try:
+            result = fn()
+            return result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with _calls_lock:
+                del _calls[key]
+            if call.error is None:
+                # Copied before anyone gets the result, the leader's caller
+                # may change it as soon as it's returned
+                call.results = [copy.deepcopy(result) for _ in range(call.waiters)]
+            call.done.set()
+
+    call.done.wait()
+    if call.error is not None:
+        raise call.error
+
+    return call.results.pop()
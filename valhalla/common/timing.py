@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+                                 Valhalla - QGIS plugin
+ QGIS client to query Valhalla APIs
+                              -------------------
+        begin                : 2019-10-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by Nils Nolde
+        email                : nils@gis-ops.com
+ ***************************************************************************/
+
+ This plugin provides access to some of the APIs from Valhalla
+ (https://github.com/valhalla/valhalla), developed and
+ maintained by https://gis-ops.com, Berlin, Germany.
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+
+from contextlib import nullcontext
+import contextvars
+import threading
+import time
+
+READ = 'read input'
+TRANSFORM = 'CRS transform'
+BUILD_REQUEST = 'build request'
+NETWORK = 'network'
+PARSE = 'parse response'
+DECODE = 'decode polyline'
+BUILD_FEATURES = 'build features'
+WRITE = 'write output'
+
+STAGES = [READ, TRANSFORM, BUILD_REQUEST, NETWORK, PARSE, DECODE, BUILD_FEATURES, WRITE]
+
+# Timers of the running algorithm, None if stage timings are off. Runs in
+# other threads have their own, the pipeline passes them on to its workers
+_active = contextvars.ContextVar('valhalla_stage_timers', default=None)
+_null = nullcontext()
+_local = threading.local()
+
+
+class StageTimers:
+    """
+    Sums up the time spent in the stages of a run. Stages can be nested, e.g.
+    decoding a polyline while building a feature: every stage counts its own
+    time only, so the stages add up to the time spent in all of them. With
+    concurrent requests the times of all threads are added.
+    """
+
+    def __init__(self):
+        self.totals = dict()
+        self.started = time.perf_counter()
+        self.wall = None
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, calls=1):
+        with self._lock:
+            total = self.totals.setdefault(name, [0.0, 0])
+            total[0] += seconds
+            total[1] += calls
+
+    def stop(self):
+        self.wall = time.perf_counter() - self.started
+
+    def summary(self, features, requests):
+        """
+        :param features: input features of the run
+        :type features: int
+
+        :param requests: requests sent during the run
+        :type requests: int
+
+        :returns: stage breakdown table and throughput as log lines
+        :rtype: list of str
+        """
+        wall = self.wall if self.wall is not None else time.perf_counter() - self.started
+        staged = sum(seconds for seconds, _ in self.totals.values()) or 1
+        names = [name for name in STAGES if name in self.totals] + sorted(set(self.totals) - set(STAGES))
+
+        lines = ["{:<16} {:>10} {:>7} {:>10}".format('Stage', 'Seconds', 'Share', 'Calls')]
+        for name in names:
+            seconds, calls = self.totals[name]
+            lines.append("{:<16} {:>10.3f} {:>6.1f}% {:>10}".format(name, seconds, 100 * seconds / staged, calls))
+        lines.append("{:.1f} secs wall time, {:.1f} features/s, {:.1f} requests/s".format(
+            wall, features / wall if wall else 0, requests / wall if wall else 0
+        ))
+
+        return lines
+
+
+class _Stage:
+    __slots__ = ('timers', 'name', 'start', 'elapsed')
+
+    def __init__(self, timers, name):
+        self.timers = timers
+        self.name = name
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        now = time.perf_counter()
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        if stack:
+            # Pause the enclosing stage
+            parent = stack[-1]
+            parent.elapsed += now - parent.start
+        stack.append(self)
+        self.start = now
+
+        return self
+
+    def __exit__(self, *exc_info):
+        now = time.perf_counter()
+        self.elapsed += now - self.start
+        self.timers.add(self.name, self.elapsed)
+        stack = _local.stack
+        stack.pop()
+        if stack:
+            stack[-1].start = now
+
+
+def stage(name):
+    """
+    Times a stage of the running algorithm::
+
+        with timing.stage(timing.NETWORK):
+            ...
+
+    :param name: stage name, one of STAGES
+    :type name: str
+
+    :returns: context manager, which does nothing if stage timings are off
+    """
+    timers = _active.get()
+    if timers is None:
+        return _null
+
+    return _Stage(timers, name)
+
+
+def enabled():
+    """Whether stage timings are on for the running algorithm."""
+    return _active.get() is not None
+
+
+def timed(name, function):
+    """
+    :returns: the function, timed as a stage if stage timings are on
+    :rtype: function
+    """
+    if _active.get() is None:
+        return function
+
+    def wrapper(*args, **kwargs):
+        with stage(name):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+def activate(enabled):
+    """
+    Switches stage timings on or off for the run which is about to start in
+    the calling thread.
+
+    :param enabled: whether the run is timed
+    :type enabled: bool
+
+    :returns: the timers of the run, None if it isn't timed
+    :rtype: StageTimers
+    """
+    timers = StageTimers() if enabled else None
+    _active.set(timers)
+
+    return timers
+
+
+def deactivate(timers):
+    """Stops the timers of a run, see activate(). Stopping them again does nothing."""
+    if timers is None:
+        return
+    if timers.wall is None:
+        timers.stop()
+    if _active.get() is timers:
+        _active.set(None)
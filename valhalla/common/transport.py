@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+                                 Valhalla - QGIS plugin
+ QGIS client to query Valhalla APIs
+                              -------------------
+        begin                : 2019-10-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by Nils Nolde
+        email                : nils@gis-ops.com
+ ***************************************************************************/
+
+ This plugin provides access to some of the APIs from Valhalla
+ (https://github.com/valhalla/valhalla), developed and
+ maintained by https://gis-ops.com, Berlin, Germany.
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+# Record and replay of the client's network traffic. In record mode every
+# request and its response is appended to an archive with the time it took; in
+# replay mode the responses are served from the archive instead of the
+# network, optionally with the recorded latencies. A batch captured once
+# against a real server can so be run again offline, e.g. to benchmark the
+# client or to reproduce a slow run.
+#
+# The archive is gzipped JSON lines, one gzip member per request, so it stays
+# readable if QGIS dies while recording and new recordings are appended.
+
+import base64
+import gzip
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import zlib
+
+from qgis.PyQt.QtNetwork import QNetworkRequest, QNetworkReply
+
+from .. import BASE_DIR
+from . import compression
+from ..utils import configmanager, logger
+
+RECORD = 'record'
+REPLAY = 'replay'
+
+# Replay without waiting, with each response's own latency or with latencies
+# drawn from all recorded ones of the endpoint
+LATENCY_NONE = 'none'
+LATENCY_RECORDED = 'recorded'
+LATENCY_SAMPLED = 'sampled'
+
+_archives = dict()
+_archives_lock = threading.Lock()
+
+
+def request_key(url, body):
+    """
+    Builds the key of a recorded request from the endpoint and the request
+    parameters without "id", which Valhalla only echoes. The parameters are
+    serialized with sorted keys, so the key doesn't depend on the JSON library.
+
+    :param url: URL extension for request
+    :type url: str
+
+    :param body: uncompressed request body
+    :type body: bytes
+
+    :rtype: str
+    """
+    params = {key: value for key, value in json.loads(body).items() if key != 'id'}
+    serialized = json.dumps(params, sort_keys=True, separators=(',', ':'))
+
+    return hashlib.sha1(b'\n'.join((url.encode(), serialized.encode()))).hexdigest()
+
+
+class ReplayedReply:
+    """A recorded response, with the methods of QgsNetworkReplyContent the client uses."""
+
+    def __init__(self, status_code=None, error=0, error_string='', headers=None, content=b''):
+        """
+        :param status_code: HTTP status code, None if the request failed before
+        :type status_code: int
+
+        :param error: QNetworkReply.NetworkError code, 0 if none
+        :type error: int
+
+        :param error_string: error message
+        :type error_string: str
+
+        :param headers: response headers with lower case names
+        :type headers: dict
+
+        :param content: response body
+        :type content: bytes
+        """
+        self.status_code = status_code
+        self._error = QNetworkReply.NetworkError(error)
+        self._error_string = error_string
+        self.headers = headers or {}
+        self._content = content
+
+    def attribute(self, code):
+        return self.status_code if code == QNetworkRequest.HttpStatusCodeAttribute else None
+
+    def error(self):
+        return self._error
+
+    def errorString(self):
+        return self._error_string
+
+    def rawHeader(self, name):
+        return self.headers.get(bytes(name).decode().lower(), '').encode()
+
+    def rawHeaderList(self):
+        return [name.encode() for name in self.headers]
+
+    def content(self):
+        return self._content
+
+
+class Archive:
+    """
+    Records responses to an archive file or replays them from it. Recorded
+    bodies are stored uncompressed, so they replay with or without the
+    provider's "compression" setting.
+    """
+
+    def __init__(self, path, mode, latency=LATENCY_NONE, seed=0):
+        """
+        :param path: archive file
+        :type path: str
+
+        :param mode: RECORD or REPLAY
+        :type mode: str
+
+        :param latency: how replayed responses are delayed, one of LATENCY_NONE,
+            LATENCY_RECORDED or LATENCY_SAMPLED
+        :type latency: str
+
+        :param seed: seed of the sampled latencies
+        :type seed: int
+        """
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self._random = random.Random(seed)
+        self._file = None
+        # (endpoint, key) -> recorded responses, endpoint -> recorded latencies
+        self._responses = None
+        self._latencies = None
+        self._served = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def replays(self):
+        return self.mode == REPLAY
+
+    def record(self, url, body, response, elapsed, base_url, decompress=False):
+        """
+        Appends a request and its response to the archive.
+
+        :param url: URL extension for request
+        :type url: str
+
+        :param body: uncompressed request body
+        :type body: bytes
+
+        :param response: network response
+        :type response: QgsNetworkReplyContent
+
+        :param elapsed: seconds until the response arrived
+        :type elapsed: float
+
+        :param base_url: server the request was sent to
+        :type base_url: str
+
+        :param decompress: whether the body still has its Content-Encoding,
+            i.e. the client negotiated the compression itself
+        :type decompress: bool
+        """
+        headers = {
+            bytes(name).decode().lower(): bytes(response.rawHeader(name)).decode()
+            for name in response.rawHeaderList()
+        }
+        content = bytes(response.content())
+        encoding = headers.pop('content-encoding', '')
+        if decompress and encoding:
+            try:
+                content = compression.decompress(content, encoding)
+            except (OSError, EOFError, zlib.error):
+                # Truncated by an error, keep it as it was
+                headers['content-encoding'] = encoding
+
+        entry = {
+            'endpoint': url,
+            'key': request_key(url, body),
+            'timestamp': time.time(),
+            'elapsed': elapsed,
+            'base_url': base_url,
+            'request': body.decode(),
+            'status_code': response.attribute(QNetworkRequest.HttpStatusCodeAttribute),
+            'error': int(response.error()),
+            'error_string': response.errorString(),
+            'headers': headers,
+            'content': base64.b64encode(content).decode()
+        }
+        member = gzip.compress(json.dumps(entry).encode() + b'\n', compresslevel=6)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'ab')
+            self._file.write(member)
+            self._file.flush()
+
+    def close(self):
+        """Closes the archive file of a recording, a later record() opens it again."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def replay(self, url, body):
+        """
+        Returns the recorded response of a request. A request recorded more than
+        once, e.g. because it was retried, gets its recorded responses in turn.
+        Unknown requests get a HTTP 404 reply.
+
+        :param url: URL extension for request
+        :type url: str
+
+        :param body: uncompressed request body
+        :type body: bytes
+
+        :rtype: ReplayedReply
+        """
+        key = request_key(url, body)
+        with self._lock:
+            if self._responses is None:
+                self._load()
+            entries = self._responses.get((url, key))
+            if entries:
+                served = self._served.get((url, key), 0)
+                self._served[(url, key)] = served + 1
+                entry = entries[served % len(entries)]
+                if self.latency == LATENCY_RECORDED:
+                    delay = entry['elapsed']
+                elif self.latency == LATENCY_SAMPLED:
+                    delay = self._random.choice(self._latencies[url])
+                else:
+                    delay = 0
+
+        if not entries:
+            logger.log("No recorded response for {} request {} in {}", 1, url, key, self.path)
+            return ReplayedReply(
+                404,
+                QNetworkReply.ContentNotFoundError,
+                "No recorded response in {}".format(self.path)
+            )
+
+        if delay:
+            time.sleep(delay)
+
+        return ReplayedReply(
+            entry['status_code'],
+            entry['error'],
+            entry['error_string'],
+            entry['headers'],
+            base64.b64decode(entry['content'])
+        )
+
+    def _load(self):
+        self._responses = dict()
+        self._latencies = dict()
+        count = 0
+        try:
+            with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self._responses.setdefault((entry['endpoint'], entry['key']), []).append(entry)
+                    self._latencies.setdefault(entry['endpoint'], []).append(entry['elapsed'])
+                    count += 1
+        except FileNotFoundError:
+            logger.log("Replay archive {} doesn't exist", 2, self.path)
+        except (EOFError, OSError, ValueError) as e:
+            # QGIS died while recording, the requests before are fine
+            logger.log("Replay archive {} is truncated after {} requests: {}", 1, self.path, count, e)
+
+        logger.log("Replaying {} recorded requests from {}", 0, count, self.path)
+
+
+def get_transport():
+    """
+    Returns the session-wide archive set up with the "transport" setting in
+    config.yml, with "mode" (record or replay), "archive" (path, relative to
+    the plugin directory), "latency" (none, recorded or sampled) and "seed".
+
+    :returns: the archive, None if requests go to the network as usual
+    :rtype: Archive
+    """
+    settings = configmanager.read_config().get('transport') or {}
+    mode = settings.get('mode')
+    if mode not in (RECORD, REPLAY):
+        shutdown()
+        return None
+
+    path = os.path.expanduser(settings.get('archive') or 'valhalla_requests.jsonl.gz')
+    if not os.path.isabs(path):
+        path = os.path.join(BASE_DIR, path)
+    latency = str(settings.get('latency') or LATENCY_NONE).lower()
+
+    with _archives_lock:
+        # The setting changed, e.g. to another archive
+        for key in [key for key in _archives if key != (mode, path)]:
+            _archives.pop(key).close()
+        archive = _archives.get((mode, path))
+        if archive is None:
+            archive = _archives[(mode, path)] = Archive(path, mode, latency, int(settings.get('seed') or 0))
+            if mode == RECORD:
+                logger.log("Recording requests to {}", 1, path)
+        archive.latency = latency
+
+    return archive
+
+
+def shutdown():
+    """Closes all archives, e.g. when the plugin is unloaded or the transport is switched off."""
+    with _archives_lock:
+        for archive in _archives.values():
+            archive.close()
+        _archives.clear()
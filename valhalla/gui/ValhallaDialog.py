@@ -25,6 +25,8 @@
 """
 import datetime
 import json
+import os.path
+import tempfile
 import webbrowser
 from shutil import which
 
@@ -37,21 +39,20 @@ from qgis.PyQt.QtWidgets import (QAction,
                              QInputDialog,
                              QAbstractButton)
 from qgis.PyQt.QtGui import QIcon, QTextDocument
-from qgis.PyQt.QtCore import QSizeF, QPointF, Qt
+from qgis.PyQt.QtCore import QSizeF, QPointF, Qt, QUrl
 
 from qgis.core import (QgsProject,
                        QgsVectorLayer,
                        QgsTextAnnotation,
                        QgsMapLayerProxyModel)
 from qgis.gui import QgsMapCanvasAnnotationItem
-import processing
 
-from . import resources_rc, trace_attributes_gui
+from . import trace_attributes_gui
 
-from .. import RESOURCE_PREFIX, PLUGIN_NAME, DEFAULT_COLOR, __version__, __email__, __web__, __help__
-from ..utils import exceptions, maptools, logger, configmanager, transform
+from .. import IMG_DIR, PLUGIN_NAME, DEFAULT_COLOR, __version__, __email__, __web__, __help__
+from ..utils import exceptions, maptools, logger, configmanager, profiling, transform
 from ..common import client, directions_core, isochrones_core, matrix_core, gravity_core, trace_attributes_core
-from ..gui import directions_gui, isochrones_gui, matrix_gui, locate_gui, identify_gui
+from ..gui import directions_gui, isochrones_gui, matrix_gui, locate_gui
 from ..gui.common_gui import get_locations
 
 from .ValhallaDialogUI_ui import Ui_ValhallaDialogBase
@@ -80,13 +81,14 @@ def on_about_click(parent):
 
     info = 'Provides access to <a href="https://github.com/valhalla/valhalla" style="color: {0}">Valhalla</a> routing functionalities.<br><br>' \
            '<center>' \
-           '<a href=\"https://gis-ops.com\"><img src=\":/plugins/Valhalla/img/logo_gisops_300.png\"/></a> <br><br>' \
+           '<a href=\"https://gis-ops.com\"><img src=\"{4}\"/></a> <br><br>' \
            '</center>' \
            'Author: Nils Nolde<br>' \
            'Email: <a href="mailto:Nils Nolde <{1}>">{1}</a><br>' \
            'Web: <a href="{2}">{2}</a><br>' \
            'Repo: <a href="https://github.com/gis-ops/valhalla-qgis-plugin">github.com/gis-ops/valhalla-qgis-plugin</a><br>' \
-           'Version: {3}'.format(DEFAULT_COLOR, __email__, __web__, __version__)
+           'Version: {3}'.format(DEFAULT_COLOR, __email__, __web__, __version__,
+                                 QUrl.fromLocalFile(os.path.join(IMG_DIR, 'logo_gisops_300.png')).toString())
 
     QMessageBox.information(
         parent,
@@ -126,7 +128,7 @@ class ValhallaDialogMain:
             :returns: icon object to insert to QAction
             :rtype: QIcon
             """
-            return QIcon(RESOURCE_PREFIX + f)
+            return QIcon(os.path.join(IMG_DIR, f))
 
         icon_plugin = create_icon('icon_valhalla.png')
 
@@ -197,6 +199,8 @@ class ValhallaDialogMain:
         # If not checked, GUI would be rebuilt every time!
         if self.first_start:
             self.first_start = False
+            # The dialog's UI takes its icons from the Qt resources, only register them when needed
+            from . import resources_rc
             self.dlg = ValhallaDialog(self.iface, self.iface.mainWindow())  # setting parent enables modal view
             # Make sure plugin window stays open when OK is clicked by reconnecting the accepted() signal
             self.dlg.global_buttons.accepted.disconnect(self.dlg.accept)
@@ -205,7 +209,7 @@ class ValhallaDialogMain:
             self.dlg.avoidlocation_dropdown.setFilters(QgsMapLayerProxyModel.PointLayer)
             self.dlg.avoidpolygons_dropdown.setFilters(QgsMapLayerProxyModel.PolygonLayer)
 
-            providers = configmanager.read_config()['providers']
+            providers = configmanager.get_providers()
             self.dlg.provider_combo.clear()
             for provider in providers:
                 self.dlg.provider_combo.addItem(provider['name'], provider)
@@ -217,6 +221,24 @@ class ValhallaDialogMain:
     def run_gui_control(self):
         """Slot function for OK button of main dialog."""
 
+        if not self.dlg.profile_run.isChecked():
+            self._run_gui_control()
+            return
+
+        # Next to the project, unsaved projects have no directory
+        directory = self.project.absolutePath() or tempfile.gettempdir()
+        profiler = profiling.Profiler(directory, 'valhalla_' + self.dlg.routing_method.currentText().split()[0])
+        try:
+            with profiler:
+                self._run_gui_control()
+        finally:
+            for path in profiler.paths:
+                logger.log("Profile written to {}", 0, path)
+                self.dlg.debug_text.append("Profile written to {}".format(path))
+
+    def _run_gui_control(self):
+        """Runs the request configured in the main dialog."""
+
         self.dlg: ValhallaDialog
 
         # Associate annotations with map layer, so they get deleted when layer is deleted
@@ -229,7 +251,7 @@ class ValhallaDialogMain:
         self.dlg.annotations = []
 
         provider_id = self.dlg.provider_combo.currentIndex()
-        provider = configmanager.read_config()['providers'][provider_id]
+        provider = configmanager.get_providers()[provider_id]
 
         # if there are no coordinates, throw an error message
         if not self.dlg.routing_fromline_list.count():
@@ -412,6 +434,8 @@ class ValhallaDialogMain:
                     )
                     return
 
+                # lxml is only needed here
+                from . import identify_gui
                 identify = identify_gui.Identify(self.dlg)
                 params = identify.get_locate_parameters()
                 response = clnt.request('/locate', post_json=params)
@@ -506,7 +530,7 @@ class ValhallaDialogMain:
 
         finally:
             # Set URL in debug window
-            clnt_msg += '<a href="{0}">{0}</a><br>Parameters:<br>{1}<br><b>timing</b>: {2:.3f} secs'.format(clnt.url, json.dumps(params, indent=2), clnt.response_time)
+            clnt_msg += '<a href="{0}">{0}</a><br>Parameters:<br>{1}<br><b>timing</b>: {2:.3f} secs<br><b>bytes</b>: {3}'.format(clnt.url, json.dumps(params, indent=2), clnt.response_time, clnt.bytes.summary())
             self.dlg.debug_text.setHtml(clnt_msg)
 
     def _display_error_popup(self, e):
@@ -588,7 +612,7 @@ class ValhallaDialog(QDialog, Ui_ValhallaDialogBase):
     def _on_prov_refresh_click(self):
         """Populates provider dropdown with fresh list from config.yml"""
 
-        providers = configmanager.read_config()['providers']
+        providers = configmanager.get_providers()
         self.provider_combo.clear()
         for provider in providers:
             self.provider_combo.addItem(provider['name'], provider)
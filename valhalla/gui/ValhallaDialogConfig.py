@@ -64,6 +64,7 @@ class ValhallaDialogConfigMain(QDialog, Ui_ValhallaDialogConfigBase):
             current_provider['key'] = box.findChild(QtWidgets.QLineEdit, box.title() + "_key_text").text()
             current_provider['base_url'] = box.findChild(QtWidgets.QLineEdit, box.title() + "_base_url_text").text()
 
+        # Also drops the cached config, so the next algorithm run uses the new settings
         configmanager.write_config(self.temp_config)
         self.close()
 
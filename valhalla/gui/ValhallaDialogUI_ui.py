@@ -925,6 +925,9 @@ class Ui_ValhallaDialogBase(object):
         self.about_button.setIcon(icon5)
         self.about_button.setObjectName("about_button")
         self.horizontalLayout_8.addWidget(self.about_button)
+        self.profile_run = QtWidgets.QCheckBox(self.widget_2)
+        self.profile_run.setObjectName("profile_run")
+        self.horizontalLayout_8.addWidget(self.profile_run)
         self.global_buttons = QtWidgets.QDialogButtonBox(self.widget_2)
         self.global_buttons.setOrientation(QtCore.Qt.Horizontal)
         self.global_buttons.setStandardButtons(QtWidgets.QDialogButtonBox.Cancel|QtWidgets.QDialogButtonBox.Ok)
@@ -1118,4 +1121,6 @@ class Ui_ValhallaDialogBase(object):
         self.debug_text.setPlaceholderText(_translate("ValhallaDialogBase", "Queries and errors will be printed here."))
         self.help_button.setText(_translate("ValhallaDialogBase", "  Help"))
         self.about_button.setText(_translate("ValhallaDialogBase", "About"))
+        self.profile_run.setToolTip(_translate("ValhallaDialogBase", "<html><head/><body><p>Profile the next request with cProfile and tracemalloc. The .pstats file and the allocations report are written next to the QGIS project, or to the temp directory for unsaved projects.</p></body></html>"))
+        self.profile_run.setText(_translate("ValhallaDialogBase", "Profile"))
 from qgis import gui
@@ -40,12 +40,14 @@ from qgis.core import (QgsWkbTypes,
                        QgsProcessingParameterMapLayer,
                        QgsPointXY,
                        )
-from .. import HELP_DIR
-from ... import RESOURCE_PREFIX, __help__
-from ...common import client, directions_core
-from ...utils import configmanager, transform, exceptions,logger
+from .. import HELP_DIR, planning
+from ... import IMG_DIR, __help__
+from ...common import client, codec, directions_core, timing
+from ...utils import configmanager, transform
 from ..costing_params import CostingAuto
-from ..request_builder import get_directions_params, get_avoid_locations
+from ..run_options import RunOptions
+from ..runner import BatchRun
+from ..request_builder import get_directions_params, get_avoid_locations, get_costing_options
 
 class ValhallaRoutePointsLayerCarAlgo(QgsProcessingAlgorithm):
 
@@ -67,12 +69,13 @@ class ValhallaRoutePointsLayerCarAlgo(QgsProcessingAlgorithm):
 
     def __init__(self):
         super(ValhallaRoutePointsLayerCarAlgo, self).__init__()
-        self.providers = configmanager.read_config()['providers']
         self.costing_options = self.COSTING()
+        self.run_options = RunOptions()
 
     def initAlgorithm(self, configuration, p_str=None, Any=None, *args, **kwargs):
 
-        providers = [provider['name'] for provider in self.providers]
+        # Read here rather than in __init__, QGIS instantiates all algorithms at startup
+        providers = [provider['name'] for provider in configmanager.get_providers()]
         self.addParameter(
             QgsProcessingParameterEnum(
                 self.IN_PROVIDER,
@@ -115,7 +118,7 @@ class ValhallaRoutePointsLayerCarAlgo(QgsProcessingAlgorithm):
             )
         )
 
-        advanced = self.costing_options.get_costing_params()
+        advanced = self.costing_options.get_costing_params() + RunOptions.get_run_params()
 
         for p in advanced:
             p.setFlags(p.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
@@ -158,111 +161,124 @@ class ValhallaRoutePointsLayerCarAlgo(QgsProcessingAlgorithm):
         return " ".join(map(lambda x: x.capitalize(), self.ALGO_NAME_LIST))
 
     def icon(self):
-        return QIcon(RESOURCE_PREFIX + 'icon_directions.png')
+        return QIcon(os.path.join(IMG_DIR, 'icon_directions.png'))
 
     def createInstance(self):
         return ValhallaRoutePointsLayerCarAlgo()
 
     def processAlgorithm(self, parameters, context, feedback):
+        with self.run_options.profile(self, parameters, context, feedback):
+            return self._run(parameters, context, feedback)
+
+    def _run(self, parameters, context, feedback):
         # Init ORS client
 
-        providers = configmanager.read_config()['providers']
+        providers = configmanager.get_providers()
         provider = providers[self.parameterAsEnum(parameters, self.IN_PROVIDER, context)]
         clnt = client.Client(provider)
         clnt.overQueryLimit.connect(lambda : feedback.reportError("OverQueryLimit: Retrying..."))
+        # Before the input is read, which is timed as well
+        self.run_options.set_run_options(self, parameters, context)
+        with BatchRun(self.run_options, clnt, feedback, '/route') as run:
 
-        mode = self.MODE_TYPES[self.parameterAsEnum(parameters, self.IN_MODE, context)]
+            mode = self.MODE_TYPES[self.parameterAsEnum(parameters, self.IN_MODE, context)]
 
-        # Get parameter values
-        source = self.parameterAsSource(
-            parameters,
-            self.IN_POINT,
-            context
-        )
+            # Get parameter values
+            source = self.parameterAsSource(
+                parameters,
+                self.IN_POINT,
+                context
+            )
 
-        source_field_name = self.parameterAsString(
-            parameters,
-            self.IN_FIELD,
-            context
-        )
+            source_field_name = self.parameterAsString(
+                parameters,
+                self.IN_FIELD,
+                context
+            )
 
-        avoid_layer = self.parameterAsLayer(
-            parameters,
-            self.IN_AVOID,
-            context
-        )
+            avoid_layer = self.parameterAsLayer(
+                parameters,
+                self.IN_AVOID,
+                context
+            )
 
-        (sink, dest_id) = self.parameterAsSink(parameters, self.OUT, context,
-                                               directions_core.get_fields(from_type=source.fields().field(source_field_name).type(),
-                                                                          from_name=source_field_name,
-                                                                          line=True),
-                                               QgsWkbTypes.LineString,
-                                               QgsCoordinateReferenceSystem(4326))
-        input_points = list()
-        from_values = list()
-        xformer_source = transform.transformToWGS(source.sourceCrs())
-
-        if source.wkbType() == QgsWkbTypes.Point:
-            points = list()
-            for feat in sorted(source.getFeatures(), key=lambda f: f.id()):
-                points.append(xformer_source.transform(QgsPointXY(feat.geometry().asPoint())))
-            input_points.append(points)
-            from_values.append('')
-        elif source.wkbType() == QgsWkbTypes.MultiPoint:
-            # loop through multipoint features
-            for feat in sorted(source.getFeatures(), key=lambda f: f.id()):
-                points = list()
-                for point in feat.geometry().asMultiPoint():
-                    points.append(xformer_source.transform(QgsPointXY(point)))
-                input_points.append(points)
-                from_values.append(feat[source_field_name])
-
-        count = source.featureCount()
-
-        params = dict()
-        if avoid_layer:
-            params['avoid_locations'] = get_avoid_locations(avoid_layer)
-
-        # Sets all advanced parameters as attributes of self.costing_options
-        self.costing_options.set_costing_options(self, parameters, context)
-
-        for num, (points, from_value) in enumerate(zip(input_points, from_values)):
-            # Stop the algorithm if cancel button has been clicked
-            if feedback.isCanceled():
-                break
-
-            params.update(get_directions_params(points, self.PROFILE, self.costing_options, mode))
-            params['id'] = from_value
-
-            try:
-                response = clnt.request('/route', post_json=params)
-            except (exceptions.ApiError) as e:
-                msg = "Feature ID {} caused a {}:\n{}".format(
-                    from_value,
-                    e.__class__.__name__,
-                    str(e))
-                feedback.reportError(msg)
-                logger.log(msg)
-                continue
-
-            except (exceptions.InvalidKey, exceptions.GenericServerError) as e:
-                msg = "{}:\n{}".format(
-                    e.__class__.__name__,
-                    str(e))
-                logger.log(msg)
-                raise
-
-            options = {}
-            if params.get('costing_options'):
-                options = params['costing_options']
-
-            sink.addFeature(directions_core.get_output_feature_directions(
-                response,
-                self.PROFILE,
-                options.get(self.PROFILE),
-                from_value=from_value
-            ))
-
-            feedback.setProgress(int(100.0 / count * num))
+            (sink, dest_id) = self.parameterAsSink(parameters, self.OUT, context,
+                                                   directions_core.get_fields(from_type=source.fields().field(source_field_name).type(),
+                                                                              from_name=source_field_name,
+                                                                              line=True),
+                                                   QgsWkbTypes.LineString,
+                                                   QgsCoordinateReferenceSystem(4326))
+            xformer_source = transform.transformToWGS(source.sourceCrs())
+
+            with timing.stage(timing.READ):
+                if source.wkbType() == QgsWkbTypes.Point:
+                    # All points are one route
+                    rows = planning.read_features(
+                        source,
+                        lambda feat: [xformer_source.transform(QgsPointXY(feat.geometry().asPoint()))]
+                    )
+                    rows = [(sum((location for location, _ in rows), ()), ('',))]
+                elif source.wkbType() == QgsWkbTypes.MultiPoint:
+                    # loop through multipoint features
+                    rows = planning.read_features(
+                        source,
+                        lambda feat: [xformer_source.transform(QgsPointXY(point)) for point in feat.geometry().asMultiPoint()],
+                        [source_field_name]
+                    )
+                else:
+                    rows = []
+
+            run.features = source.featureCount()
+
+            params = dict()
+            if avoid_layer:
+                params['avoid_locations'] = codec.freeze(get_avoid_locations(avoid_layer))
+
+            # Sets all advanced parameters as attributes of self.costing_options
+            self.costing_options.set_costing_options(self, parameters, context)
+            costing_params = codec.freeze(get_costing_options(self.costing_options, self.PROFILE, mode))
+
+            # Multipoints with identical locations are requested once
+            requests = planning.group_features(rows)
+            feedback.pushInfo(planning.describe(len(rows), len(requests)))
+
+            def get_route_params(request):
+                points, values = request
+                route_params = dict(params, **get_directions_params(planning.key_points(points), self.PROFILE, self.costing_options, mode, costing_params))
+                route_params['id'] = values[0][0]
+                return route_params
+
+            def route(request, route_params):
+                options = route_params.get('costing_options') or {}
+
+                # The legs are consumed while they arrive if the provider streams responses
+                legs = clnt.request_items('/route', ('trip', 'legs'), post_json=route_params)
+                with timing.stage(timing.BUILD_FEATURES):
+                    feat = directions_core.get_output_feature_directions_from_legs(
+                        legs,
+                        self.PROFILE,
+                        options.get(self.PROFILE),
+                        from_value=route_params['id'],
+                        executor=self.run_options.executor
+                    )
+
+                    return [(0, list(planning.fan_out(feat, (4,), request[1])))]
+
+            # Finished requests of an earlier run are written from the journal instead of being sent again
+            run.open_journal(
+                algorithm=self.name(),
+                provider=provider['name'],
+                mode=mode,
+                params=params,
+                costing=costing_params,
+                fields=[source_field_name]
+            )
+            run.run(
+                requests,
+                get_route_params,
+                route,
+                [sink],
+                lambda request: "Feature ID {}".format(request[1][0][0])
+            )
 
         return {self.OUT: dest_id}
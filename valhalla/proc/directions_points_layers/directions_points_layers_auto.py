@@ -38,12 +38,14 @@ from qgis.core import (QgsWkbTypes,
                        QgsProcessingParameterFeatureSink,
                        QgsProcessingParameterDefinition,
                        )
-from .. import HELP_DIR
-from ... import RESOURCE_PREFIX, __help__
-from ...common import client, directions_core
-from ...utils import configmanager, transform, exceptions,logger
+from .. import HELP_DIR, planning
+from ... import IMG_DIR, __help__
+from ...common import client, codec, directions_core, timing
+from ...utils import configmanager, transform
 from ..costing_params import CostingAuto
-from ..request_builder import get_directions_params, get_avoid_locations
+from ..run_options import RunOptions
+from ..runner import BatchRun
+from ..request_builder import get_directions_params, get_avoid_locations, get_costing_options
 
 
 class ValhallaRoutePointsLayersCarAlgo(QgsProcessingAlgorithm):
@@ -70,12 +72,13 @@ class ValhallaRoutePointsLayersCarAlgo(QgsProcessingAlgorithm):
 
     def __init__(self):
         super(ValhallaRoutePointsLayersCarAlgo, self).__init__()
-        self.providers = configmanager.read_config()['providers']
         self.costing_options = self.COSTING()
+        self.run_options = RunOptions()
 
     def initAlgorithm(self, configuration, p_str=None, Any=None, *args, **kwargs):
 
-        providers = [provider['name'] for provider in self.providers]
+        # Read here rather than in __init__, QGIS instantiates all algorithms at startup
+        providers = [provider['name'] for provider in configmanager.get_providers()]
         self.addParameter(
             QgsProcessingParameterEnum(
                 self.IN_PROVIDER,
@@ -143,7 +146,7 @@ class ValhallaRoutePointsLayersCarAlgo(QgsProcessingAlgorithm):
             )
         )
 
-        advanced = self.costing_options.get_costing_params()
+        advanced = self.costing_options.get_costing_params() + RunOptions.get_run_params()
 
         for p in advanced:
             p.setFlags(p.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
@@ -186,129 +189,143 @@ class ValhallaRoutePointsLayersCarAlgo(QgsProcessingAlgorithm):
         return " ".join(map(lambda x: x.capitalize(), self.ALGO_NAME_LIST))
 
     def icon(self):
-        return QIcon(RESOURCE_PREFIX + 'icon_directions.png')
+        return QIcon(os.path.join(IMG_DIR, 'icon_directions.png'))
 
     def createInstance(self):
         return ValhallaRoutePointsLayersCarAlgo()
 
     def processAlgorithm(self, parameters, context, feedback):
+        with self.run_options.profile(self, parameters, context, feedback):
+            return self._run(parameters, context, feedback)
+
+    def _run(self, parameters, context, feedback):
 
         # Init ORS client
 
-        providers = configmanager.read_config()['providers']
+        providers = configmanager.get_providers()
         provider = providers[self.parameterAsEnum(parameters, self.IN_PROVIDER, context)]
         clnt = client.Client(provider)
         clnt.overQueryLimit.connect(lambda : feedback.reportError("OverQueryLimit: Retrying..."))
+        # Before the input is read, which is timed as well
+        self.run_options.set_run_options(self, parameters, context)
+        with BatchRun(self.run_options, clnt, feedback, '/route') as run:
 
-        mode = self.MODE_TYPES[self.parameterAsEnum(parameters, self.IN_MODE, context)]
-
-        # Get parameter values
-        source = self.parameterAsSource(
-            parameters,
-            self.IN_START,
-            context
-        )
-        source_field_name = self.parameterAsString(
-            parameters,
-            self.IN_START_FIELD,
-            context
-        )
-        destination = self.parameterAsSource(
-            parameters,
-            self.IN_END,
-            context
-        )
-        destination_field_name = self.parameterAsString(
-            parameters,
-            self.IN_END_FIELD,
-            context
-        )
-
-        matrix_mode = self.MODE_SELECTION[self.parameterAsEnum(
-            parameters,
-            self.IN_MATRIX_MODE,
-            context
-        )]
+            mode = self.MODE_TYPES[self.parameterAsEnum(parameters, self.IN_MODE, context)]
 
-        avoid_layer = self.parameterAsLayer(
-            parameters,
-            self.IN_AVOID,
-            context
-        )
+            # Get parameter values
+            source = self.parameterAsSource(
+                parameters,
+                self.IN_START,
+                context
+            )
+            source_field_name = self.parameterAsString(
+                parameters,
+                self.IN_START_FIELD,
+                context
+            )
+            destination = self.parameterAsSource(
+                parameters,
+                self.IN_END,
+                context
+            )
+            destination_field_name = self.parameterAsString(
+                parameters,
+                self.IN_END_FIELD,
+                context
+            )
 
-        # Get fields from field name
-        source_field_id = source.fields().lookupField(source_field_name)
-        source_field = source.fields().field(source_field_id)
-        destination_field_id = destination.fields().lookupField(destination_field_name)
-        destination_field = destination.fields().field(destination_field_id)
+            matrix_mode = self.MODE_SELECTION[self.parameterAsEnum(
+                parameters,
+                self.IN_MATRIX_MODE,
+                context
+            )]
 
-        route_dict = self._get_route_dict(
-            source,
-            source_field,
-            destination,
-            destination_field
-        )
+            avoid_layer = self.parameterAsLayer(
+                parameters,
+                self.IN_AVOID,
+                context
+            )
 
-        if matrix_mode == 'Row-by-Row':
-            route_count = min([source.featureCount(), destination.featureCount()])
-        else:
-            route_count = source.featureCount() * destination.featureCount()
-
-        (sink, dest_id) = self.parameterAsSink(parameters, self.OUT, context,
-                                               directions_core.get_fields(source_field.type(), destination_field.type()),
-                                               QgsWkbTypes.LineString,
-                                               QgsCoordinateReferenceSystem(4326))
-
-        counter = 0
-
-        params = dict()
-        if avoid_layer:
-            params['avoid_locations'] = get_avoid_locations(avoid_layer)
-
-        # Sets all advanced parameters as attributes of self.costing_options
-        self.costing_options.set_costing_options(self, parameters, context)
-
-        for points, values in directions_core.get_request_point_features(route_dict, matrix_mode):
-            # Stop the algorithm if cancel button has been clicked
-            if feedback.isCanceled():
-                break
-
-            params.update(get_directions_params(points, self.PROFILE, self.costing_options, mode))
-            params['id'] = f"{values[0]} & {values[1]}"
-
-            try:
-                response = clnt.request('/route', post_json=params)
-            except (exceptions.ApiError) as e:
-                msg = "Route from {} to {} caused a {}:\n{}".format(
-                    values[0],
-                    values[1],
-                    e.__class__.__name__,
-                    str(e))
-                feedback.reportError(msg)
-                logger.log(msg)
-                continue
-
-            except (exceptions.InvalidKey, exceptions.GenericServerError) as e:
-                msg = "{}:\n{}".format(
-                    e.__class__.__name__,
-                    str(e))
-                logger.log(msg)
-                raise
-
-            options = {}
-            if params.get('costing_options'):
-                options = params['costing_options']
-
-            sink.addFeature(directions_core.get_output_feature_directions(
-                response,
-                self.PROFILE,
-                options.get(self.PROFILE),
-                from_value=values[0],
-                to_value=values[1]
-            ))
-
-            counter += 1
-            feedback.setProgress(int(100.0 / route_count * counter))
+            # Get fields from field name
+            source_field_id = source.fields().lookupField(source_field_name)
+            source_field = source.fields().field(source_field_id)
+            destination_field_id = destination.fields().lookupField(destination_field_name)
+            destination_field = destination.fields().field(destination_field_id)
+
+            with timing.stage(timing.READ):
+                route_dict = self._get_route_dict(
+                    source,
+                    source_field,
+                    destination,
+                    destination_field
+                )
+
+            if matrix_mode == 'Row-by-Row':
+                run.features = min([source.featureCount(), destination.featureCount()])
+            else:
+                run.features = source.featureCount() * destination.featureCount()
+
+            (sink, dest_id) = self.parameterAsSink(parameters, self.OUT, context,
+                                                   directions_core.get_fields(source_field.type(), destination_field.type()),
+                                                   QgsWkbTypes.LineString,
+                                                   QgsCoordinateReferenceSystem(4326))
+
+            params = dict()
+            if avoid_layer:
+                params['avoid_locations'] = codec.freeze(get_avoid_locations(avoid_layer))
+
+            # Sets all advanced parameters as attributes of self.costing_options
+            self.costing_options.set_costing_options(self, parameters, context)
+            costing_params = codec.freeze(get_costing_options(self.costing_options, self.PROFILE, mode))
+
+            # Identical OD pairs are requested once, the route is copied to all of them
+            requests = planning.group_features(
+                (planning.location_key(points), values)
+                for points, values in directions_core.get_request_point_features(route_dict, matrix_mode)
+            )
+            feedback.pushInfo(planning.describe(sum(len(values) for _, values in requests), len(requests)))
+
+            def get_route_params(request):
+                points, values = request
+                route_params = dict(params, **get_directions_params(planning.key_points(points), self.PROFILE, self.costing_options, mode, costing_params))
+                route_params['id'] = f"{values[0][0]} & {values[0][1]}"
+                return route_params
+
+            def route(request, route_params):
+                from_value, to_value = request[1][0]
+                options = route_params.get('costing_options') or {}
+
+                # The legs are consumed while they arrive if the provider streams responses
+                legs = clnt.request_items('/route', ('trip', 'legs'), post_json=route_params)
+                with timing.stage(timing.BUILD_FEATURES):
+                    feat = directions_core.get_output_feature_directions_from_legs(
+                        legs,
+                        self.PROFILE,
+                        options.get(self.PROFILE),
+                        from_value=from_value,
+                        to_value=to_value,
+                        executor=self.run_options.executor
+                    )
+
+                    return [(0, list(planning.fan_out(feat, (4, 5), request[1])))]
+
+            # Finished requests of an earlier run are written from the journal instead of being sent again
+            run.open_journal(
+                algorithm=self.name(),
+                provider=provider['name'],
+                mode=mode,
+                params=params,
+                costing=costing_params,
+                fields=[source_field_name, destination_field_name],
+                matrix_mode=matrix_mode
+            )
+            run.run(
+                requests,
+                get_route_params,
+                route,
+                [sink],
+                lambda request: "Route from {} to {}".format(*request[1][0])
+            )
 
         return {self.OUT: dest_id}
 
@@ -328,23 +345,34 @@ class ValhallaRoutePointsLayersCarAlgo(QgsProcessingAlgorithm):
         :param destination_field: ID field to layer.
         :type destination_field: QgsField
 
-        :returns: route_dict with coordinates and ID values
+        :returns: route_dict with (lon, lat) tuples and ID values
         :rtype: dict
         """
         route_dict = dict()
 
-        source_feats = list(source.getFeatures())
+        # Only the locations and IDs are kept, not the features
         xformer_source = transform.transformToWGS(source.sourceCrs())
+        source_rows = planning.read_features(
+            source,
+            lambda feat: [xformer_source.transform(feat.geometry().asPoint())],
+            [source_field.name()],
+            by_id=False
+        )
         route_dict['start'] = dict(
-            geometries=[xformer_source.transform(feat.geometry().asPoint()) for feat in source_feats],
-            values= [feat.attribute(source_field.name()) for feat in source_feats],
+            geometries=[location[0] for location, _ in source_rows],
+            values=[values[0] for _, values in source_rows],
         )
 
-        destination_feats = list(destination.getFeatures())
         xformer_destination = transform.transformToWGS(destination.sourceCrs())
+        destination_rows = planning.read_features(
+            destination,
+            lambda feat: [xformer_destination.transform(feat.geometry().asPoint())],
+            [destination_field.name()],
+            by_id=False
+        )
         route_dict['end'] = dict(
-            geometries=[xformer_destination.transform(feat.geometry().asPoint()) for feat in destination_feats],
-            values= [feat.attribute(destination_field.name()) for feat in destination_feats],
+            geometries=[location[0] for location, _ in destination_rows],
+            values=[values[0] for _, values in destination_rows],
         )
 
         return route_dict
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+                                 Valhalla - QGIS plugin
+ QGIS client to query Valhalla APIs
+                              -------------------
+        begin                : 2019-10-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by Nils Nolde
+        email                : nils@gis-ops.com
+ ***************************************************************************/
+
+ This plugin provides access to some of the APIs from Valhalla
+ (https://github.com/valhalla/valhalla), developed and
+ maintained by https://gis-ops.com, Berlin, Germany.
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+
+import random
+import time
+
+from ..common import codec
+from ..utils import exceptions, logger
+
+# Same sample for the same requests, so estimates of a run can be compared
+SAMPLE_SEED = 0
+
+
+class Estimate:
+    """
+    Request plan of a run, which is reported instead of sending the requests:
+    request counts, body sizes, expected cache hits and a runtime projected
+    from a small sample of real requests. The sample is drawn from all
+    requests to send, not only the first ones in the request order.
+    """
+
+    def __init__(self, clnt, url, sample_size=0, concurrency=1):
+        """
+        :param clnt: client the run would use
+        :type clnt: Client
+
+        :param url: endpoint of the requests, e.g. '/route'
+        :type url: str
+
+        :param sample_size: requests to send to measure the latency, 0 for none
+        :type sample_size: int
+
+        :param concurrency: concurrent requests of the run
+        :type concurrency: int
+        """
+        self.clnt = clnt
+        self.url = url
+        self.sample_size = sample_size
+        self.concurrency = max(concurrency, 1)
+
+        self.requests = 0
+        self.journaled = 0
+        self.stored = 0
+        self.sizes = []
+        self.layout = []
+        self._sample = []
+        self._random = random.Random(SAMPLE_SEED)
+
+    def add(self, post_json):
+        """
+        Adds a planned request.
+
+        :param post_json: request body as it would be sent
+        :type post_json: dict
+        """
+        self.requests += 1
+        store = self.clnt.store
+        if store is not None and store.contains(self.clnt.provider_name, self.url, post_json):
+            self.stored += 1
+            return
+
+        self.sizes.append(len(codec.dumps(post_json)))
+        # Reservoir sampling, every request to send is sampled with the same probability
+        if len(self._sample) < self.sample_size:
+            self._sample.append(post_json)
+        else:
+            slot = self._random.randrange(len(self.sizes))
+            if slot < self.sample_size:
+                self._sample[slot] = post_json
+
+    def add_journaled(self, count):
+        """
+        Adds requests whose outputs come from the checkpoint journal.
+
+        :param count: number of requests
+        :type count: int
+        """
+        self.requests += count
+        self.journaled += count
+
+    def describe(self, line):
+        """Adds a line about the request layout, e.g. the tiles of a matrix."""
+        self.layout.append(line)
+
+    def measure(self):
+        """
+        Sends the sample requests.
+
+        :returns: latencies of the successful sample requests in seconds
+        :rtype: list of float
+        """
+        latencies = []
+        for post_json in self._sample:
+            start = time.perf_counter()
+            try:
+                self.clnt.request(self.url, post_json=post_json)
+            except (exceptions.ApiError, exceptions.GenericServerError, exceptions.Timeout) as e:
+                logger.log("Sample request for the estimate failed: {}", 1, e)
+                continue
+            latencies.append(time.perf_counter() - start)
+
+        return latencies
+
+    def report(self, feedback):
+        """
+        Sends the sample requests and reports the plan to the processing log.
+
+        :param feedback: algorithm's feedback
+        :type feedback: QgsProcessingFeedback
+        """
+        to_send = len(self.sizes)
+        feedback.pushInfo("Estimate only, no output is written")
+        feedback.pushInfo("{} {} requests: {} expected cache hits ({} from the journal, {} from the result store), {} to send".format(
+            self.requests, self.url, self.journaled + self.stored, self.journaled, self.stored, to_send
+        ))
+        if to_send:
+            feedback.pushInfo("Request bodies: {:.1f} kB in total, {:.0f} bytes on average, {} bytes at most".format(
+                sum(self.sizes) / 1024, sum(self.sizes) / to_send, max(self.sizes)
+            ))
+        for line in self.layout:
+            feedback.pushInfo(line)
+
+        if not self._sample:
+            if to_send:
+                feedback.pushInfo("No sample requests were sent, the runtime isn't projected")
+            return
+
+        latencies = sorted(self.measure())
+        if not latencies:
+            feedback.reportError("All sample requests failed, the runtime isn't projected")
+            return
+
+        mean = sum(latencies) / len(latencies)
+        p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+        # The sampled responses are in the result store if it's enabled
+        remaining = to_send - len(latencies) if self.clnt.store is not None else to_send
+        feedback.pushInfo("Sampled {} requests: {:.2f} s on average, {:.2f} s at p95".format(len(latencies), mean, p95))
+        feedback.pushInfo("Projected runtime: about {} with {} concurrent requests".format(
+            _format_duration(remaining * mean / self.concurrency), self.concurrency
+        ))
+
+
+def _format_duration(seconds):
+    if seconds < 120:
+        return "{:.0f} s".format(seconds)
+    if seconds < 7200:
+        return "{:.0f} min".format(seconds / 60)
+    return "{:.1f} h".format(seconds / 3600)
@@ -24,8 +24,6 @@
  ***************************************************************************/
 """
 import os.path
-from copy import deepcopy
-from typing import Optional
 
 from PyQt5.QtGui import QIcon
 
@@ -45,12 +43,14 @@ from qgis.core import (QgsWkbTypes,
                        QgsProcessingOutputVectorLayer,
 QgsProcessingContext
                        )
-from .. import HELP_DIR
-from ... import RESOURCE_PREFIX, __help__
-from ...common import client, isochrones_core
-from ...utils import configmanager, transform, exceptions,logger
+from .. import HELP_DIR, planning
+from ... import IMG_DIR, __help__
+from ...common import client, codec, isochrones_core, timing
+from ...utils import configmanager, transform
 from ..costing_params import CostingAuto
-from ..request_builder import get_directions_params, get_avoid_locations
+from ..run_options import RunOptions
+from ..runner import BatchRun
+from ..request_builder import get_directions_params, get_avoid_locations, get_costing_options
 
 
 class ValhallaIsochronesCarAlgo(QgsProcessingAlgorithm):
@@ -92,14 +92,15 @@ class ValhallaIsochronesCarAlgo(QgsProcessingAlgorithm):
 
     def __init__(self):
         super(ValhallaIsochronesCarAlgo, self).__init__()
-        self.providers = configmanager.read_config()['providers']
         self.costing_options = self.COSTING()
+        self.run_options = RunOptions()
         self.intervals = None  # will be populated with the intervals available
         self.isos_time_id, self.isos_dist_id, self.points_input_id, self.points_snapped_id = None, None, None, None
 
 
     def initAlgorithm(self, configuration, p_str=None, Any=None, *args, **kwargs):
-        providers = [provider['name'] for provider in self.providers]
+        # Read here rather than in __init__, QGIS instantiates all algorithms at startup
+        providers = [provider['name'] for provider in configmanager.get_providers()]
         self.addParameter(
             QgsProcessingParameterEnum(
                 self.IN_PROVIDER,
@@ -194,7 +195,7 @@ class ValhallaIsochronesCarAlgo(QgsProcessingAlgorithm):
             )
         )
 
-        advanced = self.costing_options.get_costing_params()
+        advanced = self.costing_options.get_costing_params() + RunOptions.get_run_params()
 
         for p in advanced:
             p.setFlags(p.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
@@ -261,175 +262,195 @@ class ValhallaIsochronesCarAlgo(QgsProcessingAlgorithm):
         return " ".join(map(lambda x: x.capitalize(), self.ALGO_NAME_LIST))
 
     def icon(self):
-        return QIcon(RESOURCE_PREFIX + 'icon_isochrones.png')
+        return QIcon(os.path.join(IMG_DIR, 'icon_isochrones.png'))
 
     def createInstance(self):
         return ValhallaIsochronesCarAlgo()
 
     def processAlgorithm(self, parameters, context, feedback):
+        with self.run_options.profile(self, parameters, context, feedback):
+            return self._run(parameters, context, feedback)
+
+    def _run(self, parameters, context, feedback):
         # Init ORS client
-        providers = configmanager.read_config()['providers']
+        providers = configmanager.get_providers()
         provider = providers[self.parameterAsEnum(parameters, self.IN_PROVIDER, context)]
         clnt = client.Client(provider)
         clnt.overQueryLimit.connect(lambda : feedback.reportError("OverQueryLimit: Retrying..."))
+        # Before the input is read, which is timed as well
+        self.run_options.set_run_options(self, parameters, context)
+        with BatchRun(self.run_options, clnt, feedback, '/isochrone') as run:
 
-        params = dict()
-
-        geometry_param = self.GEOMETRY_TYPES[self.parameterAsEnum(parameters, self.IN_GEOMETRY, context)]
-        params[self.IN_GEOMETRY] = True if geometry_param == 'Polygon' else False
+            params = dict()
 
-        mode = self.MODE_TYPES[self.parameterAsEnum(parameters, self.IN_MODE, context)]
+            geometry_param = self.GEOMETRY_TYPES[self.parameterAsEnum(parameters, self.IN_GEOMETRY, context)]
+            params[self.IN_GEOMETRY] = True if geometry_param == 'Polygon' else False
 
-        source = self.parameterAsSource(parameters, self.IN_POINTS, context)
-        if source.wkbType() == 4:
-            raise QgsProcessingException("TypeError: Multipoint Layers are not accepted. Please convert to single geometry layer.")
+            mode = self.MODE_TYPES[self.parameterAsEnum(parameters, self.IN_MODE, context)]
 
-        # Get ID field properties
-        id_field_name = self.parameterAsString(parameters, self.IN_FIELD, context)
-        id_field_id = source.fields().lookupField(id_field_name)
-        if id_field_name == '':
-            id_field_id = 0
-            id_field_name = source.fields().field(id_field_id).name()
-        id_field = source.fields().field(id_field_id)
+            source = self.parameterAsSource(parameters, self.IN_POINTS, context)
+            if source.wkbType() == 4:
+                raise QgsProcessingException("TypeError: Multipoint Layers are not accepted. Please convert to single geometry layer.")
 
-        # Populate iso_layer instance with parameters
-        self.isochrones.set_parameters(self.PROFILE, geometry_param, id_field.type(), id_field_name)
+            # Get ID field properties
+            id_field_name = self.parameterAsString(parameters, self.IN_FIELD, context)
+            id_field_id = source.fields().lookupField(id_field_name)
+            if id_field_name == '':
+                id_field_id = 0
+                id_field_name = source.fields().field(id_field_id).name()
+            id_field = source.fields().field(id_field_id)
 
-        layer_time = QgsVectorLayer(
-            f'{geometry_param}?crs=EPSG:4326',
-            f'Isochrones {self.PROFILE.capitalize()}',
-            'memory'
-        )
-        self.isos_time_id = layer_time.id()
-        layer_time_pr = layer_time.dataProvider()
-        layer_time_pr.addAttributes(self.isochrones.get_fields())
-        layer_time.updateFields()
-
-        layer_dist = QgsVectorLayer(
-            f'{geometry_param}?crs=EPSG:4326',
-            f'Isodistances {self.PROFILE.capitalize()}',
-            'memory'
-        )
-        self.isos_dist_id = layer_dist.id()
-        layer_dist_pr = layer_dist.dataProvider()
-        layer_dist_pr.addAttributes(self.isochrones.get_fields())
-        layer_dist.updateFields()
-
-        layer_snapped_points = QgsVectorLayer(
-            f'MultiPoint?crs=EPSG:4326',
-            f'Snapped Points {self.PROFILE.capitalize()}',
-            'memory'
-        )
-        self.points_snapped_id = layer_snapped_points.id()
-        layer_snapped_points_pr = layer_snapped_points.dataProvider()
-        layer_snapped_points_pr.addAttributes(self.isochrones.get_point_fields())
-        layer_snapped_points.updateFields()
-
-        layer_input_points = QgsVectorLayer(
-            f'Point?crs=EPSG:4326',
-            f'Input Points {self.PROFILE.capitalize()}',
-            'memory'
-        )
-        self.points_input_id = layer_input_points.id()
-        layer_input_points_pr = layer_input_points.dataProvider()
-        layer_input_points_pr.addAttributes(self.isochrones.get_point_fields())
-        layer_input_points.updateFields()
-
-        denoise = self.parameterAsDouble(parameters, self.IN_DENOISE, context)
-        if denoise:
-            params[self.IN_DENOISE] = denoise
-
-        generalize = self.parameterAsDouble(parameters, self.IN_GENERALIZE, context)
-        if generalize:
-            params[self.IN_GENERALIZE] = generalize
-
-        avoid_layer = self.parameterAsLayer(
-            parameters,
-            self.IN_AVOID,
-            context
-        )
-        if avoid_layer:
-            params['avoid_locations'] = get_avoid_locations(avoid_layer)
+            # Populate iso_layer instance with parameters
+            self.isochrones.set_parameters(self.PROFILE, geometry_param, id_field.type(), id_field_name)
 
-        show_locations = self.parameterAsBool(parameters, self.IN_SHOW_LOCATIONS, context)
-
-        # Sets all advanced parameters as attributes of self.costing_options
-        self.costing_options.set_costing_options(self, parameters, context)
-
-        intervals_time = self.parameterAsString(parameters, self.IN_INTERVALS_TIME, context)
-        intervals_distance = self.parameterAsString(parameters, self.IN_INTERVALS_DISTANCE, context)
-
-        feat_count = source.featureCount() if not intervals_time else source.featureCount() * 2
-
-        self.intervals = {
-            "time": [{"time": float(x)} for x in intervals_time.split(',')] if intervals_time else [],
-            "distance": [{"distance": float(x)} for x in intervals_distance.split(',')] if intervals_distance else []
-        }
-
-        counter = 0
+            layer_time = QgsVectorLayer(
+                f'{geometry_param}?crs=EPSG:4326',
+                f'Isochrones {self.PROFILE.capitalize()}',
+                'memory'
+            )
+            self.isos_time_id = layer_time.id()
+            layer_time_pr = layer_time.dataProvider()
+            layer_time_pr.addAttributes(self.isochrones.get_fields())
+            layer_time.updateFields()
+
+            layer_dist = QgsVectorLayer(
+                f'{geometry_param}?crs=EPSG:4326',
+                f'Isodistances {self.PROFILE.capitalize()}',
+                'memory'
+            )
+            self.isos_dist_id = layer_dist.id()
+            layer_dist_pr = layer_dist.dataProvider()
+            layer_dist_pr.addAttributes(self.isochrones.get_fields())
+            layer_dist.updateFields()
+
+            layer_snapped_points = QgsVectorLayer(
+                f'MultiPoint?crs=EPSG:4326',
+                f'Snapped Points {self.PROFILE.capitalize()}',
+                'memory'
+            )
+            self.points_snapped_id = layer_snapped_points.id()
+            layer_snapped_points_pr = layer_snapped_points.dataProvider()
+            layer_snapped_points_pr.addAttributes(self.isochrones.get_point_fields())
+            layer_snapped_points.updateFields()
+
+            layer_input_points = QgsVectorLayer(
+                f'Point?crs=EPSG:4326',
+                f'Input Points {self.PROFILE.capitalize()}',
+                'memory'
+            )
+            self.points_input_id = layer_input_points.id()
+            layer_input_points_pr = layer_input_points.dataProvider()
+            layer_input_points_pr.addAttributes(self.isochrones.get_point_fields())
+            layer_input_points.updateFields()
+
+            denoise = self.parameterAsDouble(parameters, self.IN_DENOISE, context)
+            if denoise:
+                params[self.IN_DENOISE] = denoise
+
+            generalize = self.parameterAsDouble(parameters, self.IN_GENERALIZE, context)
+            if generalize:
+                params[self.IN_GENERALIZE] = generalize
+
+            avoid_layer = self.parameterAsLayer(
+                parameters,
+                self.IN_AVOID,
+                context
+            )
+            if avoid_layer:
+                params['avoid_locations'] = codec.freeze(get_avoid_locations(avoid_layer))
+
+            show_locations = self.parameterAsBool(parameters, self.IN_SHOW_LOCATIONS, context)
+
+            # Sets all advanced parameters as attributes of self.costing_options
+            self.costing_options.set_costing_options(self, parameters, context)
+            costing_params = codec.freeze(get_costing_options(self.costing_options, self.PROFILE, mode))
+
+            intervals_time = self.parameterAsString(parameters, self.IN_INTERVALS_TIME, context)
+            intervals_distance = self.parameterAsString(parameters, self.IN_INTERVALS_DISTANCE, context)
+
+            self.intervals = {
+                "time": [{"time": float(x)} for x in intervals_time.split(',')] if intervals_time else [],
+                "distance": [{"distance": float(x)} for x in intervals_distance.split(',')] if intervals_distance else []
+            }
+
+            # Make the actual requests, features at the same location share one
+            xformer = transform.transformToWGS(source.sourceCrs())
+            with timing.stage(timing.READ):
+                requests = planning.group_features(
+                    planning.read_features(source, lambda feat: [xformer.transform(feat.geometry().asPoint())], [id_field_name])
+                )
+            feedback.pushInfo(planning.describe(source.featureCount(), len(requests)))
+            run.features = source.featureCount() * sum(1 for interv in self.intervals.values() if interv)
+
+            # Finished requests of an earlier run are written from the journal instead of being sent again
+            run.open_journal(
+                algorithm=self.name(),
+                provider=provider['name'],
+                mode=mode,
+                params=params,
+                costing=costing_params,
+                intervals=self.intervals,
+                show_locations=show_locations,
+                fields=[id_field_name]
+            )
+            # Output layers are numbered in the journal
+            layer_providers = [layer_time_pr, layer_dist_pr, layer_snapped_points_pr, layer_input_points_pr]
 
-        for metric, interv in self.intervals.items():
-            if feedback.isCanceled():
-                break
-            if not interv:
-                continue
-            # Make the actual requests
-            requests = []
-            for properties in self.get_sorted_feature_parameters(source):
-                if feedback.isCanceled():
-                    break
-                r_params = deepcopy(params)
-                r_params['contours'] = interv
-                # Get transformed coordinates and feature
-                locations, feat = properties
-                r_params.update(get_directions_params(locations, self.PROFILE, self.costing_options, mode))
-                r_params['id'] = feat[id_field_name]
-                requests.append(r_params)
-
-            for params in requests:
-                counter += 1
+            for metric, interv in self.intervals.items():
                 if feedback.isCanceled():
                     break
-                # If feature causes error, report and continue with next
-                exception: Optional[Exception] = None
-                try:
-                    # Populate features from response
-                    response = clnt.request('/isochrone', post_json=params)
-                except exceptions.ApiError as e:
-                    exception = e
+                if not interv:
                     continue
-                except Exception as e:
-                    exception = e
-                    raise
-                finally:
-                    if exception:
-                        msg = "{}:\n{}".format(
-                            exception.__class__.__name__,
-                            str(exception))
-                        feedback.reportError(msg)
-                        logger.log(msg, 2)
-                        msg = f"Was caused by feature ID {params['id']} with parameters {params}"
-                        feedback.reportError(msg)
-                        logger.log(msg, 2)
-
-                options = {}
-                if params.get('costing_options'):
-                    options = params['costing_options']
-
-                self.isochrones.set_response(response)
-                for isochrone in self.isochrones.get_features(params['id'], options.get(self.PROFILE)):
-                    if metric == 'time':
-                        layer_time_pr.addFeature(isochrone)
-                    elif metric == 'distance':
-                        layer_dist_pr.addFeature(isochrone)
-
-                if show_locations:
-                    for point_feat in self.isochrones.get_multipoint_features(params['id']):
-                        layer_snapped_points_pr.addFeature(point_feat)
-                    for point_feat in self.isochrones.get_point_features(params['id']):
-                        layer_input_points_pr.addFeature(point_feat)
-
-                feedback.setProgress(int((counter / feat_count) * 100))
+
+                def get_isochrone_params(request, interv=interv):
+                    # Shallow copy, only top level keys are changed and the avoid locations are shared
+                    r_params = dict(params)
+                    r_params['contours'] = interv
+                    # Get transformed coordinates and feature ID
+                    locations, ids = request
+                    r_params.update(get_directions_params(planning.key_points(locations), self.PROFILE, self.costing_options, mode, costing_params))
+                    r_params['id'] = ids[0][0]
+                    return r_params
+
+                def request_isochrones(request, r_params, layer=0 if metric == 'time' else 1):
+                    ids = request[1]
+                    # Populate features from response, built one at a time
+                    # while it arrives if the provider streams responses
+                    options = r_params.get('costing_options') or {}
+                    features = clnt.request_items('/isochrone', ('features',), post_json=r_params)
+                    with timing.stage(timing.BUILD_FEATURES):
+                        isochrones, multipoints, points = self.isochrones.build_streamed_features(
+                            features,
+                            r_params['id'],
+                            options.get(self.PROFILE),
+                            executor=self.run_options.executor
+                        )
+
+                        layer_features = []
+                        for isochrone in isochrones:
+                            layer_features.append((layer, list(planning.fan_out(isochrone, (0,), ids))))
+
+                        if show_locations:
+                            for point_feat in multipoints:
+                                layer_features.append((2, list(planning.fan_out(point_feat, (0,), ids))))
+                            for point_feat in points:
+                                layer_features.append((3, list(planning.fan_out(point_feat, (0,), ids))))
+
+                    return layer_features
+
+                run.run(
+                    requests,
+                    get_isochrone_params,
+                    request_isochrones,
+                    layer_providers,
+                    lambda request: "Feature ID {}".format(request[1][0][0]),
+                    key=(metric,)
+                )
+                if run.estimate is not None:
+                    run.estimate.describe("{}: {} requests with {} contours each".format(metric, len(requests), len(interv)))
+
+        if run.estimate is not None:
+            return dict()
 
         temp = []
         if layer_time.hasFeatures():
@@ -477,19 +498,3 @@ class ValhallaIsochronesCarAlgo(QgsProcessingAlgorithm):
                 result[out_id] = layer_id
 
         return result
-
-    def get_sorted_feature_parameters(self, layer):
-        """
-        Generator to yield geometry and id of features sorted by feature ID. Careful: feat.id() is not necessarily
-        permanent
-
-        :param layer: source input layer.
-        :type layer: QgsProcessingParameterFeatureSource
-        """
-        # First get coordinate transformer
-        xformer = transform.transformToWGS(layer.sourceCrs())
-
-        for feat in sorted(layer.getFeatures(), key=lambda f: f.id()):
-            x_point = xformer.transform(feat.geometry().asPoint())
-
-            yield ([x_point], feat)
@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+                                 Valhalla - QGIS plugin
+ QGIS client to query Valhalla APIs
+                              -------------------
+        begin                : 2019-10-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by Nils Nolde
+        email                : nils@gis-ops.com
+ ***************************************************************************/
+
+ This plugin provides access to some of the APIs from Valhalla
+ (https://github.com/valhalla/valhalla), developed and
+ maintained by https://gis-ops.com, Berlin, Germany.
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from urllib.request import pathname2url
+
+from PyQt5.QtCore import QVariant
+
+from ..common import codec, process_pool
+from ..utils import logger
+
+# Commit at most this often, every commit syncs the file
+COMMIT_SECONDS = 2
+
+
+def signature(**parts):
+    """
+    Hashes everything a run's outputs depend on besides the request
+    locations, e.g. algorithm, provider and costing options. A journal is only
+    resumed by a run with the same signature.
+
+    :param parts: JSON serializable values
+    :type parts: any
+
+    :rtype: str
+    """
+    return hashlib.sha1(codec.dumps(dict(sorted(parts.items())))).hexdigest()
+
+
+def _plain(value):
+    # NULL and other Qt types aren't JSON serializable
+    if isinstance(value, QVariant):
+        return value.value() if not value.isNull() else None
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+class Journal:
+    """
+    Sidecar SQLite file of a batch run, which records the finished requests
+    with their output features and the run's throughput. A resumed run writes
+    the recorded outputs again and only sends the remaining requests.
+
+    In incremental mode the journal is the state of the previous run: request
+    keys contain the locations and IDs of the input features, so only new or
+    changed features are requested, and outputs which no input feature asked
+    for anymore are dropped at the end of the run.
+    """
+
+    def __init__(self, path, run_signature, resume=False, prune=False, read_only=False):
+        """
+        :param path: path of the journal file
+        :type path: str
+
+        :param run_signature: see signature()
+        :type run_signature: str
+
+        :param resume: whether to continue the run recorded in the journal,
+            otherwise the journal is cleared
+        :type resume: bool
+
+        :param prune: whether to drop the outputs which weren't used by a completed run
+        :type prune: bool
+
+        :param read_only: only look up finished requests, e.g. for an estimate,
+            a journal of another run is ignored instead of cleared
+        :type read_only: bool
+        """
+        self.path = path
+        self.prune = prune
+        self.read_only = read_only
+        self.connection = sqlite3.connect('file:{}?mode=ro'.format(pathname2url(path)) if read_only else path, uri=read_only)
+        if read_only:
+            self._init_counters(self._get_meta('signature') == run_signature)
+            return
+
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS requests (key TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS outputs (
+                request TEXT NOT NULL,
+                layer INTEGER NOT NULL,
+                geometry BLOB,
+                attributes TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS outputs_request ON outputs (request);
+        """)
+
+        stored = self._get_meta('signature')
+        if resume and stored is not None and stored != run_signature:
+            logger.log("Journal {} belongs to a run with other parameters, starting over", 1, path)
+        if not resume or stored != run_signature:
+            with self.connection:
+                for table in ('meta', 'requests', 'outputs'):
+                    self.connection.execute('DELETE FROM {}'.format(table))
+                self._set_meta('signature', run_signature)
+
+        self._init_counters(True)
+
+    def _init_counters(self, matches):
+        # Throughput of earlier runs, so the ETA of a resumed run doesn't start from scratch
+        self.previous_requests = int(self._get_meta('requests') or 0)
+        self.previous_seconds = float(self._get_meta('seconds') or 0)
+        self.requests = 0
+        self.remaining = 0
+        # A read-only journal of another run has no usable outputs
+        self._finished = set(row[0] for row in self.connection.execute('SELECT key FROM requests')) if matches else set()
+        self._used = set()
+        self._started = time.monotonic()
+        self._committed = self._started
+        self._reported = 0
+
+    def _get_meta(self, key):
+        row = self.connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.connection.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    @staticmethod
+    def _key(key):
+        return json.dumps(key, default=_plain)
+
+    def has(self, key):
+        """
+        :param key: JSON serializable key of a request
+        :type key: any
+
+        :returns: whether the request is finished, without using its outputs
+        :rtype: bool
+        """
+        return self._key(key) in self._finished
+
+    def lookup(self, key):
+        """
+        :param key: JSON serializable key of a request
+        :type key: any
+
+        :returns: the recorded outputs of the request, None if it isn't finished
+        :rtype: list of tuple
+        """
+        request_key = self._key(key)
+        if request_key not in self._finished:
+            return None
+        self._used.add(request_key)
+
+        return self._outputs(request_key)
+
+    def resume(self, requests, key):
+        """
+        Splits the requests of a run into the ones finished earlier and the
+        ones still to be sent.
+
+        :param requests: (input index, request) tuples, see RunOptions.order_requests()
+        :type requests: list of tuple
+
+        :param key: function returning the JSON serializable key of a request
+        :type key: function
+
+        :returns: the (input index, request) tuples to send and (input index,
+            outputs) tuples of the finished requests, see record() for the outputs
+        :rtype: tuple of list
+        """
+        pending, replayed = [], []
+        for index, request in requests:
+            outputs = self.lookup(key(request))
+            if outputs is not None:
+                replayed.append((index, outputs))
+            else:
+                pending.append((index, request))
+        self.remaining = len(pending)
+
+        return pending, replayed
+
+    def _outputs(self, request_key):
+        layers = dict()
+        rows = self.connection.execute(
+            'SELECT layer, geometry, attributes FROM outputs WHERE request = ? ORDER BY rowid', (request_key,)
+        )
+        for layer, geometry, attributes in rows:
+            layers.setdefault(layer, []).append(process_pool.to_feature(geometry, json.loads(attributes)))
+
+        return list(layers.items())
+
+    def record(self, key, outputs):
+        """
+        Records a finished request.
+
+        :param key: JSON serializable key of the request
+        :type key: any
+
+        :param outputs: (output layer number, features) tuples, None for a
+            failed request, which is counted but sent again on resume
+        :type outputs: list of tuple
+        """
+        if outputs is not None:
+            self.store(key, outputs)
+        self.finished()
+
+    def store(self, key, outputs):
+        """
+        Stores the outputs of a request without counting it for the
+        throughput, e.g. for the cells of a matrix.
+
+        :param key: JSON serializable key of the outputs
+        :type key: any
+
+        :param outputs: (output layer number, features) tuples
+        :type outputs: list of tuple
+        """
+        request_key = self._key(key)
+        self._finished.add(request_key)
+        self._used.add(request_key)
+        self.connection.execute('DELETE FROM outputs WHERE request = ?', (request_key,))
+        self.connection.execute('INSERT OR REPLACE INTO requests (key) VALUES (?)', (request_key,))
+        self.connection.executemany(
+            'INSERT INTO outputs (request, layer, geometry, attributes) VALUES (?, ?, ?, ?)',
+            [
+                (
+                    request_key,
+                    layer,
+                    bytes(feat.geometry().asWkb()) if feat.hasGeometry() else None,
+                    json.dumps([_plain(value) for value in feat.attributes()])
+                )
+                for layer, feats in outputs for feat in feats
+            ]
+        )
+
+    def finished(self):
+        """Counts a finished request for the throughput and commits now and then."""
+        self.requests += 1
+        self.remaining = max(self.remaining - 1, 0)
+
+        now = time.monotonic()
+        if now - self._committed >= COMMIT_SECONDS:
+            self.commit()
+
+    def commit(self):
+        self._set_meta('requests', self.previous_requests + self.requests)
+        self._set_meta('seconds', self.previous_seconds + time.monotonic() - self._started)
+        self.connection.commit()
+        self._committed = time.monotonic()
+
+    def eta(self):
+        """
+        :returns: estimated seconds until the remaining requests are done, None
+            while nothing is known about the throughput
+        :rtype: float
+        """
+        requests = self.previous_requests + self.requests
+        seconds = self.previous_seconds + time.monotonic() - self._started
+        if not requests:
+            return None
+
+        return self.remaining * seconds / requests
+
+    def report(self, feedback, every=5):
+        """
+        Shows the remaining requests and the ETA as the progress text.
+
+        :param feedback: algorithm's feedback
+        :type feedback: QgsProcessingFeedback
+
+        :param every: seconds between updates
+        :type every: float
+        """
+        now = time.monotonic()
+        if now - self._reported < every:
+            return
+        self._reported = now
+
+        eta = self.eta()
+        if eta is not None:
+            feedback.setProgressText("{} requests left, about {:.0f} min remaining".format(self.remaining, eta / 60))
+
+    def close(self, completed=True):
+        """
+        :param completed: whether the run went through all requests, only then
+            unused outputs are dropped in incremental mode
+        :type completed: bool
+        """
+        if self.read_only:
+            self.connection.close()
+            return
+        if self.prune and completed:
+            unused = self._finished - self._used
+            if unused:
+                logger.log("Dropping {} outputs of deleted or changed features from {}", 0, len(unused), self.path)
+                self.connection.executemany('DELETE FROM requests WHERE key = ?', ((key,) for key in unused))
+                self.connection.executemany('DELETE FROM outputs WHERE request = ?', ((key,) for key in unused))
+        self.commit()
+        self.connection.close()
+
+
+def open_journal(path, run_signature, resume, prune=False, read_only=False):
+    """
+    :param path: path of the journal file, empty for no journal
+    :type path: str
+
+    :param prune: whether to run incrementally, see Journal
+    :type prune: bool
+
+    :param read_only: whether to only look up finished requests, see Journal
+    :type read_only: bool
+
+    :returns: the journal, None if no path was given
+    :rtype: Journal
+    """
+    if not path or (read_only and not os.path.exists(path)):
+        return None
+    if resume and not os.path.exists(path):
+        logger.log("No journal at {} to resume from, starting a new run", 1, path)
+
+    return Journal(path, run_signature, resume, prune, read_only)
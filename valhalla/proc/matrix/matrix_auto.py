@@ -24,6 +24,7 @@
  ***************************************************************************/
 """
 
+from collections import Counter
 import os.path
 
 from PyQt5.QtGui import QIcon
@@ -40,11 +41,13 @@ from qgis.core import (QgsWkbTypes,
                        QgsProcessingParameterDefinition,
                        QgsProcessingParameterMapLayer,
                        )
-from .. import HELP_DIR
-from ... import RESOURCE_PREFIX, __help__
-from ...common import client, matrix_core
-from ...utils import configmanager, transform, exceptions,logger
+from .. import HELP_DIR, planning
+from ... import IMG_DIR, __help__
+from ...common import client, codec, matrix_core, timing
+from ...utils import configmanager, transform
 from ..costing_params import CostingAuto
+from ..run_options import RunOptions
+from ..runner import BatchRun
 from ..request_builder import get_locations, get_costing_options, get_avoid_locations
 
 
@@ -70,12 +73,13 @@ class ValhallaMatrixCarAlgo(QgsProcessingAlgorithm):
 
     def __init__(self):
         super(ValhallaMatrixCarAlgo, self).__init__()
-        self.providers = configmanager.read_config()['providers']
         self.costing_options = self.COSTING()
+        self.run_options = RunOptions()
 
     def initAlgorithm(self, configuration, p_str=None, Any=None, *args, **kwargs):
 
-        providers = [provider['name'] for provider in self.providers]
+        # Read here rather than in __init__, QGIS instantiates all algorithms at startup
+        providers = [provider['name'] for provider in configmanager.get_providers()]
         self.addParameter(
             QgsProcessingParameterEnum(
                 self.IN_PROVIDER,
@@ -135,7 +139,7 @@ class ValhallaMatrixCarAlgo(QgsProcessingAlgorithm):
             )
         )
 
-        advanced = self.costing_options.get_costing_params()
+        advanced = self.costing_options.get_costing_params() + RunOptions.get_run_params()
 
         for p in advanced:
             p.setFlags(p.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
@@ -178,143 +182,301 @@ class ValhallaMatrixCarAlgo(QgsProcessingAlgorithm):
         return " ".join(map(lambda x: x.capitalize(), self.ALGO_NAME_LIST))
 
     def icon(self):
-        return QIcon(RESOURCE_PREFIX + 'icon_matrix.png')
+        return QIcon(os.path.join(IMG_DIR, 'icon_matrix.png'))
 
     def createInstance(self):
         return ValhallaMatrixCarAlgo()
 
     def processAlgorithm(self, parameters, context, feedback):
+        with self.run_options.profile(self, parameters, context, feedback):
+            return self._run(parameters, context, feedback)
+
+    def _run(self, parameters, context, feedback):
 
         # Init ORS client
-        providers = configmanager.read_config()['providers']
+        providers = configmanager.get_providers()
         provider = providers[self.parameterAsEnum(parameters, self.IN_PROVIDER, context)]
         clnt = client.Client(provider)
         clnt.overQueryLimit.connect(lambda: feedback.reportError("OverQueryLimit: Retrying"))
+        # Before the input is read, which is timed as well
+        self.run_options.set_run_options(self, parameters, context)
+        with BatchRun(self.run_options, clnt, feedback, '/sources_to_targets') as run:
 
-        mode = self.MODE_TYPES[self.parameterAsEnum(parameters, self.IN_MODE, context)]
+            mode = self.MODE_TYPES[self.parameterAsEnum(parameters, self.IN_MODE, context)]
 
-        # Get parameter values
-        source = self.parameterAsSource(
-            parameters,
-            self.IN_START,
-            context
-        )
-        source_field_name = self.parameterAsString(
-            parameters,
-            self.IN_START_FIELD,
-            context
-        )
-        destination = self.parameterAsSource(
-            parameters,
-            self.IN_END,
-            context
-        )
-        destination_field_name = self.parameterAsString(
-            parameters,
-            self.IN_END_FIELD,
-            context
-        )
-        avoid_layer = self.parameterAsSource(
-            parameters,
-            self.IN_AVOID,
-            context
-        )
+            # Get parameter values
+            source = self.parameterAsSource(
+                parameters,
+                self.IN_START,
+                context
+            )
+            source_field_name = self.parameterAsString(
+                parameters,
+                self.IN_START_FIELD,
+                context
+            )
+            destination = self.parameterAsSource(
+                parameters,
+                self.IN_END,
+                context
+            )
+            destination_field_name = self.parameterAsString(
+                parameters,
+                self.IN_END_FIELD,
+                context
+            )
+            avoid_layer = self.parameterAsSource(
+                parameters,
+                self.IN_AVOID,
+                context
+            )
 
-        # Get fields from field name
-        source_field_id = source.fields().lookupField(source_field_name)
-        source_field = source.fields().field(source_field_id)
-
-        destination_field_id = destination.fields().lookupField(destination_field_name)
-        destination_field = destination.fields().field(destination_field_id)
-
-        (sink, dest_id) = self.parameterAsSink(
-            parameters,
-            self.OUT,
-            context,
-            matrix_core.get_fields(
-                source_field.type(),
-                destination_field.type()
-            ),
-            QgsWkbTypes.NoGeometry
-        )
+            # Get fields from field name
+            source_field_id = source.fields().lookupField(source_field_name)
+            source_field = source.fields().field(source_field_id)
+
+            destination_field_id = destination.fields().lookupField(destination_field_name)
+            destination_field = destination.fields().field(destination_field_id)
+
+            (sink, dest_id) = self.parameterAsSink(
+                parameters,
+                self.OUT,
+                context,
+                matrix_core.get_fields(
+                    source_field.type(),
+                    destination_field.type()
+                ),
+                QgsWkbTypes.NoGeometry
+            )
 
-        # Abort when MultiPoint type
-        if (source.wkbType() or destination.wkbType()) == 4:
-            raise QgsProcessingException("TypeError: Multipoint Layers are not accepted. Please convert to single geometry layer.")
+            # Abort when MultiPoint type
+            if (source.wkbType() or destination.wkbType()) == 4:
+                raise QgsProcessingException("TypeError: Multipoint Layers are not accepted. Please convert to single geometry layer.")
 
-        # Get feature amounts/counts
-        sources_amount = source.featureCount()
-        destinations_amount = destination.featureCount()
-        if (sources_amount or destinations_amount) > 10000:
-            raise QgsProcessingException(
-                "ProcessingError: Too large input, please decimate."
-            )
+            # Get feature amounts/counts
+            sources_amount = source.featureCount()
+            destinations_amount = destination.featureCount()
+            if (sources_amount or destinations_amount) > 10000:
+                raise QgsProcessingException(
+                    "ProcessingError: Too large input, please decimate."
+                )
 
-        sources_features = list(source.getFeatures())
-        destinations_features = list(destination.getFeatures())
+            run.features = sources_amount * destinations_amount
+            with timing.stage(timing.READ):
+                # Get the locations and IDs of source and destination features
+                xformer_source = transform.transformToWGS(source.sourceCrs())
+                source_rows = planning.read_features(
+                    source,
+                    lambda feat: [xformer_source.transform(feat.geometry().asPoint())],
+                    [source_field_name],
+                    by_id=False
+                )
+                xformer_destination = transform.transformToWGS(destination.sourceCrs())
+                destination_rows = planning.read_features(
+                    destination,
+                    lambda feat: [xformer_destination.transform(feat.geometry().asPoint())],
+                    [destination_field_name],
+                    by_id=False
+                )
+                sources_points = [planning.key_points(location)[0] for location, _ in source_rows]
+                destination_points = [planning.key_points(location)[0] for location, _ in destination_rows]
 
-        # Get source and destination features
-        xformer_source = transform.transformToWGS(source.sourceCrs())
-        sources_points = [xformer_source.transform(feat.geometry().asPoint()) for feat in sources_features]
-        xformer_destination = transform.transformToWGS(destination.sourceCrs())
-        destination_points = [xformer_destination.transform(feat.geometry().asPoint()) for feat in destinations_features]
+            # Build params
+            params = dict(
+                costing=self.PROFILE
+            )
 
-        # Build params
-        params = dict(
-            costing=self.PROFILE
-        )
+            # Sets all advanced parameters as attributes of self.costing_options
+            self.costing_options.set_costing_options(self, parameters, context)
+
+            costing_params = codec.freeze(get_costing_options(self.costing_options, self.PROFILE, mode))
+            if costing_params:
+                params['costing_options'] = costing_params
+
+            if avoid_layer:
+                params['avoid_locations'] = codec.freeze(get_avoid_locations(avoid_layer))
+
+            sources_attributes = [values[0] for _, values in source_rows]
+            destinations_attributes = [values[0] for _, values in destination_rows]
+
+            # Only distinct locations are sent, every cell is copied to all
+            # source and destination features at its locations
+            unique_sources, source_members = planning.unique_points(sources_points)
+            unique_destinations, destination_members = planning.unique_points(destination_points)
+            feedback.pushInfo(planning.describe(
+                len(sources_points) * len(destination_points),
+                len(unique_sources) * len(unique_destinations)
+            ))
+
+            # Tiles of nearby locations, if the locations are ordered along a curve
+            ordered_sources = self.run_options.order_requests(unique_sources, lambda point: planning.location_key([point]))
+            ordered_destinations = self.run_options.order_requests(unique_destinations, lambda point: planning.location_key([point]))
+
+            # Finished cells of an earlier run are reused instead of being requested again
+            journal = run.open_journal(
+                algorithm=self.name(),
+                provider=provider['name'],
+                mode=mode,
+                params=params,
+                fields=[source_field_name, destination_field_name]
+            )
+            if journal is not None:
+                # Locations and IDs, a changed ID changes the outputs as well
+                source_keys = {
+                    index: [planning.location_key([point]), [sources_attributes[i] for i in source_members[index]]]
+                    for index, point in ordered_sources
+                }
+                destination_keys = {
+                    index: [planning.location_key([point]), [destinations_attributes[j] for j in destination_members[index]]]
+                    for index, point in ordered_destinations
+                }
+                cell_key = lambda source_index, destination_index: [source_keys[source_index], destination_keys[destination_index]]
+
+                # New destinations are requested for all sources, new sources or
+                # sources with other missing cells for all destinations
+                new_destinations = [
+                    (d, point) for d, point in ordered_destinations
+                    if not any(journal.has(cell_key(s, d)) for s, _ in ordered_sources)
+                ]
+                new_destination_indices = set(d for d, _ in new_destinations)
+                known_destinations = [(d, point) for d, point in ordered_destinations if d not in new_destination_indices]
+                new_sources = [
+                    (s, point) for s, point in ordered_sources
+                    if not known_destinations or not all(journal.has(cell_key(s, d)) for d, _ in known_destinations)
+                ]
+                new_source_indices = set(s for s, _ in new_sources)
+                known_sources = [(s, point) for s, point in ordered_sources if s not in new_source_indices]
+                feedback.pushInfo("{} of {} sources and {} of {} destinations are new or changed".format(
+                    len(new_sources), len(ordered_sources), len(new_destinations), len(ordered_destinations)
+                ))
+
+                # (source chunk, destination chunks to request, destinations to reuse)
+                source_chunks = [
+                    (source_chunk, list(self._chunks(ordered_destinations, 50)), [])
+                    for source_chunk in self._chunks(new_sources, 50)
+                ] + [
+                    (source_chunk, list(self._chunks(new_destinations, 50)), known_destinations)
+                    for source_chunk in self._chunks(known_sources, 50)
+                ]
+            else:
+                source_chunks = [
+                    (source_chunk, list(self._chunks(ordered_destinations, 50)), [])
+                    for source_chunk in self._chunks(ordered_sources, 50)
+                ]
+
+            def get_tile_params(source_chunk, destination_chunk):
+                return dict(
+                    params,
+                    sources=get_locations([point for _, point in source_chunk]),
+                    targets=get_locations([point for _, point in destination_chunk]),
+                    id="matrix"
+                )
 
-        # Sets all advanced parameters as attributes of self.costing_options
-        self.costing_options.set_costing_options(self, parameters, context)
-
-        costing_params = get_costing_options(self.costing_options, self.PROFILE, mode)
-        if costing_params:
-            params['costing_options'] = costing_params
-
-        if avoid_layer:
-            params['avoid_locations'] = get_avoid_locations(avoid_layer)
-
-        sources_attributes = [feat.attribute(source_field_name) for feat in sources_features]
-        destinations_attributes = [feat.attribute(destination_field_name) for feat in destinations_features]
-
-        source_attr_iter = self._chunks(sources_attributes, 50)
-        for sources in self._chunks(sources_points, 50):
-            params["sources"] = get_locations(sources)
-            source_attributes = next(source_attr_iter)
-
-            destination_attr_iter = self._chunks(destinations_attributes, 50)
-            for destinations in self._chunks(destination_points, 50):
-                params["targets"] = get_locations(destinations)
-                params["id"] = "matrix"
-                destination_attributes = next(destination_attr_iter)
-
-                # Make request and catch ApiError
-                try:
-                    response = clnt.request('/sources_to_targets', post_json=params)
-                except (exceptions.ApiError) as e:
-                    msg = "{}: {}".format(
-                        e.__class__.__name__,
-                        str(e))
-                    feedback.reportError(msg)
-                    logger.log(msg)
-                    continue
-                except (exceptions.InvalidKey, exceptions.GenericServerError) as e:
-                    msg = "{}:\n{}".format(
-                        e.__class__.__name__,
-                        str(e))
-                    logger.log(msg)
-                    raise
-
-                feats = matrix_core.get_output_features_matrix(
-                    response,
+            def request_tile(tile):
+                source_number, source_chunk, destination_chunk = tile
+                with timing.stage(timing.BUILD_REQUEST):
+                    tile_params = get_tile_params(source_chunk, destination_chunk)
+
+                # The rows are turned into features while they arrive if the
+                # provider streams responses. The cells are built with the indices
+                # of the distinct locations as IDs, which are replaced by fan_out()
+                matrix_rows = clnt.request_items('/sources_to_targets', ('sources_to_targets',), post_json=tile_params)
+                feats = matrix_core.iter_output_features_matrix(
+                    matrix_rows,
+                    tile_params["sources"],
+                    tile_params["targets"],
                     self.PROFILE,
                     costing_params,
-                    source_attributes,
-                    destination_attributes
+                    [index for index, _ in source_chunk],
+                    [index for index, _ in destination_chunk]
                 )
-
-                for feat in feats:
-                    sink.addFeature(feat)
+                cells = []
+                with timing.stage(timing.BUILD_FEATURES):
+                    for feat in feats:
+                        destinations = destination_members[feat[1]]
+                        for i in source_members[feat[0]]:
+                            copies = planning.fan_out(
+                                feat,
+                                (0, 1),
+                                [(sources_attributes[i], destinations_attributes[j]) for j in destinations]
+                            )
+                            cells.extend((feat[0], feat[1], (i, j), copy) for j, copy in zip(destinations, copies))
+
+                return cells
+
+            def describe_tile(tile):
+                _, source_chunk, destination_chunk = tile
+                return "Tile of {} sources and {} destinations".format(len(source_chunk), len(destination_chunk))
+
+            tiles = [
+                (source_number, source_chunk, destination_chunk)
+                for source_number, (source_chunk, destination_chunks, _) in enumerate(source_chunks)
+                for destination_chunk in destination_chunks
+            ]
+            if journal is not None:
+                journal.remaining = len(tiles)
+
+            # Rows are written per distinct source once all tiles of its chunk are
+            # done, with the "Write output in input order" option in the order of
+            # the sources, and within a row in the order of the destinations
+            output = run.output_buffer(sink.addFeatures)
+            rows = [None] * len(source_chunks)
+            remaining_tiles = [len(destination_chunks) for _, destination_chunks, _ in source_chunks]
+
+            def write_rows(source_number):
+                source_chunk, _, reused_destinations = source_chunks[source_number]
+                chunk_rows = rows[source_number] or {index: [] for index, _ in source_chunk}
+                for index, row in chunk_rows.items():
+                    for d, _ in reused_destinations:
+                        # Same order as fan_out() built the copies in
+                        orders = [(i, j) for i in source_members[index] for j in destination_members[d]]
+                        for _, feats in journal.lookup(cell_key(index, d)):
+                            row.extend(zip(orders, feats))
+                    output.add(index, [feat for _, feat in sorted(row, key=lambda cell: cell[0])])
+                rows[source_number] = None
+
+            estimate = run.estimate
+            if estimate is not None:
+                shapes = Counter((len(source_chunk), len(destination_chunk)) for _, source_chunk, destination_chunk in tiles)
+                for _, source_chunk, destination_chunk in tiles:
+                    estimate.add(get_tile_params(source_chunk, destination_chunk))
+                estimate.describe("{} tiles: {}".format(
+                    len(tiles),
+                    ", ".join("{} of {}x{}".format(count, *shape) for shape, count in sorted(shapes.items(), reverse=True))
+                ))
+                reused = sum(len(source_chunk) * len(destinations) for source_chunk, _, destinations in source_chunks)
+                if reused:
+                    estimate.describe("{} of {} distinct cells are reused from the journal".format(
+                        reused, len(ordered_sources) * len(ordered_destinations)
+                    ))
+                return {self.OUT: dest_id}
+
+            for source_number, remaining in enumerate(remaining_tiles):
+                if not remaining:
+                    write_rows(source_number)
+
+            for tile, cells, error in run.results(tiles, request_tile, describe_tile):
+                source_number = tile[0]
+                if rows[source_number] is None:
+                    rows[source_number] = {index: [] for index, _ in source_chunks[source_number][0]}
+
+                if error is None:
+                    tile_cells = dict()
+                    for index, destination_index, order, feat in cells:
+                        rows[source_number][index].append((order, feat))
+                        tile_cells.setdefault((index, destination_index), []).append(feat)
+                    if journal is not None:
+                        for (index, destination_index), feats in tile_cells.items():
+                            journal.store(cell_key(index, destination_index), [(0, feats)])
+
+                if journal is not None:
+                    journal.finished()
+
+                remaining_tiles[source_number] -= 1
+                if not remaining_tiles[source_number]:
+                    write_rows(source_number)
+
+            output.flush()
 
         return {self.OUT: dest_id}
 
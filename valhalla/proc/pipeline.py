@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+                                 Valhalla - QGIS plugin
+ QGIS client to query Valhalla APIs
+                              -------------------
+        begin                : 2019-10-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by Nils Nolde
+        email                : nils@gis-ops.com
+ ***************************************************************************/
+
+ This plugin provides access to some of the APIs from Valhalla
+ (https://github.com/valhalla/valhalla), developed and
+ maintained by https://gis-ops.com, Berlin, Germany.
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import contextvars
+import queue
+import threading
+
+# Marks the end of the input in a queue
+_DONE = object()
+
+
+class Stage:
+    """A step of a pipeline, run by its own worker threads."""
+
+    def __init__(self, name, fn, workers=1):
+        """
+        :param name: name for logging and thread names
+        :type name: str
+
+        :param fn: function called with the output of the previous stage
+        :type fn: function
+
+        :param workers: number of threads running fn
+        :type workers: int
+        """
+        self.name = name
+        self.fn = fn
+        self.workers = max(int(workers), 1)
+
+
+class Result:
+    """Outcome of one input item after all stages."""
+
+    def __init__(self, index, value=None, error=None):
+        self.index = index
+        self.value = value
+        self.error = error
+
+
+class Pipeline:
+    """
+    Runs items through stages connected by bounded queues. Each stage has its
+    own worker threads, so network waits of one stage overlap with the work of
+    the others. At most max_in_flight items are between input and output, so
+    memory stays bounded however large the input is.
+
+    The results are consumed in the calling thread, e.g. to write them to a
+    sink, which must not be done from other threads.
+    """
+
+    def __init__(self, stages, queue_size=16, ordered=False, threaded=True):
+        """
+        :param stages: stages in the order they are applied
+        :type stages: list of Stage
+
+        :param queue_size: capacity of each queue between stages
+        :type queue_size: int
+
+        :param ordered: whether results are returned in input order, otherwise
+            as soon as they are done
+        :type ordered: bool
+
+        :param threaded: False runs all stages in the calling thread, one item
+            after the other
+        :type threaded: bool
+        """
+        self.stages = stages
+        self.queue_size = queue_size
+        self.ordered = ordered
+        self.threaded = threaded
+        self.max_in_flight = queue_size * (len(stages) + 1) + sum(stage.workers for stage in stages)
+
+    def run(self, items, is_canceled=None):
+        """
+        Generator to return the results of all items. A failing stage doesn't
+        stop the pipeline, the item's result carries the exception and skips
+        the remaining stages.
+
+        :param items: input items
+        :type items: iterable
+
+        :param is_canceled: function returning True to stop reading input, e.g. feedback.isCanceled
+        :type is_canceled: function
+
+        :returns: result of an item
+        :rtype: Result
+        """
+        if not self.threaded:
+            yield from self._run_inline(items, is_canceled)
+        else:
+            yield from self._run_threaded(items, is_canceled)
+
+    def _run_inline(self, items, is_canceled):
+        for index, item in enumerate(items):
+            if is_canceled and is_canceled():
+                break
+            result = Result(index, item)
+            for stage in self.stages:
+                try:
+                    result.value = stage.fn(result.value)
+                except Exception as e:
+                    result.error = e
+                    break
+            yield result
+
+    def _run_threaded(self, items, is_canceled):
+        stop = threading.Event()
+        # Items between input and output, the feeder blocks when it's used up
+        window = threading.Semaphore(self.max_in_flight)
+        queues = [queue.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = []
+
+        def put(q, value):
+            # Gives up when the pipeline is stopped while the queue is full
+            while not stop.is_set():
+                try:
+                    q.put(value, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def feed():
+            try:
+                for index, item in enumerate(items):
+                    while not window.acquire(timeout=0.1):
+                        if stop.is_set():
+                            return
+                    if stop.is_set() or (is_canceled and is_canceled()):
+                        return
+                    if not put(queues[0], Result(index, item)):
+                        return
+            except Exception as e:
+                # Errors reading the input end the run
+                put(queues[-1], e)
+            finally:
+                put(queues[0], _DONE)
+
+        def work(stage, q_in, q_out, finished):
+            while not stop.is_set():
+                try:
+                    result = q_in.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if result is _DONE:
+                    # Let the other workers of the stage see it as well
+                    put(q_in, _DONE)
+                    with finished[1]:
+                        finished[0] -= 1
+                        if finished[0] == 0:
+                            put(q_out, _DONE)
+                    return
+                if result.error is None:
+                    try:
+                        result.value = stage.fn(result.value)
+                    except Exception as e:
+                        result.error = e
+                if not put(q_out, result):
+                    return
+
+        # The threads run in copies of the caller's context, e.g. with the run's stage timers
+        threads.append(threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(feed,),
+            name='valhalla-pipeline-input',
+            daemon=True
+        ))
+        for i, stage in enumerate(self.stages):
+            finished = [stage.workers, threading.Lock()]
+            for n in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=contextvars.copy_context().run,
+                    args=(work, stage, queues[i], queues[i + 1], finished),
+                    name='valhalla-pipeline-{}-{}'.format(stage.name, n),
+                    daemon=True
+                ))
+        for thread in threads:
+            thread.start()
+
+        pending = dict()
+        next_index = 0
+        try:
+            while True:
+                result = queues[-1].get()
+                if result is _DONE:
+                    break
+                if isinstance(result, Exception):
+                    raise result
+                if not self.ordered:
+                    window.release()
+                    yield result
+                    continue
+
+                pending[result.index] = result
+                while next_index in pending:
+                    window.release()
+                    yield pending.pop(next_index)
+                    next_index += 1
+
+            for index in sorted(pending):
+                yield pending[index]
+        finally:
+            # Also runs when the consumer stops early, e.g. after a fatal error
+            stop.set()
+            for thread in threads:
+                thread.join()
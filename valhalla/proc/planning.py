@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+                                 Valhalla - QGIS plugin
+ QGIS client to query Valhalla APIs
+                              -------------------
+        begin                : 2019-10-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by Nils Nolde
+        email                : nils@gis-ops.com
+ ***************************************************************************/
+
+ This plugin provides access to some of the APIs from Valhalla
+ (https://github.com/valhalla/valhalla), developed and
+ maintained by https://gis-ops.com, Berlin, Germany.
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from qgis.core import QgsFeature, QgsFeatureRequest, QgsPointXY
+
+# Same precision as the locations sent to Valhalla, see request_builder.get_locations()
+PRECISION = 6
+
+
+def location_key(points):
+    """
+    Normalizes locations to a hashable key, locations which are sent as the
+    same request parameters get the same key.
+
+    :param points: locations of a request
+    :type points: list of QgsPointXY
+
+    :rtype: tuple
+    """
+    return tuple((round(point.x(), PRECISION), round(point.y(), PRECISION)) for point in points)
+
+
+def key_points(key):
+    """
+    :param key: see location_key()
+    :type key: tuple
+
+    :returns: the locations of a key, as they are sent to Valhalla
+    :rtype: list of QgsPointXY
+    """
+    return [QgsPointXY(*location) for location in key]
+
+
+def read_features(source, get_points, field_names=(), by_id=True):
+    """
+    Reads the location keys and ID values of the input features. Features are
+    read one at a time and only their keys and IDs are kept, so neither the
+    features nor the request bodies of a large layer are held in memory.
+
+    :param source: input layer
+    :type source: QgsProcessingFeatureSource
+
+    :param get_points: function returning the WGS84 locations of a feature
+    :type get_points: function
+
+    :param field_names: names of the ID fields
+    :type field_names: list of str
+
+    :param by_id: whether to return the features sorted by feature ID,
+        otherwise in the order of the layer. Careful: feat.id() is not
+        necessarily permanent
+    :type by_id: bool
+
+    :returns: one (location key, ID values) tuple per input feature
+    :rtype: list of tuple
+    """
+    request = QgsFeatureRequest().setSubsetOfAttributes(list(field_names), source.fields())
+    rows = [
+        (feat.id(), location_key(get_points(feat)), tuple(feat[name] for name in field_names))
+        for feat in source.getFeatures(request)
+    ]
+    if by_id:
+        rows.sort(key=lambda row: row[0])
+
+    return [row[1:] for row in rows]
+
+
+def group_requests(items, key):
+    """
+    Groups the items of a batch which result in the same request. The costing
+    is the same for all requests of a run, so the locations are the key.
+
+    :param items: one item per input feature
+    :type items: iterable
+
+    :param key: function returning the request key of an item, e.g. with location_key()
+    :type key: function
+
+    :returns: one (key, items) tuple per distinct request, in the order of
+        their first item
+    :rtype: list of tuple
+    """
+    groups = dict()
+    for item in items:
+        groups.setdefault(key(item), []).append(item)
+
+    return list(groups.items())
+
+
+def group_features(rows):
+    """
+    Groups the input features which result in the same request, see group_requests().
+
+    :param rows: (location key, ID values) tuples, see read_features()
+    :type rows: iterable
+
+    :returns: one (location key, ID values of its features) tuple per
+        distinct request, in the order of their first feature
+    :rtype: list of tuple
+    """
+    return [(key, [values for _, values in group]) for key, group in group_requests(rows, lambda row: row[0])]
+
+
+def unique_points(points):
+    """
+    Removes duplicate locations, e.g. from the sources or targets of a matrix.
+
+    :param points: locations of all input features
+    :type points: list of QgsPointXY
+
+    :returns: the distinct locations and for each of them the indices of the
+        input features located there
+    :rtype: tuple of list of QgsPointXY and list of list of int
+    """
+    indices = dict()
+    unique, members = [], []
+    for i, point in enumerate(points):
+        key = location_key([point])
+        if key not in indices:
+            indices[key] = len(unique)
+            unique.append(point)
+            members.append([])
+        members[indices[key]].append(i)
+
+    return unique, members
+
+
+def fan_out(feature, attribute_indices, values):
+    """
+    Generator to copy an output feature for every input feature which shared
+    its request, each copy with the ID attributes of its input feature.
+
+    :param feature: output feature built from the response
+    :type feature: QgsFeature
+
+    :param attribute_indices: indices of the ID attributes
+    :type attribute_indices: tuple of int
+
+    :param values: ID attribute values, one tuple per input feature
+    :type values: list of tuple
+
+    :returns: output feature
+    :rtype: QgsFeature
+    """
+    for row in values:
+        copy = QgsFeature(feature)
+        for index, value in zip(attribute_indices, row):
+            copy.setAttribute(index, value)
+
+        yield copy
+
+
+def describe(feature_count, request_count):
+    """
+    :returns: message for the processing log
+    :rtype: str
+    """
+    return "{} input features, {} distinct requests ({} duplicates skipped)".format(
+        feature_count,
+        request_count,
+        feature_count - request_count
+    )
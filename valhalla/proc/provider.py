@@ -24,30 +24,12 @@
  ***************************************************************************/
 """
 
+import os.path
+
 from PyQt5.QtGui import QIcon
 from qgis.core import QgsProcessingProvider
 
-from .. import RESOURCE_PREFIX, PLUGIN_NAME, __version__
-from .directions_lines.directions_lines_auto import ValhallaRouteLinesCarAlgo
-from .directions_lines.directions_lines_truck import ValhallaRouteLinesTruckAlgo
-from .directions_lines.directions_lines_bicycle import ValhallaRouteLinesBicycleAlgo
-from .directions_lines.directions_lines_pedestrian import ValhallaRouteLinesPedestrianAlgo
-from .directions_point_layer.directions_points_layer_auto import ValhallaRoutePointsLayerCarAlgo
-from .directions_point_layer.directions_points_layer_truck import ValhallaRoutePointsLayerTruckAlgo
-from .directions_point_layer.directions_points_layer_bicycle import ValhallaRoutePointsLayerBicycleAlgo
-from .directions_point_layer.directions_points_layer_pedestrian import ValhallaRoutePointsLayerPedestrianAlgo
-from .directions_points_layers.directions_points_layers_auto import ValhallaRoutePointsLayersCarAlgo
-from .directions_points_layers.directions_points_layers_truck import ValhallaRoutePointsLayersTruckAlgo
-from .directions_points_layers.directions_points_layers_bicycle import ValhallaRoutePointsLayersBicycleAlgo
-from .directions_points_layers.directions_points_layers_pedestrian import ValhallaRoutePointsLayersPedestrianAlgo
-from .isochrones.isochrones_layer_auto import ValhallaIsochronesCarAlgo
-from .isochrones.isochrones_layer_truck import ValhallaIsochronesTruckAlgo
-from .isochrones.isochrones_layer_bicycle import ValhallaIsochronesBicycleAlgo
-from .isochrones.isochrones_layer_pedestrian import ValhallaIsochronesPedestrianAlgo
-from .matrix.matrix_auto import ValhallaMatrixCarAlgo
-from .matrix.matrix_truck import ValhallaMatrixTruckAlgo
-from .matrix.matrix_bicycle import ValhallaMatrixBicycleAlgo
-from .matrix.matrix_pedestrian import ValhallaMatrixPedestrianAlgo
+from .. import IMG_DIR, PLUGIN_NAME, __version__
 
 
 class ValhallaProvider(QgsProcessingProvider):
@@ -55,30 +37,6 @@ class ValhallaProvider(QgsProcessingProvider):
     def __init__(self):
         QgsProcessingProvider.__init__(self)
 
-        # Load algorithms
-        self.alglist = [
-            ValhallaRouteLinesCarAlgo(),
-            ValhallaRouteLinesTruckAlgo(),
-            ValhallaRouteLinesBicycleAlgo(),
-            ValhallaRouteLinesPedestrianAlgo(),
-            ValhallaRoutePointsLayerCarAlgo(),
-            ValhallaRoutePointsLayerBicycleAlgo(),
-            ValhallaRoutePointsLayerPedestrianAlgo(),
-            ValhallaRoutePointsLayerTruckAlgo(),
-            ValhallaRoutePointsLayersCarAlgo(),
-            ValhallaRoutePointsLayersTruckAlgo(),
-            ValhallaRoutePointsLayersBicycleAlgo(),
-            ValhallaRoutePointsLayersPedestrianAlgo(),
-            ValhallaIsochronesCarAlgo(),
-            ValhallaIsochronesTruckAlgo(),
-            ValhallaIsochronesBicycleAlgo(),
-            ValhallaIsochronesPedestrianAlgo(),
-            ValhallaMatrixCarAlgo(),
-            ValhallaMatrixTruckAlgo(),
-            ValhallaMatrixBicycleAlgo(),
-            ValhallaMatrixPedestrianAlgo(),
-        ]
-
     def unload(self):
         """
         Unloads the provider. Any tear-down steps required by the provider
@@ -88,13 +46,57 @@ class ValhallaProvider(QgsProcessingProvider):
 
     def loadAlgorithms(self):
         """
-        Loads all algorithms belonging to this provider.
+        Loads all algorithms belonging to this provider. The algorithm modules
+        are only imported now, QGIS takes ownership of the instances and asks
+        for new ones whenever the provider is refreshed.
         """
-        for alg in self.alglist:
-            self.addAlgorithm(alg)
+        from .directions_lines.directions_lines_auto import ValhallaRouteLinesCarAlgo
+        from .directions_lines.directions_lines_truck import ValhallaRouteLinesTruckAlgo
+        from .directions_lines.directions_lines_bicycle import ValhallaRouteLinesBicycleAlgo
+        from .directions_lines.directions_lines_pedestrian import ValhallaRouteLinesPedestrianAlgo
+        from .directions_point_layer.directions_points_layer_auto import ValhallaRoutePointsLayerCarAlgo
+        from .directions_point_layer.directions_points_layer_truck import ValhallaRoutePointsLayerTruckAlgo
+        from .directions_point_layer.directions_points_layer_bicycle import ValhallaRoutePointsLayerBicycleAlgo
+        from .directions_point_layer.directions_points_layer_pedestrian import ValhallaRoutePointsLayerPedestrianAlgo
+        from .directions_points_layers.directions_points_layers_auto import ValhallaRoutePointsLayersCarAlgo
+        from .directions_points_layers.directions_points_layers_truck import ValhallaRoutePointsLayersTruckAlgo
+        from .directions_points_layers.directions_points_layers_bicycle import ValhallaRoutePointsLayersBicycleAlgo
+        from .directions_points_layers.directions_points_layers_pedestrian import ValhallaRoutePointsLayersPedestrianAlgo
+        from .isochrones.isochrones_layer_auto import ValhallaIsochronesCarAlgo
+        from .isochrones.isochrones_layer_truck import ValhallaIsochronesTruckAlgo
+        from .isochrones.isochrones_layer_bicycle import ValhallaIsochronesBicycleAlgo
+        from .isochrones.isochrones_layer_pedestrian import ValhallaIsochronesPedestrianAlgo
+        from .matrix.matrix_auto import ValhallaMatrixCarAlgo
+        from .matrix.matrix_truck import ValhallaMatrixTruckAlgo
+        from .matrix.matrix_bicycle import ValhallaMatrixBicycleAlgo
+        from .matrix.matrix_pedestrian import ValhallaMatrixPedestrianAlgo
+
+        for alg in (
+            ValhallaRouteLinesCarAlgo,
+            ValhallaRouteLinesTruckAlgo,
+            ValhallaRouteLinesBicycleAlgo,
+            ValhallaRouteLinesPedestrianAlgo,
+            ValhallaRoutePointsLayerCarAlgo,
+            ValhallaRoutePointsLayerBicycleAlgo,
+            ValhallaRoutePointsLayerPedestrianAlgo,
+            ValhallaRoutePointsLayerTruckAlgo,
+            ValhallaRoutePointsLayersCarAlgo,
+            ValhallaRoutePointsLayersTruckAlgo,
+            ValhallaRoutePointsLayersBicycleAlgo,
+            ValhallaRoutePointsLayersPedestrianAlgo,
+            ValhallaIsochronesCarAlgo,
+            ValhallaIsochronesTruckAlgo,
+            ValhallaIsochronesBicycleAlgo,
+            ValhallaIsochronesPedestrianAlgo,
+            ValhallaMatrixCarAlgo,
+            ValhallaMatrixTruckAlgo,
+            ValhallaMatrixBicycleAlgo,
+            ValhallaMatrixPedestrianAlgo,
+        ):
+            self.addAlgorithm(alg())
 
     def icon(self):
-        return QIcon(RESOURCE_PREFIX + 'icon_valhalla.png')
+        return QIcon(os.path.join(IMG_DIR, 'icon_valhalla.png'))
 
     def id(self):
         """
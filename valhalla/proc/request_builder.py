@@ -31,7 +31,7 @@ from ..utils import transform
 from ..common import TRUCK_COSTING
 from .costing_params import CostingAuto
 
-def get_directions_params(points, profile, costing_options, mode):
+def get_directions_params(points, profile, costing_options, mode, costing_params=None):
     """
     Get the full list of parameters except for avoiding points.
 
@@ -47,6 +47,10 @@ def get_directions_params(points, profile, costing_options, mode):
     :param mode: fastest or shortest
     :type mode: str
 
+    :param costing_params: costing_options parameter value built once per run, e.g. with
+        get_costing_options() and codec.freeze(). Built from costing_options if None.
+    :type costing_params: dict
+
     :returns: dict of Vahalla directions parameters
     :rtype: dict
     """
@@ -56,7 +60,8 @@ def get_directions_params(points, profile, costing_options, mode):
     )
     params['locations'] = get_locations(points)
 
-    costing_params = get_costing_options(costing_options, profile, mode)
+    if costing_params is None:
+        costing_params = get_costing_options(costing_options, profile, mode)
 
     if costing_params:
         params['costing_options'] = costing_params
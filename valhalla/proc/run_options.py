@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+                                 Valhalla - QGIS plugin
+ QGIS client to query Valhalla APIs
+                              -------------------
+        begin                : 2019-10-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by Nils Nolde
+        email                : nils@gis-ops.com
+ ***************************************************************************/
+
+ This plugin provides access to some of the APIs from Valhalla
+ (https://github.com/valhalla/valhalla), developed and
+ maintained by https://gis-ops.com, Berlin, Germany.
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from contextlib import contextmanager
+import os
+
+from qgis.core import (QgsProcessingParameterBoolean,
+                       QgsProcessingParameterEnum,
+                       QgsProcessingParameterFeatureSink,
+                       QgsProcessingParameterFile,
+                       QgsProcessingParameterFileDestination,
+                       QgsProcessingParameterNumber,
+                       QgsProcessingUtils)
+
+from . import journal, scheduling
+from .estimate import Estimate
+from .pipeline import Pipeline
+from ..common import metrics, process_pool, timing
+from ..utils import profiling
+
+
+class RUN_OPTIONS:
+    REQUEST_ORDER = 'request_order'
+    GROUP_BY_COST = 'group_by_cost'
+    KEEP_ORDER = 'keep_order'
+    CONCURRENCY = 'concurrent_requests'
+    PROCESSES = 'conversion_processes'
+    JOURNAL = 'journal'
+    RESUME = 'resume'
+    INCREMENTAL = 'incremental'
+    ESTIMATE = 'estimate_only'
+    ESTIMATE_SAMPLE = 'estimate_sample'
+    METRICS_FILE = 'metrics_file'
+    METRICS_INTERVAL = 'metrics_interval'
+    STAGE_TIMINGS = 'stage_timings'
+    PROFILE = 'profile_run'
+
+
+class RunOptions:
+    """Advanced parameters of all algorithms which control how the requests are run."""
+
+    REQUEST_ORDERS = [
+        ('Feature ID', scheduling.FEATURE_ID),
+        ('Hilbert curve', scheduling.HILBERT),
+        ('Z-order curve', scheduling.ZORDER)
+    ]
+
+    def set_run_options(self, proc_algo, parameters, context):
+        """
+        Sets the run options from the Processing algo params.
+
+        :param proc_algo: Processing algorithm instance
+        :type proc_algo: QgsProcessingAlgorithm
+        """
+        self.request_order = self.REQUEST_ORDERS[
+            proc_algo.parameterAsEnum(parameters, RUN_OPTIONS.REQUEST_ORDER, context)
+        ][1]
+        self.group_by_cost = proc_algo.parameterAsBool(parameters, RUN_OPTIONS.GROUP_BY_COST, context)
+        self.keep_order = proc_algo.parameterAsBool(parameters, RUN_OPTIONS.KEEP_ORDER, context)
+        self.concurrency = max(proc_algo.parameterAsInt(parameters, RUN_OPTIONS.CONCURRENCY, context), 1)
+        processes = proc_algo.parameterAsInt(parameters, RUN_OPTIONS.PROCESSES, context)
+        # Responses are converted in the calling thread without worker processes
+        self.executor = process_pool.get_executor(processes) if processes > 0 else None
+        self.journal_path = proc_algo.parameterAsFile(parameters, RUN_OPTIONS.JOURNAL, context)
+        self.resume = proc_algo.parameterAsBool(parameters, RUN_OPTIONS.RESUME, context)
+        self.incremental = proc_algo.parameterAsBool(parameters, RUN_OPTIONS.INCREMENTAL, context)
+        self.estimate_only = proc_algo.parameterAsBool(parameters, RUN_OPTIONS.ESTIMATE, context)
+        self.estimate_sample = proc_algo.parameterAsInt(parameters, RUN_OPTIONS.ESTIMATE_SAMPLE, context)
+        self.metrics_path = proc_algo.parameterAsFileOutput(parameters, RUN_OPTIONS.METRICS_FILE, context)
+        self.metrics_interval = proc_algo.parameterAsInt(parameters, RUN_OPTIONS.METRICS_INTERVAL, context)
+        # Stage timers of this run, only seen by the algorithm's thread and its pipeline
+        self.timers = timing.activate(
+            proc_algo.parameterAsBool(parameters, RUN_OPTIONS.STAGE_TIMINGS, context) and not self.estimate_only
+        )
+
+    @staticmethod
+    @contextmanager
+    def profile(proc_algo, parameters, context, feedback):
+        """
+        Profiles the run with cProfile and tracemalloc if "Profile this run"
+        is set, see profiling.Profiler. The reports are written next to the
+        output, or to the processing temp folder for temporary outputs.
+
+        :param proc_algo: Processing algorithm instance
+        :type proc_algo: QgsProcessingAlgorithm
+        """
+        if not proc_algo.parameterAsBool(parameters, RUN_OPTIONS.PROFILE, context):
+            yield
+            return
+
+        directory = QgsProcessingUtils.tempFolder()
+        for definition in proc_algo.destinationParameterDefinitions():
+            if isinstance(definition, QgsProcessingParameterFeatureSink):
+                # Layer URIs can carry options after a pipe, temporary outputs aren't paths
+                path = proc_algo.parameterAsOutputLayer(parameters, definition.name(), context).split('|')[0]
+                if os.path.isabs(path):
+                    directory = os.path.dirname(path)
+                    break
+
+        profiler = profiling.Profiler(directory, proc_algo.name())
+        try:
+            with profiler:
+                yield
+        finally:
+            for path in profiler.paths:
+                feedback.pushInfo("Profile written to {}".format(path))
+
+    def open_journal(self, **parts):
+        """
+        Opens the checkpoint journal of the run, see journal.Journal.
+
+        :param parts: everything the outputs depend on besides the request locations
+        :type parts: any
+
+        :returns: the journal, None if the run isn't journaled
+        :rtype: journal.Journal
+        """
+        return journal.open_journal(
+            self.journal_path,
+            journal.signature(**parts),
+            self.resume or self.incremental,
+            prune=self.incremental,
+            # An estimate must leave the journal as it is
+            read_only=self.estimate_only
+        )
+
+    def get_estimate(self, clnt, url):
+        """
+        :param clnt: client of the run
+        :type clnt: Client
+
+        :param url: endpoint of the requests
+        :type url: str
+
+        :returns: the estimate to report instead of running, None for a normal run
+        :rtype: estimate.Estimate
+        """
+        if not self.estimate_only:
+            return None
+
+        return Estimate(clnt, url, self.estimate_sample, self.concurrency)
+
+    def get_metrics_reporter(self, clnt, feedback):
+        """
+        :param clnt: client of the run
+        :type clnt: Client
+
+        :param feedback: algorithm's feedback
+        :type feedback: QgsProcessingFeedback
+
+        :returns: reporter of the client's request metrics, see metrics.Reporter
+        :rtype: metrics.Reporter
+        """
+        # An interval of 0 only reports at the end of the run
+        every = self.metrics_interval or float('inf')
+
+        return metrics.Reporter(clnt.metrics, feedback, self.metrics_path, every)
+
+    def report_timings(self, feedback, clnt, features):
+        """
+        Stops the stage timers and logs the stage breakdown, if the run is timed.
+
+        :param feedback: algorithm's feedback
+        :type feedback: QgsProcessingFeedback
+
+        :param clnt: client of the run
+        :type clnt: Client
+
+        :param features: input features of the run
+        :type features: int
+        """
+        if self.timers is None:
+            return
+        timing.deactivate(self.timers)
+        requests = sum(row['requests'] for row in clnt.metrics.snapshot())
+        for line in self.timers.summary(features, requests):
+            feedback.pushInfo(line)
+
+    def order_requests(self, requests, locations):
+        """
+        Orders the requests as configured, see scheduling.order_requests().
+
+        :returns: (input index, request) tuples in the order to send them
+        :rtype: list of tuple
+        """
+        return scheduling.order_requests(requests, self.request_order, locations, self.group_by_cost)
+
+    def get_output_buffer(self, emit):
+        """
+        :param emit: function writing the output of a request
+        :type emit: function
+
+        :rtype: scheduling.ReorderBuffer
+        """
+        return scheduling.ReorderBuffer(timing.timed(timing.WRITE, emit), self.keep_order)
+
+    def get_pipeline(self, stages):
+        """
+        Builds the pipeline to run the requests with. With a single concurrent
+        request everything runs in the calling thread, one request after the other.
+
+        :param stages: stages of the pipeline
+        :type stages: list of pipeline.Stage
+
+        :rtype: pipeline.Pipeline
+        """
+        return Pipeline(stages, queue_size=2 * self.concurrency, threaded=self.concurrency > 1)
+
+    @staticmethod
+    def get_run_params():
+        """
+        Returns the processing algo definition for the run parameters.
+
+        :return: list of processing parameter definitions
+        :rtype: list of any
+        """
+        params = []
+
+        params.append(
+            QgsProcessingParameterEnum(
+                name=RUN_OPTIONS.REQUEST_ORDER,
+                description="Request order (space filling curves keep consecutive requests close to each other)",
+                options=[name for name, _ in RunOptions.REQUEST_ORDERS],
+                defaultValue=0
+            )
+        )
+
+        params.append(
+            QgsProcessingParameterBoolean(
+                name=RUN_OPTIONS.GROUP_BY_COST,
+                description="Send requests of similar estimated cost together",
+                defaultValue=False
+            )
+        )
+
+        params.append(
+            QgsProcessingParameterBoolean(
+                name=RUN_OPTIONS.KEEP_ORDER,
+                description="Write output in input order",
+                defaultValue=True
+            )
+        )
+
+        params.append(
+            QgsProcessingParameterNumber(
+                name=RUN_OPTIONS.CONCURRENCY,
+                description="Concurrent requests",
+                type=QgsProcessingParameterNumber.Integer,
+                minValue=1,
+                maxValue=32,
+                defaultValue=1
+            )
+        )
+
+        params.append(
+            QgsProcessingParameterNumber(
+                name=RUN_OPTIONS.PROCESSES,
+                description="Worker processes to convert responses in (0 converts in QGIS)",
+                type=QgsProcessingParameterNumber.Integer,
+                minValue=0,
+                maxValue=64,
+                defaultValue=0
+            )
+        )
+
+        # An input rather than a destination, so a resumed run can pick an existing journal or name a new one
+        params.append(
+            QgsProcessingParameterFile(
+                name=RUN_OPTIONS.JOURNAL,
+                description="Checkpoint journal of finished requests",
+                behavior=QgsProcessingParameterFile.File,
+                fileFilter="SQLite files (*.sqlite)",
+                optional=True
+            )
+        )
+
+        params.append(
+            QgsProcessingParameterBoolean(
+                name=RUN_OPTIONS.RESUME,
+                description="Resume the run recorded in the journal",
+                defaultValue=False
+            )
+        )
+
+        params.append(
+            QgsProcessingParameterBoolean(
+                name=RUN_OPTIONS.INCREMENTAL,
+                description="Incremental: only request new or changed features, reuse the journal's other outputs",
+                defaultValue=False
+            )
+        )
+
+        params.append(
+            QgsProcessingParameterBoolean(
+                name=RUN_OPTIONS.ESTIMATE,
+                description="Estimate only: report the requests and the projected runtime without running",
+                defaultValue=False
+            )
+        )
+
+        params.append(
+            QgsProcessingParameterNumber(
+                name=RUN_OPTIONS.ESTIMATE_SAMPLE,
+                description="Sample requests to measure the latency for the estimate",
+                type=QgsProcessingParameterNumber.Integer,
+                minValue=0,
+                maxValue=100,
+                defaultValue=5
+            )
+        )
+
+        params.append(
+            QgsProcessingParameterFileDestination(
+                name=RUN_OPTIONS.METRICS_FILE,
+                description="Request metrics per endpoint",
+                fileFilter="JSON files (*.json);;CSV files (*.csv)",
+                optional=True,
+                createByDefault=False
+            )
+        )
+
+        params.append(
+            QgsProcessingParameterNumber(
+                name=RUN_OPTIONS.METRICS_INTERVAL,
+                description="Seconds between request metrics in the log (0 only logs them at the end)",
+                type=QgsProcessingParameterNumber.Integer,
+                minValue=0,
+                maxValue=3600,
+                defaultValue=60
+            )
+        )
+
+        params.append(
+            QgsProcessingParameterBoolean(
+                name=RUN_OPTIONS.STAGE_TIMINGS,
+                description="Log the time spent in each stage of the run",
+                defaultValue=False
+            )
+        )
+
+        params.append(
+            QgsProcessingParameterBoolean(
+                name=RUN_OPTIONS.PROFILE,
+                description="Profile this run (CPU profile and memory allocations next to the output)",
+                defaultValue=False
+            )
+        )
+
+        return params
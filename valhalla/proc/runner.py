@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+                                 Valhalla - QGIS plugin
+ QGIS client to query Valhalla APIs
+                              -------------------
+        begin                : 2019-10-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by Nils Nolde
+        email                : nils@gis-ops.com
+ ***************************************************************************/
+
+ This plugin provides access to some of the APIs from Valhalla
+ (https://github.com/valhalla/valhalla), developed and
+ maintained by https://gis-ops.com, Berlin, Germany.
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+
+from . import scheduling
+from .pipeline import Stage
+from ..common import timing
+from ..utils import exceptions, logger
+
+
+class BatchRun:
+    """
+    Runs the requests of a batch algorithm: sends them through the pipeline,
+    writes their outputs in the configured order, records them in the
+    checkpoint journal and reports progress, request metrics and stage
+    timings. The algorithms plan the requests and build their outputs.
+
+    Used as a context manager around the algorithm's run, which closes the
+    journal and reports the run at the end.
+    """
+
+    def __init__(self, run_options, clnt, feedback, url):
+        """
+        :param run_options: options of the run, see RunOptions.set_run_options()
+        :type run_options: RunOptions
+
+        :param clnt: client sending the requests
+        :type clnt: Client
+
+        :param feedback: algorithm's feedback
+        :type feedback: QgsProcessingFeedback
+
+        :param url: endpoint of the requests, e.g. '/route'
+        :type url: str
+        """
+        self.run_options = run_options
+        self.clnt = clnt
+        self.feedback = feedback
+        self.url = url
+        # Input features of the run, for the progress and the stage timings
+        self.features = 0
+        self.done = 0
+        self.journal = None
+        self.reporter = run_options.get_metrics_reporter(clnt, feedback)
+        # Requests are only planned and reported, see Estimate
+        self.estimate = run_options.get_estimate(clnt, url)
+        self._buffers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.finish(failed=exc_type is not None)
+
+        return False
+
+    def open_journal(self, **parts):
+        """
+        Opens the checkpoint journal, see RunOptions.open_journal().
+
+        :returns: the journal, None if the run isn't journaled
+        :rtype: journal.Journal
+        """
+        self.journal = self.run_options.open_journal(**parts)
+
+        return self.journal
+
+    def output_buffer(self, emit):
+        """
+        :param emit: function writing the output of a request
+        :type emit: function
+
+        :rtype: scheduling.ReorderBuffer
+        """
+        output = self.run_options.get_output_buffer(emit)
+        self._buffers.append(output)
+
+        return output
+
+    def advance(self, features):
+        """
+        Counts finished input features for the progress.
+
+        :param features: number of input features
+        :type features: int
+        """
+        self.done += features
+        if self.features:
+            self.feedback.setProgress(int(100.0 * self.done / self.features))
+
+    def results(self, items, fn, describe):
+        """
+        Generator to run the requests of the items through the pipeline. The
+        items are read while the pipeline pulls them. A request failing with
+        an ApiError is reported and returned with its error, other errors
+        stop the run.
+
+        :param items: one item per request
+        :type items: iterable
+
+        :param fn: function sending the request of an item and returning its output
+        :type fn: function
+
+        :param describe: function naming the input features of an item in
+            error messages, e.g. "Feature ID 3"
+        :type describe: function
+
+        :returns: (item, output, error) tuples, output is None for a failed request
+        :rtype: tuple
+        """
+        stage = Stage(self.url.strip('/'), lambda item: (item, fn(item)), self.run_options.concurrency)
+        for result in self.run_options.get_pipeline([stage]).run(items, self.feedback.isCanceled):
+            # Stop the algorithm if cancel button has been clicked
+            if self.feedback.isCanceled():
+                break
+
+            e = result.error
+            if e is None:
+                item, output = result.value
+                yield item, output, None
+            elif isinstance(e, exceptions.ApiError):
+                msg = "{} caused a {}:\n{}".format(
+                    describe(result.value),
+                    e.__class__.__name__,
+                    str(e))
+                self.feedback.reportError(msg)
+                logger.log(msg, 2)
+                yield result.value, None, e
+            else:
+                if isinstance(e, (exceptions.InvalidKey, exceptions.GenericServerError)):
+                    msg = "{}:\n{}".format(
+                        e.__class__.__name__,
+                        str(e))
+                    logger.log(msg, 2)
+                raise e
+
+            if self.journal is not None:
+                self.journal.report(self.feedback)
+            self.reporter.report()
+
+    def run(self, requests, build, send, sinks, describe, key=()):
+        """
+        Sends the distinct requests of the run and writes their outputs. The
+        requests are ordered and looked up in the journal up front, their
+        bodies are only built when the pipeline pulls them.
+
+        :param requests: (location key, ID values) tuples of the distinct
+            requests in input order, see planning.group_requests()
+        :type requests: list of tuple
+
+        :param build: function building the body of a request
+        :type build: function
+
+        :param send: function sending a request with its body, returning the
+            outputs as (output layer number, features) tuples. Runs in the
+            pipeline's threads.
+        :type send: function
+
+        :param sinks: output layers by number, sinks or data providers
+        :type sinks: list
+
+        :param describe: function naming the input features of a request in error messages
+        :type describe: function
+
+        :param key: journal key parts telling requests of the same locations
+            apart, e.g. the metric of isochrones
+        :type key: tuple
+        """
+        ordered = self.run_options.order_requests(requests, lambda request: request[0])
+        # Locations and IDs, a changed ID changes the outputs as well
+        request_key = lambda request: list(key) + [request[0], request[1]]
+        replayed = []
+        if self.journal is not None:
+            ordered, replayed = self.journal.resume(ordered, request_key)
+            if replayed:
+                self.feedback.pushInfo("Resuming: {} requests were finished earlier".format(len(replayed)))
+
+        if self.estimate is not None:
+            self.estimate.add_journaled(len(replayed))
+            for _, request in ordered:
+                self.estimate.add(build(request))
+            return
+
+        output = self.output_buffer(lambda outputs: [sinks[layer].addFeatures(feats) for layer, feats in outputs])
+        for index, outputs in replayed:
+            output.add(index, outputs)
+            self.advance(len(requests[index][1]))
+
+        def send_request(item):
+            _, request = item
+            with timing.stage(timing.BUILD_REQUEST):
+                body = build(request)
+
+            return send(request, body)
+
+        for (index, request), outputs, error in self.results(ordered, send_request, lambda item: describe(item[1])):
+            if error is not None:
+                output.skip(index)
+            else:
+                output.add(index, outputs)
+            if self.journal is not None:
+                self.journal.record(request_key(request), outputs)
+            self.advance(len(request[1]))
+
+        output.flush()
+
+    def finish(self, failed=False):
+        """
+        Closes the journal and reports the run, or the estimate instead. The
+        request metrics are reported and written even if the run failed.
+
+        :param failed: whether the run stopped with an error
+        :type failed: bool
+        """
+        try:
+            if self.journal is not None:
+                # The finished requests stay recorded for a resumed run
+                self.journal.close(completed=not failed and not self.feedback.isCanceled())
+            if failed:
+                return
+            if self.estimate is not None:
+                self.estimate.report(self.feedback)
+                return
+
+            if any(output.reordered for output in self._buffers):
+                self.feedback.pushInfo(
+                    "More than {} outputs waited for earlier ones, parts of the output aren't in input order".format(
+                        scheduling.MAX_PENDING
+                    )
+                )
+            self.feedback.pushInfo(self.clnt.bytes.summary())
+        finally:
+            if self.estimate is None:
+                self.reporter.finish()
+            # A failed run mustn't leave its timers running in this thread
+            timing.deactivate(self.run_options.timers)
+        self.run_options.report_timings(self.feedback, self.clnt, self.features)
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+                                 Valhalla - QGIS plugin
+ QGIS client to query Valhalla APIs
+                              -------------------
+        begin                : 2019-10-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by Nils Nolde
+        email                : nils@gis-ops.com
+ ***************************************************************************/
+
+ This plugin provides access to some of the APIs from Valhalla
+ (https://github.com/valhalla/valhalla), developed and
+ maintained by https://gis-ops.com, Berlin, Germany.
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from math import asin, cos, log2, radians, sin, sqrt
+
+FEATURE_ID = 'feature_id'
+HILBERT = 'hilbert'
+ZORDER = 'zorder'
+
+# Cells per axis of the space filling curves, about 600 m at the equator
+_CURVE_BITS = 16
+_CURVE_SIZE = 1 << _CURVE_BITS
+
+# Outputs a ReorderBuffer holds back at most
+MAX_PENDING = 1000
+
+
+def _grid_cell(location):
+    """Scales a (lon, lat) tuple to integer cell coordinates of the curve grid."""
+    x = int((min(max(location[0], -180), 180) + 180) / 360 * (_CURVE_SIZE - 1))
+    y = int((min(max(location[1], -90), 90) + 90) / 180 * (_CURVE_SIZE - 1))
+
+    return x, y
+
+
+def hilbert_index(location):
+    """
+    Position of a location along a Hilbert curve covering the world.
+
+    :param location: longitude and latitude
+    :type location: tuple of float
+
+    :rtype: int
+    """
+    x, y = _grid_cell(location)
+    index = 0
+    s = _CURVE_SIZE >> 1
+    while s:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        index += s * s * ((3 * rx) ^ ry)
+        # Rotate the quadrant, so the curve stays continuous
+        if not ry:
+            if rx:
+                x = _CURVE_SIZE - 1 - x
+                y = _CURVE_SIZE - 1 - y
+            x, y = y, x
+        s >>= 1
+
+    return index
+
+
+def zorder_index(location):
+    """
+    Position of a location along a Z-order (Morton) curve covering the world.
+
+    :param location: longitude and latitude
+    :type location: tuple of float
+
+    :rtype: int
+    """
+    x, y = _grid_cell(location)
+    index = 0
+    for bit in range(_CURVE_BITS):
+        index |= ((x >> bit) & 1) << (2 * bit) | ((y >> bit) & 1) << (2 * bit + 1)
+
+    return index
+
+
+def estimate_cost(locations):
+    """
+    Estimates the cost of a request by the straight line distance along its
+    locations, 0 for single locations like isochrones.
+
+    :param locations: (lon, lat) tuples of the request
+    :type locations: tuple of tuple
+
+    :returns: distance in km
+    :rtype: float
+    """
+    distance = 0
+    for (lon1, lat1), (lon2, lat2) in zip(locations, locations[1:]):
+        dlat = radians(lat2 - lat1)
+        dlon = radians(lon2 - lon1)
+        a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
+        distance += 12742 * asin(sqrt(a))
+
+    return distance
+
+
+def order_requests(requests, strategy, locations, group_by_cost=False):
+    """
+    Orders requests along a space filling curve through their first location,
+    so consecutive requests hit the same tiles on the server.
+
+    :param requests: requests in input order
+    :type requests: list
+
+    :param strategy: FEATURE_ID keeps the input order, HILBERT or ZORDER
+    :type strategy: str
+
+    :param locations: function returning the (lon, lat) tuples of a request, e.g. its planning.location_key()
+    :type locations: function
+
+    :param group_by_cost: whether to order by estimated cost first, so requests of
+        similar cost are sent together. Cost classes double in distance.
+    :type group_by_cost: bool
+
+    :returns: (input index, request) tuples in the order to send them
+    :rtype: list of tuple
+    """
+    indexed = list(enumerate(requests))
+    if strategy == FEATURE_ID and not group_by_cost:
+        return indexed
+
+    curve = {HILBERT: hilbert_index, ZORDER: zorder_index}.get(strategy)
+
+    def sort_key(item):
+        request_locations = locations(item[1])
+        key = []
+        if group_by_cost:
+            key.append(int(log2(1 + estimate_cost(request_locations))))
+        if curve:
+            key.append(curve(request_locations[0]))
+        key.append(item[0])
+
+        return key
+
+    return sorted(indexed, key=sort_key)
+
+
+class ReorderBuffer:
+    """
+    Writes outputs in input order, although requests were sent in another
+    order. Outputs are held back until all outputs before them arrived.
+
+    Requests ordered along a curve can arrive in any input order, so waiting
+    for the next output could hold back nearly all outputs of a run. At most
+    max_pending outputs are held back, beyond that the oldest of them are
+    written early and the outputs they were waiting for are written as soon
+    as they arrive. The input order is then only kept within that window.
+    """
+
+    def __init__(self, emit, keep_order=True, max_pending=MAX_PENDING):
+        """
+        :param emit: function writing an output
+        :type emit: function
+
+        :param keep_order: whether to restore the input order, otherwise outputs are written right away
+        :type keep_order: bool
+
+        :param max_pending: outputs held back at most
+        :type max_pending: int
+        """
+        self.emit = emit
+        self.keep_order = keep_order
+        self.max_pending = max(max_pending, 1)
+        # Times the buffer stopped waiting for missing outputs
+        self.reordered = 0
+        self._next = 0
+        self._pending = dict()
+
+    def add(self, index, output):
+        """
+        :param index: input index of the request
+        :type index: int
+
+        :param output: output of the request, None if it failed
+        :type output: any
+        """
+        if not self.keep_order or index < self._next:
+            # An output the buffer stopped waiting for is written as soon as it arrives
+            if output is not None:
+                self.emit(output)
+            return
+
+        self._pending[index] = output
+        self._drain()
+        if len(self._pending) > self.max_pending:
+            # Stop waiting for the missing outputs before the oldest held back one
+            self.reordered += 1
+            self._next = min(self._pending)
+            self._drain()
+
+    def _drain(self):
+        while self._next in self._pending:
+            output = self._pending.pop(self._next)
+            if output is not None:
+                self.emit(output)
+            self._next += 1
+
+    def skip(self, index):
+        """Marks a failed request, so later outputs aren't held back by it."""
+        self.add(index, None)
+
+    def flush(self):
+        """Writes the outputs still held back, e.g. after the run was cancelled."""
+        for index in sorted(self._pending):
+            if self._pending[index] is not None:
+                self.emit(self._pending[index])
+        self._pending.clear()
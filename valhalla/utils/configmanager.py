@@ -23,25 +23,109 @@
  *                                                                         *
  ***************************************************************************/
 """
+import copy
+import threading
 import yaml
 import os
 
 from PyQt5.QtWidgets import QMessageBox
 
 from .. import CONFIG_PATH
+from . import logger
+
+
+# Parsed config.yml and resolved providers, shared by the whole QGIS session
+# until the file changes
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _load():
+    """
+    Returns the cache entry for the current config.yml, parses it again only
+    if the file was modified.
+
+    :rtype: dict
+    """
+    global _cache
+    stat = os.stat(CONFIG_PATH)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        if _cache is None or _cache['signature'] != signature:
+            with open(CONFIG_PATH) as f:
+                _cache = dict(config=yaml.safe_load(f), signature=signature)
+
+        return _cache
 
 
 def read_config():
     """
-    Reads config.yml from file and returns the parsed dict.
+    Reads config.yml from file and returns the parsed dict. The file is only
+    parsed again if it changed, the returned dict is a copy which can be altered.
 
     :returns: Parsed settings dictionary.
     :rtype: dict
     """
-    with open(CONFIG_PATH) as f:
-        doc = yaml.safe_load(f)
+    return copy.deepcopy(_load()['config'])
+
 
-    return doc
+def invalidate():
+    """Drops the cached config, so the next access reads config.yml again."""
+    global _cache
+    with _cache_lock:
+        _cache = None
+
+
+def get_providers(config=None):
+    """
+    Returns all providers followed by the provider groups, which are resolved
+    to provider dicts with a "members" list of their providers.
+
+    Without config the providers of config.yml are returned, which are cached
+    and shared by all callers until the file changes, so they must not be altered.
+
+    :param config: Parsed settings dictionary, read from file if not passed.
+    :type config: dict
+
+    :returns: providers and provider groups
+    :rtype: list of dict
+    """
+    if config is None:
+        cache = _load()
+        providers = cache.get('providers')
+        if providers is None:
+            providers = cache['providers'] = _resolve_providers(cache['config'])
+        return providers
+
+    return _resolve_providers(config)
+
+
+def _resolve_providers(config):
+    providers = config['providers']
+    providers_by_name = {provider['name']: provider for provider in providers}
+
+    groups = []
+    for group in config.get('provider_groups') or []:
+        members = []
+        for member in group.get('members') or []:
+            if member not in providers_by_name:
+                logger.log("Provider group {}: unknown provider {}", 1, group['name'], member)
+                continue
+            members.append(dict(
+                providers_by_name[member],
+                weight=(group.get('weights') or {}).get(member, 1)
+            ))
+        if not members:
+            continue
+
+        # Settings of the first member apply, unless the group overrides them
+        resolved = dict(members[0])
+        resolved.pop('weight')
+        resolved.update(group)
+        resolved['members'] = members
+        groups.append(resolved)
+
+    return providers + groups
 
 
 def write_config(new_config):
@@ -53,3 +137,8 @@ def write_config(new_config):
     """
     with open(CONFIG_PATH, 'w') as f:
         yaml.safe_dump(new_config, f)
+
+    # The mtime might not change within the file system's resolution
+    invalidate()
+
+    logger.configure(new_config.get('logging'))
@@ -24,27 +24,162 @@
  ***************************************************************************/
 """
 
+import itertools
+import logging
+import os
+import threading
+from logging.handlers import RotatingFileHandler
+
 from qgis.core import QgsMessageLog, Qgis
 
-from .. import PLUGIN_NAME
+from .. import PLUGIN_NAME, BASE_DIR
+
+INFO = 0
+WARNING = 1
+CRITICAL = 2
+
+LEVELS = {
+    'info': INFO,
+    'warning': WARNING,
+    'critical': CRITICAL
+}
+
+_QGIS_LEVELS = {
+    INFO: Qgis.Info,
+    WARNING: Qgis.Warning,
+    CRITICAL: Qgis.Critical
+}
+
+_PYTHON_LEVELS = {
+    INFO: logging.INFO,
+    WARNING: logging.WARNING,
+    CRITICAL: logging.CRITICAL
+}
+
+
+class _Settings:
+    """Logging settings, read from the "logging" section of config.yml."""
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.level = LEVELS.get(str(config.get('level', 'info')).lower(), INFO)
+        self.request_sample = max(int(config.get('request_sample') or 1), 1)
+        self.max_length = int(config.get('max_length') or 0)
+        self.file_handler = None
+
+        path = config.get('file')
+        if path:
+            path = os.path.expanduser(path)
+            if not os.path.isabs(path):
+                path = os.path.join(BASE_DIR, path)
+            self.file_handler = RotatingFileHandler(
+                path,
+                maxBytes=int(config.get('max_bytes') or 10 * 1024 * 1024),
+                backupCount=int(config.get('backup_count') or 3),
+                encoding='utf-8',
+                delay=True
+            )
+            self.file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
 
-def log(message, level_in=0):
+
+_settings = None
+_settings_lock = threading.Lock()
+_request_counter = itertools.count()
+_file_logger = logging.getLogger('valhalla_qgis')
+_file_logger.propagate = False
+_file_logger.setLevel(logging.INFO)
+
+
+def configure(config=None):
+    """
+    Applies the logging settings.
+
+    :param config: "logging" section of config.yml with "level" (info, warning
+        or critical), "request_sample" (log only every n-th request), "max_length"
+        (truncate info messages) and "file", "max_bytes", "backup_count" for a
+        rotating log file.
+    :type config: dict
     """
-    Writes to QGIS inbuilt logger accessible through panel.
+    global _settings
+    settings = _Settings(config)
+    with _settings_lock:
+        if _settings is not None and _settings.file_handler:
+            _file_logger.removeHandler(_settings.file_handler)
+            _settings.file_handler.close()
+        if settings.file_handler:
+            _file_logger.addHandler(settings.file_handler)
+        _settings = settings
+
+
+def _get_settings():
+    if _settings is None:
+        # Imported here, the config manager logs with this module
+        from .configmanager import read_config
+        try:
+            config = read_config().get('logging')
+        except Exception:
+            config = None
+        configure(config)
+
+    return _settings
+
 
-    :param message: logging message to write, error or URL.
+def is_enabled(level_in=INFO):
+    """
+    Whether messages of a level are logged, to skip building expensive messages.
+
+    :param level_in: integer representation of logging level.
+    :type level_in: int
+
+    :rtype: bool
+    """
+    return level_in >= CRITICAL or level_in >= _get_settings().level
+
+
+def log(message, level_in=0, *args, per_request=False):
+    """
+    Writes to QGIS inbuilt logger accessible through panel and to the log
+    file, if configured. The message is only formatted with args if the
+    level is enabled, callables in args are only called then.
+
+    :param message: logging message to write, error or URL, with {} placeholders for args.
     :type message: str
 
     :param level_in: integer representation of logging level.
     :type level_in: int
+
+    :param args: values for the placeholders in message
+    :type args: any
+
+    :param per_request: whether the message is logged for every request,
+        these are subject to the "request_sample" setting.
+    :type per_request: bool
     """
-    if level_in == 0:
-        level = Qgis.Info
-    elif level_in == 1:
-        level = Qgis.Warning
-    elif level_in == 2:
-        level = Qgis.Critical
-    else:
-        level = Qgis.Info
-
-    QgsMessageLog.logMessage(message, PLUGIN_NAME.strip(), level)
\ No newline at end of file
+    settings = _get_settings()
+    # Errors are always logged in full
+    if level_in < CRITICAL:
+        if level_in < settings.level:
+            return
+        if per_request and next(_request_counter) % settings.request_sample:
+            return
+
+    if args:
+        message = message.format(*(_format_arg(arg, level_in, settings) for arg in args))
+    if level_in < WARNING and settings.max_length and len(message) > settings.max_length:
+        message = message[:settings.max_length] + "... (truncated)"
+
+    QgsMessageLog.logMessage(message, PLUGIN_NAME.strip(), _QGIS_LEVELS.get(level_in, Qgis.Info))
+    if settings.file_handler:
+        _file_logger.log(_PYTHON_LEVELS.get(level_in, logging.INFO), message)
+
+
+def _format_arg(arg, level_in, settings):
+    if callable(arg):
+        arg = arg()
+    if isinstance(arg, bytes):
+        # Only decode what will be shown of large request bodies
+        if level_in < WARNING and settings.max_length:
+            arg = arg[:settings.max_length + 1]
+        arg = arg.decode(errors='replace')
+
+    return arg
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+                                 Valhalla - QGIS plugin
+ QGIS client to query Valhalla APIs
+                              -------------------
+        begin                : 2019-10-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by Nils Nolde
+        email                : nils@gis-ops.com
+ ***************************************************************************/
+
+ This plugin provides access to some of the APIs from Valhalla
+ (https://github.com/valhalla/valhalla), developed and
+ maintained by https://gis-ops.com, Berlin, Germany.
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+
+import cProfile
+from datetime import datetime
+import os
+import tracemalloc
+
+from . import logger
+
+# Entries of the allocations report
+TOP_ALLOCATIONS = 30
+TOP_TRACEBACKS = 10
+# Frames kept per allocation, more show the callers but slow down tracing
+TRACEBACK_FRAMES = 10
+
+
+class Profiler:
+    """
+    Profiles a run with cProfile and traces its memory allocations with
+    tracemalloc. On exit, also when the run failed, the profile is written to
+    <name>_<timestamp>.pstats, to be opened with pstats or snakeviz, and the
+    top allocations to <name>_<timestamp>_allocations.txt.
+
+    cProfile only sees the thread it was started in, i.e. not the worker
+    threads of concurrent requests.
+    """
+
+    def __init__(self, directory, name):
+        """
+        :param directory: directory to write the reports to
+        :type directory: str
+
+        :param name: prefix of the report file names, e.g. the algorithm name
+        :type name: str
+        """
+        prefix = os.path.join(directory, "{}_{}".format(name, datetime.now().strftime('%Y%m%d_%H%M%S')))
+        self.stats_path = prefix + '.pstats'
+        self.allocations_path = prefix + '_allocations.txt'
+
+        self._profile = None
+        self._started_tracing = False
+
+    def __enter__(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEBACK_FRAMES)
+            self._started_tracing = True
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            self._profile = profile
+        except ValueError as e:
+            # Another profiler is active already, e.g. from a debugger
+            logger.log("Profiling isn't possible: {}", 1, e)
+
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(self.stats_path)
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        if self._started_tracing:
+            tracemalloc.stop()
+        write_allocations(snapshot, peak, self.allocations_path)
+
+    @property
+    def paths(self):
+        """
+        :returns: the reports which were written
+        :rtype: list of str
+        """
+        return [path for path in (self.stats_path, self.allocations_path) if os.path.exists(path)]
+
+
+def write_allocations(snapshot, peak, path):
+    """
+    Writes the allocations of a snapshot which are still alive, grouped by
+    source line and by call stack.
+
+    :param snapshot: tracemalloc snapshot
+    :type snapshot: tracemalloc.Snapshot
+
+    :param peak: peak traced memory in bytes
+    :type peak: int
+
+    :param path: report file path
+    :type path: str
+    """
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, cProfile.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ])
+    stats = snapshot.statistics('lineno')
+    with open(path, 'w') as f:
+        f.write("Peak traced memory: {:.1f} MB\n".format(peak / 1024 ** 2))
+        f.write("Live allocations: {:.1f} MB in {} blocks\n\n".format(
+            sum(stat.size for stat in stats) / 1024 ** 2,
+            sum(stat.count for stat in stats)
+        ))
+        f.write("Top {} allocations by source line:\n".format(TOP_ALLOCATIONS))
+        for stat in stats[:TOP_ALLOCATIONS]:
+            f.write("{:>10.1f} kB {:>9} blocks  {}\n".format(stat.size / 1024, stat.count, stat.traceback[0]))
+
+        f.write("\nTop {} allocations by call stack:\n".format(TOP_TRACEBACKS))
+        for stat in snapshot.statistics('traceback')[:TOP_TRACEBACKS]:
+            f.write("\n{:.1f} kB in {} blocks\n".format(stat.size / 1024, stat.count))
+            for line in stat.traceback.format(most_recent_first=True):
+                f.write(line + "\n")
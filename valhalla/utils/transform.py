@@ -29,6 +29,8 @@ from qgis.core import (QgsCoordinateReferenceSystem,
                        QgsProject
                        )
 
+from ..common import timing
+
 
 def transformToWGS(old_crs):
     """
@@ -37,10 +39,26 @@ def transformToWGS(old_crs):
     :param old_crs: CRS to transfrom from
     :type old_crs: QgsCoordinateReferenceSystem
 
-    :returns: transformer to use in various modules.
+    :returns: transformer to use in various modules, timed if stage timings are on.
     :rtype: QgsCoordinateTransform
     """
     outCrs = QgsCoordinateReferenceSystem('EPSG:4326')
     xformer = QgsCoordinateTransform(old_crs, outCrs, QgsProject.instance())
+    if timing.enabled():
+        return TimedTransform(xformer)
 
     return xformer
+
+
+class TimedTransform:
+    """Transformer which times its transforms as a stage of the running algorithm, see common.timing."""
+
+    def __init__(self, xformer):
+        self._xformer = xformer
+
+    def transform(self, *args, **kwargs):
+        with timing.stage(timing.TRANSFORM):
+            return self._xformer.transform(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._xformer, name)